@@ -1,15 +1,15 @@
 # Build a database-backed lookup from a SQL database.
 import mysql.connector
+import os
 import sys
 
 from datetime import datetime
 from loguru import logger
 from lookup.lmdb_lookup import LmdbLookup
+from lookup.parallel_build import load_lookup_parallel
 
-from lookup.lookup import Lookup
 
-
-def load_lookup(lookup: Lookup, username: str, password: str):
+def load_lookup(lookup: LmdbLookup, username: str, password: str, num_workers: int):
     """Load the database-backed lookup from another SQL database."""
 
     conn = mysql.connector.connect(
@@ -19,43 +19,17 @@ def load_lookup(lookup: Lookup, username: str, password: str):
         password=password,
     )
 
-    cur = conn.cursor()
-    cur.execute("SELECT address_id, address_base_source_full FROM address")
+    # The cursor is unbuffered, so the rows are streamed from the server
+    cur = conn.cursor(buffered=False)
 
-    num_rows_processed = 0
     start_time = datetime.now()
-    start_time_batch = datetime.now()
-    batch_size = 10000
-
-    # Use a locally-generated entity ID
-    internal_entity_id = 0
-
-    while True:
-        result = cur.fetchone()
-        if result is None:
-            break
-
-        # External entity ID from the database
-        external_entity_id = str(result[0])
-
-        # Extract the tokens from the database row
-        tokens = [ri.replace(",", "").lower() for ri in result[1].split()]
 
-        # Add the entity to the lookup
-        lookup.add(internal_entity_id, external_entity_id, tokens)
-
-        if num_rows_processed % batch_size == 0:
-            end_time_batch = datetime.now()
-            time_diff = (end_time_batch - start_time_batch).total_seconds()
-            logger.info(
-                f"Processed {num_rows_processed} rows (batch of {batch_size} took {time_diff} seconds)"
-            )
-            start_time_batch = datetime.now()
-
-        num_rows_processed += 1
-        internal_entity_id += 1
-
-    logger.info(f"Processed {num_rows_processed} rows")
+    load_lookup_parallel(
+        lookup,
+        cur,
+        "SELECT address_id, address_base_source_full FROM address",
+        num_workers,
+    )
 
     # Close the connection to the database
     conn.close()
@@ -68,25 +42,32 @@ def load_lookup(lookup: Lookup, username: str, password: str):
 
 if __name__ == "__main__":
 
-    # Get the username and password from the command line arguments
-    if len(sys.argv) != 3:
-        print("Usage: {sys.argv[0]} <username> <password>")
+    # Get the username and password (and optionally the number of worker
+    # processes) from the command line arguments
+    if len(sys.argv) not in [3, 4]:
+        print(f"Usage: {sys.argv[0]} <username> <password> [<number of workers>]")
         exit()
 
     username = sys.argv[1]
     password = sys.argv[2]
+    num_workers = int(sys.argv[3]) if len(sys.argv) == 4 else (os.cpu_count() or 1)
 
     # Initialise the database-backed lookup for loading
     start_script = datetime.now()
 
     # Make the lookup
     lmdb_folder = "./data/lmdb"
-    sqlite_database = "./data/sqlite.db"
+    staging_folder = "./data/staging"
     token_to_count_filepath = "./data/token-to-count.pickle"
-    lookup = LmdbLookup(lmdb_folder, True, sqlite_database, token_to_count_filepath)
+    lookup = LmdbLookup(
+        lmdb_folder,
+        True,
+        token_count_filepath=token_to_count_filepath,
+        staging_folder=staging_folder,
+    )
 
     # Load the lookup
-    load_lookup(lookup, username, password)
+    load_lookup(lookup, username, password, num_workers)
 
     # Finalise the entries
     start_finalise = datetime.now()
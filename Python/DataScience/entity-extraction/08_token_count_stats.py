@@ -23,6 +23,15 @@ if __name__ == "__main__":
     most_frequent_tokens = list(df[df["count"] == max_count]["token"])
     print(f"Most frequent token(s) with count={max_count}: {most_frequent_tokens}")
 
+    # Number of tokens that would be stop tokens for a given stop token
+    # frequency (the STOP_TOKEN_FREQUENCY of the service)
+    for quantile in [0.99, 0.999, 0.9999]:
+        frequency = int(df["count"].quantile(quantile))
+        num_stop_tokens = int((df["count"] > frequency).sum())
+        print(
+            f"Stop token frequency={frequency} ({quantile} quantile): {num_stop_tokens} stop token(s)"
+        )
+
     # Plot a histogram of the counts
     plt.hist(df["count"])
     plt.xlabel("Number of entities")
@@ -2,27 +2,7 @@
 # an entity in order to generate test data for the extractor
 # and resolver.
 import random
-import string
-from nltk.tokenize import wordpunct_tokenize
-
-
-def tokenise_text(text: str) -> list[str]:
-    """Tokenise the text into tokens and make each token lowercase."""
-
-    assert type(text) == str and len(text) > 0
-
-    # Punctuation
-    punct = set(string.punctuation)
-
-    def only_punctuation(text: str) -> bool:
-        """Is the text composed of just punctuation?"""
-        return all([t in punct for t in text])
-
-    # Tokenise the lowercase version of the text
-    tokens = wordpunct_tokenize(text.lower())
-
-    # Remove tokens that are only punctuation
-    return [t for t in tokens if not only_punctuation(t)]
+from text.tokeniser import tokenise_text
 
 
 def mutate(tokens: list[str], min_tokens: int) -> list[str]:
@@ -0,0 +1,53 @@
+# Apply a delta of added and removed entities to a finalised lookup.
+import sys
+
+from datetime import datetime
+from loguru import logger
+from lookup.lmdb_lookup import LmdbLookup
+from lookup.parallel_build import tokenise_address
+
+
+def read_adds(filepath: str):
+    """Read the entities to add from a TSV file.
+
+    Each line is: <internal entity ID>\\t<external entity ID>\\t<text>
+    """
+
+    adds = []
+    with open(filepath, "r", encoding="utf-8") as fp:
+        for line in fp:
+            internal_entity_id, external_entity_id, text = line.rstrip("\n").split("\t")
+            adds.append(
+                (int(internal_entity_id), external_entity_id, tokenise_address(text))
+            )
+
+    return adds
+
+
+def read_removes(filepath: str):
+    """Read the internal IDs of the entities to remove (one per line)."""
+
+    with open(filepath, "r", encoding="utf-8") as fp:
+        return [int(line) for line in fp if len(line.strip()) > 0]
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) not in [2, 3]:
+        print(f"Usage: {sys.argv[0]} <adds TSV file> [<removes file>]")
+        exit()
+
+    adds = read_adds(sys.argv[1])
+    removes = read_removes(sys.argv[2]) if len(sys.argv) == 3 else []
+    logger.info(f"Entities to add: {len(adds)}, entities to remove: {len(removes)}")
+
+    start_time = datetime.now()
+
+    # The service picks up the new generation of the lookup without a restart
+    lookup = LmdbLookup("./data/lmdb", False, update_mode=True)
+    lookup.update(adds, removes)
+    lookup.close()
+
+    logger.info(
+        f"Time taken to update: {(datetime.now() - start_time).total_seconds()} seconds"
+    )
@@ -0,0 +1,79 @@
+# Benchmarks finding the most likely matches for synthetic sets of matches of
+# increasing size, comparing the interval sweep (most_likely_matches) with the
+# reference implementation (most_likely_matches_reference).
+import random
+import time
+
+from typing import List
+from entity.matcher import (
+    ProbabilisticMatch,
+    most_likely_matches,
+    most_likely_matches_reference,
+)
+from generator.generator import (
+    generate_entities,
+    make_generator_fns,
+    make_uniform_num_entity_tokens_generator,
+    random_entity_id,
+)
+
+
+def synthetic_matches(n_matches: int, n_text_tokens: int) -> List[ProbabilisticMatch]:
+    """Synthetic matches of generated entities at random positions in a text."""
+
+    assert type(n_matches) == int and n_matches > 0
+    assert type(n_text_tokens) == int and n_text_tokens > 0
+
+    # Generate the entities
+    _, entity_generator = make_generator_fns(
+        1000, 0.5, make_uniform_num_entity_tokens_generator(2, 6)
+    )
+    entities = generate_entities(500, entity_generator)
+
+    # Each match spans the number of tokens of its entity, with a probability
+    # to 1 decimal place so that some matches have the same probability
+    matches = []
+    for _ in range(n_matches):
+        entity_id = random_entity_id(entities)
+        start = random.randint(0, n_text_tokens - 1)
+        end = start + len(entities[entity_id]) - 1
+        probability = random.randint(5, 10) / 10
+        matches.append(ProbabilisticMatch(start, end, entity_id, probability))
+
+    return matches
+
+
+def time_fn(fn, matches: List[ProbabilisticMatch]) -> float:
+    """Time taken in seconds to find the most likely matches."""
+
+    start_time = time.perf_counter()
+    fn(matches)
+    return time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+
+    random.seed(1)
+
+    # The reference implementation is too slow for the larger sets
+    max_reference_matches = 8000
+
+    print(f"{'matches':>8} {'sweep (s)':>10} {'reference (s)':>14} {'speed-up':>9}")
+
+    for n_matches in [250, 500, 1000, 2000, 4000, 8000, 16000, 32000]:
+
+        # The matches are spread over a text with about 4 matches per token
+        matches = synthetic_matches(n_matches, max(1, n_matches // 4))
+        sweep_time = time_fn(most_likely_matches, matches)
+
+        if n_matches > max_reference_matches:
+            print(f"{n_matches:>8} {sweep_time:>10.4f} {'-':>14} {'-':>9}")
+            continue
+
+        # Check that the results are the same
+        assert most_likely_matches(matches) == most_likely_matches_reference(matches)
+
+        reference_time = time_fn(most_likely_matches_reference, matches)
+        print(
+            f"{n_matches:>8} {sweep_time:>10.4f} {reference_time:>14.4f} {reference_time / sweep_time:>9.1f}"
+        )
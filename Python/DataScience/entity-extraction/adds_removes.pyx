@@ -1,7 +1,19 @@
 # cython: language_level=3
 
+from libc.stdint cimport int64_t, uint32_t
 from typing import List, Tuple
 
+import numpy as np
+
+def is_isolated(pos, i: int, max_window: int) -> bool:
+    """Is the i-th position more than a window away from the others?"""
+
+    if i > 0 and pos[i] - pos[i - 1] + 1 <= max_window:
+        return False
+
+    return i == len(pos) - 1 or pos[i + 1] - pos[i] + 1 > max_window
+
+
 def adds_removes_from_positions(
     pos: List[int],
     n_entity_tokens: int,
@@ -14,8 +26,12 @@ def adds_removes_from_positions(
     result: List[Tuple[int, int, int, int]] = []
     if len(pos) == 0:
         return result
-    elif len(pos) == 1:
-        result.append((pos[0], pos[0], 0, n_entity_tokens-1))
+
+    # A token is a window on its own if no other token of the entity is within
+    # the maximum window (so it doesn't depend on the rest of the text)
+    for i in range(0, len(pos)):
+        if is_isolated(pos, i, max_window):
+            result.append((pos[i], pos[i], 0, n_entity_tokens-1))
 
     for i in range(0, len(pos) - 1):
         for j in range(i + 1, len(pos)):
@@ -40,3 +56,101 @@ def adds_removes_from_positions(
             result.append((pos[i], pos[j], n_adds, n_removes))
 
     return result
+
+
+cdef inline bint is_isolated_flat(
+    const uint32_t[::1] positions,
+    Py_ssize_t first,
+    Py_ssize_t last,
+    Py_ssize_t i,
+    int max_window,
+):
+    """is_isolated() for the positions `positions[first:last]`."""
+
+    if i > first and <int64_t> (positions[i] - positions[i - 1]) + 1 <= max_window:
+        return False
+
+    return i == last - 1 or <int64_t> (positions[i + 1] - positions[i]) + 1 > max_window
+
+
+def adds_removes_from_flat_positions(
+    const int64_t[::1] offsets,
+    const uint32_t[::1] positions,
+    const int64_t[::1] n_entity_tokens,
+    int min_window,
+    int max_window,
+):
+    """Calculate the windows of adds_removes_from_positions() for all entities.
+
+    The positions of entity `i` are `positions[offsets[i]:offsets[i+1]]` and
+    it has `n_entity_tokens[i]` tokens. Returns NumPy arrays of the entity
+    index, start, end, number of tokens added and number of tokens removed of
+    each window (in the same order as adds_removes_from_positions()).
+    """
+
+    cdef Py_ssize_t num_entities = offsets.shape[0] - 1
+    cdef Py_ssize_t e, i, j, k
+    cdef int64_t first, last, n_t, n_c, n_e
+    cdef Py_ssize_t num_windows = 0
+
+    # Count the windows so that the arrays can be allocated
+    for e in range(num_entities):
+        first = offsets[e]
+        last = offsets[e + 1]
+        for i in range(first, last):
+            if is_isolated_flat(positions, first, last, i, max_window):
+                num_windows += 1
+
+        for i in range(first, last - 1):
+            for j in range(i + 1, last):
+                n_t = positions[j] - positions[i] + 1
+                if n_t < min_window:
+                    continue
+                elif n_t > max_window:
+                    break
+                num_windows += 1
+
+    entity_idx_arr = np.empty(num_windows, dtype=np.int64)
+    start_arr = np.empty(num_windows, dtype=np.int64)
+    end_arr = np.empty(num_windows, dtype=np.int64)
+    n_adds_arr = np.empty(num_windows, dtype=np.int64)
+    n_removes_arr = np.empty(num_windows, dtype=np.int64)
+
+    cdef int64_t[::1] entity_idx = entity_idx_arr
+    cdef int64_t[::1] start = start_arr
+    cdef int64_t[::1] end = end_arr
+    cdef int64_t[::1] n_adds = n_adds_arr
+    cdef int64_t[::1] n_removes = n_removes_arr
+
+    k = 0
+    for e in range(num_entities):
+        first = offsets[e]
+        last = offsets[e + 1]
+        n_e = n_entity_tokens[e]
+
+        for i in range(first, last):
+            if is_isolated_flat(positions, first, last, i, max_window):
+                entity_idx[k] = e
+                start[k] = positions[i]
+                end[k] = positions[i]
+                n_adds[k] = 0
+                n_removes[k] = n_e - 1
+                k += 1
+
+        for i in range(first, last - 1):
+            for j in range(i + 1, last):
+                n_t = positions[j] - positions[i] + 1
+                if n_t < min_window:
+                    continue
+                elif n_t > max_window:
+                    break
+
+                n_c = j - i + 1
+                entity_idx[k] = e
+                start[k] = positions[i]
+                end[k] = positions[j]
+                n_adds[k] = max(0, n_t - n_c)
+                n_removes[k] = max(0, n_e - n_c)
+                k += 1
+
+    return entity_idx_arr, start_arr, end_arr, n_adds_arr, n_removes_arr
@@ -16,6 +16,12 @@ if [ -f ${sqlite_file} ]; then
     rm ${sqlite_file}
 fi
 
+staging_folder=./data/staging
+if [ -d ${staging_folder} ]; then
+    echo "Deleting staging folder"
+    rm -rf ${staging_folder}
+fi
+
 rm -f ./*.so
 rm -rf ./build
 
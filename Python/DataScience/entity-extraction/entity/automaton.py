@@ -0,0 +1,354 @@
+import mmap
+import sys
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from domain import Tokens, assert_token_valid
+from lookup.lmdb_lookup import LmdbLookup
+from lookup.lookup import Lookup
+
+# An Aho-Corasick automaton over tokens for finding exact matches of entities.
+#
+# The tokens are interned as integer token IDs (the rank of the token in the
+# sorted vocabulary) and the transitions, failure links and outputs of the
+# states are held in flat arrays. Feeding a token to the automaton moves it to
+# the state for the longest suffix of the text that is a prefix of an entity,
+# so exact matching is linear in the length of the text.
+#
+# The serialised automaton is:
+#
+# <magic: 8 bytes>
+# <header: version, tokens, states, edges, vocabulary bytes (uint64 each)>
+# <token offsets: uint64 per token + 1 (into the vocabulary)>
+# <vocabulary: UTF-8 encoded tokens in sorted order>
+# <state offsets: uint32 per state + 1 (into the edges)>
+# <edge tokens: uint32 per edge (sorted by token ID for each state)>
+# <edge targets: uint32 per edge>
+# <failure links: uint32 per state>
+# <output links: int32 per state (next shorter suffix state with an entity)>
+# <entity IDs: int64 per state (-1 if no entity ends at the state)>
+# <depths: uint32 per state (number of tokens from the root)>
+#
+# Each section is padded to a multiple of 8 bytes. The serialised automaton
+# can be memory-mapped, so a large automaton loads without being parsed.
+
+MAGIC = b"TOKAUTO1"
+VERSION = 1
+
+# Number of uint64 fields in the header (after the magic)
+HEADER_FIELDS = 5
+
+# State of the automaton before any tokens have been seen
+ROOT_STATE = 0
+
+# Token ID of a token that isn't in the vocabulary of the automaton
+UNKNOWN_TOKEN_ID = -1
+
+# Maximum number of token IDs held in the memo of token lookups
+MAX_MEMO_TOKENS = 100000
+
+
+def padded(b: bytes) -> bytes:
+    """Pad the bytes to a multiple of 8 bytes."""
+    return b + bytes((8 - len(b) % 8) % 8)
+
+
+def build_automaton(entities: Iterable[Tuple[int, Tokens]]) -> bytes:
+    """Build the serialised automaton for the entities' internal IDs and tokens.
+
+    If two entities have the same tokens, the last entity is matched.
+    """
+
+    # Build the trie (keyed by the encoded tokens)
+    children: List[Dict[bytes, int]] = [{}]
+    entity_ids: List[int] = [-1]
+    depths: List[int] = [0]
+
+    num_entities = 0
+    for entity_id, tokens in entities:
+        assert type(entity_id) == int and entity_id >= 0
+        assert type(tokens) == list and len(tokens) > 0
+
+        state = ROOT_STATE
+        for token in tokens:
+            assert_token_valid(token)
+            key = token.encode("utf-8")
+
+            child = children[state].get(key)
+            if child is None:
+                child = len(children)
+                children[state][key] = child
+                children.append({})
+                entity_ids.append(-1)
+                depths.append(depths[state] + 1)
+            state = child
+
+        entity_ids[state] = entity_id
+        num_entities += 1
+
+    # Intern the tokens as their rank in the sorted vocabulary
+    vocabulary = sorted({key for c in children for key in c})
+    token_ids = {key: idx for idx, key in enumerate(vocabulary)}
+    edges = [sorted((token_ids[k], s) for k, s in c.items()) for c in children]
+
+    # Failure and output links (in breadth-first order, so that the links of
+    # the shorter suffixes are set first)
+    num_states = len(children)
+    fail = [ROOT_STATE] * num_states
+    output = [-1] * num_states
+
+    queue = deque([s for _, s in edges[ROOT_STATE]])
+    while len(queue) > 0:
+        state = queue.popleft()
+
+        for token_id, child in edges[state]:
+            # Longest proper suffix of the child that is in the trie
+            f = fail[state]
+            while True:
+                target = _find_edge(edges[f], token_id)
+                if target is not None or f == ROOT_STATE:
+                    break
+                f = fail[f]
+            fail[child] = ROOT_STATE if target is None else target
+
+            f = fail[child]
+            output[child] = f if entity_ids[f] >= 0 else output[f]
+            queue.append(child)
+
+    state_offsets = np.cumsum([0] + [len(e) for e in edges])
+    token_offsets = np.cumsum([0] + [len(t) for t in vocabulary])
+
+    logger.info(
+        f"Built automaton with {num_entities} entities, {len(vocabulary)} tokens and {num_states} states"
+    )
+
+    header = np.array(
+        [VERSION, len(vocabulary), num_states, int(state_offsets[-1]), token_offsets[-1]],
+        dtype="<u8",
+    )
+    sections = [
+        MAGIC,
+        header.tobytes(),
+        np.asarray(token_offsets, dtype="<u8").tobytes(),
+        padded(b"".join(vocabulary)),
+        padded(np.asarray(state_offsets, dtype="<u4").tobytes()),
+        padded(np.array([t for e in edges for t, _ in e], dtype="<u4").tobytes()),
+        padded(np.array([s for e in edges for _, s in e], dtype="<u4").tobytes()),
+        padded(np.array(fail, dtype="<u4").tobytes()),
+        padded(np.array(output, dtype="<i4").tobytes()),
+        np.array(entity_ids, dtype="<i8").tobytes(),
+        padded(np.array(depths, dtype="<u4").tobytes()),
+    ]
+
+    return b"".join(sections)
+
+
+def _find_edge(edges: List[Tuple[int, int]], token_id: int) -> Optional[int]:
+    """Target state of the edge for a token ID (None if there isn't an edge)."""
+
+    idx = bisect_left(edges, (token_id, -1))
+    if idx < len(edges) and edges[idx][0] == token_id:
+        return edges[idx][1]
+
+    return None
+
+
+class TokenAutomaton:
+    """Automaton for finding the exact matches of entities in tokens."""
+
+    def __init__(self, buffer) -> None:
+        if sys.byteorder != "little":
+            raise Exception("The automaton requires a little-endian platform")
+
+        self._buffer = buffer
+        self._mmap: Optional[mmap.mmap] = None
+        self._views: List[memoryview] = []
+
+        if bytes(buffer[: len(MAGIC)]) != MAGIC:
+            raise Exception("Invalid automaton")
+
+        header = self._view(len(MAGIC), HEADER_FIELDS * 8, "Q")
+        version, num_tokens, num_states, num_edges, vocabulary_length = header
+        if version != VERSION:
+            raise Exception(f"Unsupported automaton version: {version}")
+
+        self._num_tokens = num_tokens
+        self._num_states = num_states
+
+        # Views onto the sections of the buffer
+        self._offset = len(MAGIC) + HEADER_FIELDS * 8
+        self._token_offsets = self._section(num_tokens + 1, 8, "Q")
+        self._vocabulary = self._section(vocabulary_length, 1, "B")
+        self._state_offsets = self._section(num_states + 1, 4, "I")
+        self._edge_tokens = self._section(num_edges, 4, "I")
+        self._edge_targets = self._section(num_edges, 4, "I")
+        self._fail = self._section(num_states, 4, "I")
+        self._output = self._section(num_states, 4, "i")
+        self._entity_ids = self._section(num_states, 8, "q")
+        self._depths = self._section(num_states, 4, "I")
+
+        # Memo of the token IDs of the tokens seen
+        self._token_ids: Dict[str, int] = {}
+
+    def _view(self, offset: int, length: int, fmt: str) -> memoryview:
+        """View of a range of the buffer as an array of a given format."""
+
+        view = memoryview(self._buffer)[offset : offset + length].cast(fmt)
+        self._views.append(view)
+        return view
+
+    def _section(self, count: int, item_size: int, fmt: str) -> memoryview:
+        """View of the next section of the buffer."""
+
+        length = count * item_size
+        view = self._view(self._offset, length, fmt)
+        self._offset += length + (8 - length % 8) % 8
+        return view
+
+    @staticmethod
+    def from_entities(entities: Dict[int, Tokens]) -> "TokenAutomaton":
+        """Automaton for a dict of internal entity ID to tokens."""
+
+        assert type(entities) == dict
+        return TokenAutomaton(build_automaton(entities.items()))
+
+    @staticmethod
+    def from_lookup(lookup: Lookup) -> "TokenAutomaton":
+        """Automaton for all of the entities in a lookup."""
+
+        assert isinstance(lookup, Lookup)
+
+        # An LMDB lookup is scanned with a cursor rather than by entity ID
+        if isinstance(lookup, LmdbLookup):
+            entities = lookup.entities()
+        else:
+            entities = (
+                (entity_id, tokens)
+                for entity_id in range(lookup.max_entity_id() + 1)
+                if (tokens := lookup.tokens_for_entity(entity_id)) is not None
+            )
+
+        return TokenAutomaton(build_automaton(entities))
+
+    @staticmethod
+    def load(filepath: str) -> "TokenAutomaton":
+        """Memory-map a serialised automaton from a file."""
+
+        assert type(filepath) == str
+
+        with open(filepath, "rb") as fp:
+            buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            automaton = TokenAutomaton(buffer)
+        except Exception:
+            buffer.close()
+            raise
+
+        automaton._mmap = buffer
+        return automaton
+
+    def save(self, filepath: str) -> None:
+        """Write the serialised automaton to a file."""
+
+        assert type(filepath) == str
+
+        with open(filepath, "wb") as fp:
+            fp.write(self._buffer)
+
+    def close(self) -> None:
+        """Release the buffer (required to unmap a loaded automaton)."""
+
+        for view in self._views:
+            view.release()
+        self._views = []
+
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def num_tokens(self) -> int:
+        """Number of distinct tokens in the entities."""
+        return self._num_tokens
+
+    def num_states(self) -> int:
+        """Number of states of the automaton."""
+        return self._num_states
+
+    def token_id(self, token: str) -> int:
+        """Token ID of a token (UNKNOWN_TOKEN_ID if it isn't in an entity)."""
+
+        token_id = self._token_ids.get(token)
+        if token_id is not None:
+            return token_id
+
+        # Binary search of the sorted vocabulary
+        key = token.encode("utf-8")
+        offsets = self._token_offsets
+        lo, hi = 0, self._num_tokens
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._vocabulary[offsets[mid] : offsets[mid + 1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        token_id = UNKNOWN_TOKEN_ID
+        if (
+            lo < self._num_tokens
+            and self._vocabulary[offsets[lo] : offsets[lo + 1]].tobytes() == key
+        ):
+            token_id = lo
+
+        if len(self._token_ids) >= MAX_MEMO_TOKENS:
+            self._token_ids = {}
+        self._token_ids[token] = token_id
+
+        return token_id
+
+    def next_state(self, state: int, token_id: int) -> int:
+        """State after receiving a token (given its ID) in a state."""
+
+        if token_id == UNKNOWN_TOKEN_ID:
+            return ROOT_STATE
+
+        while True:
+            lo = self._state_offsets[state]
+            hi = self._state_offsets[state + 1]
+            idx = bisect_left(self._edge_tokens, token_id, lo, hi)
+            if idx < hi and self._edge_tokens[idx] == token_id:
+                return self._edge_targets[idx]
+
+            if state == ROOT_STATE:
+                return ROOT_STATE
+
+            state = self._fail[state]
+
+    def outputs(self, state: int) -> Iterator[Tuple[int, int]]:
+        """Number of tokens and entity ID of each entity ending in a state.
+
+        The entities are in order of decreasing number of tokens.
+        """
+
+        if self._entity_ids[state] < 0:
+            state = self._output[state]
+
+        while state >= 0:
+            yield self._depths[state], self._entity_ids[state]
+            state = self._output[state]
+
+    def find_matches(self, tokens: Tokens) -> Iterator[Tuple[int, int, int]]:
+        """Start index, end index and entity ID of each exact match in the tokens."""
+
+        state = ROOT_STATE
+        for end, token in enumerate(tokens):
+            state = self.next_state(state, self.token_id(token))
+            for length, entity_id in self.outputs(state):
+                yield end - length + 1, end, entity_id
+
+    def __repr__(self) -> str:
+        return f"TokenAutomaton(tokens={self._num_tokens}, states={self._num_states})"
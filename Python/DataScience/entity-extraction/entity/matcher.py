@@ -1,3 +1,4 @@
+import bisect
 from abc import ABC, abstractmethod
 from typing import Any, Dict, List
 
@@ -132,16 +133,139 @@ def spans_overlap(start0: int, end0: int, start1: int, end1: int) -> bool:
     assert type(end1) == int and end1 >= 0
     assert end1 >= start1
 
-    values0 = set(range(start0, end0 + 1))
-    values1 = set(range(start1, end1 + 1))
+    return start0 <= end1 and start1 <= end0
 
-    return len(values0.intersection(values1)) > 0
+
+class MaxEndTree:
+    """Segment tree of the maximum end of the spans in ranges of positions.
+
+    The spans are held in order of their start, so the spans that start at
+    or before a given index and end at or after another can be found (and
+    removed) without checking every span.
+    """
+
+    def __init__(self, ends: List[int]):
+        assert type(ends) == list
+
+        # Number of leaves (a power of 2)
+        self._size = 1
+        while self._size < len(ends):
+            self._size *= 2
+
+        # A removed (or missing) span has an end of -1
+        self._tree = [-1] * (2 * self._size)
+        self._tree[self._size : self._size + len(ends)] = ends
+        for node in range(self._size - 1, 0, -1):
+            self._tree[node] = max(self._tree[2 * node], self._tree[2 * node + 1])
+
+    def remove(self, position: int) -> None:
+        """Remove the span at the position."""
+
+        node = self._size + position
+        self._tree[node] = -1
+
+        node //= 2
+        while node > 0:
+            self._tree[node] = max(self._tree[2 * node], self._tree[2 * node + 1])
+            node //= 2
+
+    def pop_ending_at_or_after(self, limit: int, end: int) -> List[int]:
+        """Remove and return the positions before the limit of the spans that end
+        at or after the given index."""
+
+        positions = []
+
+        # Nodes as (node, first position, position after the last)
+        stack = [(1, 0, self._size)]
+        while len(stack) > 0:
+            node, lo, hi = stack.pop()
+            if lo >= limit or self._tree[node] < end:
+                continue
+
+            if hi - lo == 1:
+                positions.append(lo)
+                self.remove(lo)
+                continue
+
+            mid = (lo + hi) // 2
+            stack.append((2 * node + 1, mid, hi))
+            stack.append((2 * node, lo, mid))
+
+        return positions
 
 
 def most_likely_matches(
     matches: List[ProbabilisticMatch],
 ) -> List[List[ProbabilisticMatch]]:
-    """Most likely matches for a given span."""
+    """Most likely matches for a given span.
+
+    The matches are taken in descending order of probability. Each match that
+    hasn't been assigned to a group seeds a new group, to which the unassigned
+    matches that overlap it are assigned. The most likely matches of a group
+    are those with the seed's probability.
+
+    The overlapping matches are found from a segment tree of the matches in
+    order of their start, so each match is only visited when it is assigned,
+    giving O(n log n) time (rather than O(n^2) for most_likely_matches_reference).
+    """
+
+    assert type(matches) == list
+
+    # Sort the matches in descending order of probability
+    matches = sorted(matches, key=lambda m: m.probability, reverse=True)
+
+    # Matches in order of their start
+    by_start = sorted(range(len(matches)), key=lambda idx: matches[idx].start)
+    starts = [matches[idx].start for idx in by_start]
+    position = [0] * len(matches)
+    for pos, idx in enumerate(by_start):
+        position[idx] = pos
+
+    # Maximum end of the unassigned matches
+    tree = MaxEndTree([matches[idx].end for idx in by_start])
+    assigned = [False] * len(matches)
+
+    most_likely = []
+    for seed_idx, seed in enumerate(matches):
+
+        # Skip over matches that have already been assigned to a group
+        if assigned[seed_idx]:
+            continue
+
+        assigned[seed_idx] = True
+        tree.remove(position[seed_idx])
+
+        # The unassigned matches that overlap the seed start at or before the
+        # seed's end and end at or after the seed's start
+        limit = bisect.bisect_right(starts, seed.end)
+        group = [seed_idx]
+        for pos in tree.pop_ending_at_or_after(limit, seed.start):
+            assigned[by_start[pos]] = True
+            group.append(by_start[pos])
+
+        # The seed has the maximum probability for the group
+        max_prob_for_group = seed.probability
+        assert_probability_valid(max_prob_for_group)
+
+        # Retain matches with the same probability (in sort order)
+        most_likely.append(
+            [
+                matches[idx]
+                for idx in sorted(group)
+                if matches[idx].probability == max_prob_for_group
+            ]
+        )
+
+    return most_likely
+
+
+def most_likely_matches_reference(
+    matches: List[ProbabilisticMatch],
+) -> List[List[ProbabilisticMatch]]:
+    """Most likely matches for a given span (reference implementation).
+
+    Used to check most_likely_matches().
+    """
 
     assert type(matches) == list
 
@@ -1,37 +1,34 @@
-from typing import List, Tuple
+from typing import Iterator, List, Optional, Set, Tuple
+import numpy as np
 from loguru import logger
 from domain import Tokens, assert_probability_valid, assert_token_valid
 from entity.matcher import EntityMatcher, ProbabilisticMatch
 from likelihood.likelihood_add_remove import LikelihoodAddRemoveFn
 from lookup.lookup import Lookup
+from lookup.postings import Postings, num_postings, prune_postings
 
-from positions_compiled_c import calc_positions
-from adds_removes import adds_removes_from_positions
+from positions_compiled_c import (
+    calc_positions_postings_flat_32,
+    calc_positions_postings_sparse_flat_32,
+)
+from adds_removes import adds_removes_from_flat_positions
 
+# Cost of processing an entity ID in a posting list with the sparse kernel
+# relative to the cost per entity ID of the dense kernel's arrays (measured
+# with a maximum entity ID of 30M)
+SPARSE_KERNEL_RELATIVE_COST = 8
 
-def subdivide_text(
-    num_tokens: int, max_segment_length: int, max_window: int
-) -> List[Tuple[int, int]]:
-    """Sub-divide the text into segments for processing."""
 
-    assert type(num_tokens) == int and num_tokens > 0
-    assert type(max_segment_length) == int and max_segment_length >= max_window
-    assert type(max_window) == int and max_window > 0
+def use_sparse_kernel(postings: List[Optional[Postings]], max_entity_id: int) -> bool:
+    """Should the sparse kernel be used to find the positions of the entities?
 
-    # All of the tokens fit within a single segment
-    if num_tokens <= max_segment_length:
-        return [(0, num_tokens)]
+    The dense kernel's time and memory are proportional to the maximum entity
+    ID, whereas the sparse kernel's are proportional to the number of
+    candidate entity IDs in the posting lists.
+    """
 
-    # First segment
-    result = [(0, max_segment_length)]
-
-    # Remaining segments
-    while result[-1][1] < num_tokens:
-        start = result[-1][1] - max_window + 1
-        end = min(start + max_segment_length, num_tokens)
-        result.append((start, end))
-
-    return result
+    num_candidates = sum([num_postings(p) for p in postings if p is not None])
+    return num_candidates * SPARSE_KERNEL_RELATIVE_COST < max_entity_id
 
 
 class EntityMatcherAddRemove(EntityMatcher):
@@ -43,6 +40,7 @@ class EntityMatcherAddRemove(EntityMatcher):
         max_window: int,
         min_probability: float,
         max_entity_id: int,
+        stop_token_frequency: Optional[int] = None,
     ):
         assert isinstance(lookup, Lookup)
         assert isinstance(likelihood, LikelihoodAddRemoveFn)
@@ -50,6 +48,9 @@ class EntityMatcherAddRemove(EntityMatcher):
         assert type(max_window) == int and max_window >= min_window
         assert_probability_valid(min_probability)
         assert type(max_entity_id) == int and max_entity_id > 0
+        assert stop_token_frequency is None or (
+            type(stop_token_frequency) == int and stop_token_frequency > 0
+        )
 
         # Store the parameters
         self._lookup = lookup
@@ -59,31 +60,61 @@ class EntityMatcherAddRemove(EntityMatcher):
         self._min_probability = min_probability
         self._max_entity_id = max_entity_id
 
+        # Tokens that belong to more entities than this don't generate
+        # candidate entities (None to use all tokens)
+        self._stop_token_frequency = stop_token_frequency
+
         # List of tokens passed to this class
         self._tokens: Tokens = []
 
         # Initialise the list of matches
         self._matches: List[ProbabilisticMatch] = []
 
-        # Entity IDs that match each token
-        self._entity_ids_str: List[str] = []
+        # (start, end, entity ID) of each of the matches
+        self._match_keys: Set[Tuple[int, int, int]] = set()
+
+        # Posting list of the entity IDs that match each token
+        self._postings: List[Optional[Postings]] = []
 
     def next_token(self, token: str) -> None:
         """Receive the next token in the text."""
 
+        # Look up the entity IDs that match the token
+        self.next_token_with_postings(
+            token, self._lookup.entity_ids_for_token_postings(token)
+        )
+
+    def next_token_with_postings(
+        self, token: str, postings: Optional[Postings]
+    ) -> None:
+        """Receive the next token with its (already looked up) posting list.
+
+        The posting list must remain valid until the matches have been
+        calculated.
+        """
+
         assert_token_valid(token)
         self._tokens.append(token)
-
-        # Look up the entity IDs that match the token
-        entity_ids_str = self._lookup.entity_ids_for_token_string(token)
-        if entity_ids_str is None:
-            self._entity_ids_str.append("")
-        else:
-            self._entity_ids_str.append(entity_ids_str)
+        self._postings.append(postings)
 
     def get_matches(self) -> List[ProbabilisticMatch]:
         """Return entity extraction results."""
 
+        for m in self.find_matches(self._postings):
+
+            # Store the match if it hasn't been seen before
+            key = (m.start, m.end, m.entity_id)
+            if key not in self._match_keys:
+                self._match_keys.add(key)
+                self._matches.append(m)
+
+        return self._matches
+
+    def find_matches(
+        self, postings: List[Optional[Postings]]
+    ) -> Iterator[ProbabilisticMatch]:
+        """Find the matches given the posting list of each token in a text."""
+
         # Determine the minimum count of an entity for it to be tested
         min_count = max(
             1, self._likelihood.min_count(self._min_window, self._min_probability)
@@ -92,66 +123,78 @@ class EntityMatcherAddRemove(EntityMatcher):
             f"Minimum number of times the entity must appear for evaluation: {min_count}"
         )
 
-        # Divide the text into segments that can be processed by the compiled C
-        # code. The code uses 8 bits to represent a position, so the maximum
-        # segment is 256.
-        start_ends = subdivide_text(len(self._entity_ids_str), 255, self._max_window)
-        logger.debug(f"Processing text in {len(start_ends)} segment(s)")
+        if len(postings) == 0:
+            return
 
-        for start_idx, end_idx in start_ends:
-            sub_entity_ids = self._entity_ids_str[start_idx:end_idx]
+        # Only check the frequent tokens against the candidates from the rare
+        # tokens near them
+        if self._stop_token_frequency is not None:
+            postings = prune_postings(
+                postings, self._stop_token_frequency, self._max_window
+            )
 
-            # Call compiled C code to find the entity positions
-            s = "|".join(sub_entity_ids)
-            position_results = calc_positions(
-                s.encode(), self._max_entity_id, min_count
+        # Call compiled C code to find the entity positions in the whole text
+        # (the posting lists are read in place)
+        if use_sparse_kernel(postings, self._max_entity_id):
+            position_results = calc_positions_postings_sparse_flat_32(
+                postings, min_count
+            )
+        else:
+            position_results = calc_positions_postings_flat_32(
+                postings, self._max_entity_id, min_count
             )
 
-            # Check the positions were calculated successfully
-            if len(position_results.error_message) > 0:
-                raise Exception(position_results.error_message)
+        # Check the positions were calculated successfully
+        if len(position_results.error_message) > 0:
+            raise Exception(position_results.error_message)
 
-            logger.debug(
-                f"Number of entities with positions to evaluate: {len(position_results.results)}"
-            )
+        entity_ids = position_results.entity_ids
+        logger.debug(
+            f"Number of entities with positions to evaluate: {len(entity_ids)}"
+        )
 
-            # Walk through each of the entities and their matching token positions
-            # for the entities that have been seen the required minimum number of
-            # times
-            for entity_result in position_results.results:
-                entity_id = entity_result.entity_id
-                positions = entity_result.pos
-
-                # Get the number of tokens for the entity
-                n_e = self._lookup.num_tokens_for_entity(entity_id)
-                assert n_e is not None
-
-                windows = adds_removes_from_positions(
-                    positions, n_e, self._min_window, self._max_window
-                )
-
-                for start, end, n_adds, n_removes in windows:
-
-                    # Calculate the likelihood of the tokens given the entity
-                    prob = self._likelihood.calc(n_adds, n_removes, n_e)
-
-                    # If the likelihood is above the threshold, then store the
-                    # match if it hasn't been seen before
-                    if prob > self._min_probability:
-                        m = ProbabilisticMatch(
-                            start=start + start_idx,  # Apply the segment offset
-                            end=end + start_idx,
-                            entity_id=entity_id,
-                            probability=prob,
-                        )
-                        if m not in self._matches:
-                            self._matches.append(m)
+        # Get the number of tokens for each entity
+        n_e = [self._lookup.num_tokens_for_entity(e) for e in entity_ids.tolist()]
+        assert None not in n_e
+        n_e = np.array(n_e, dtype=np.int64)
+
+        # Calculate the number of tokens added and removed for each window of
+        # each entity (in compiled code)
+        entity_idx, starts, ends, n_adds, n_removes = adds_removes_from_flat_positions(
+            position_results.offsets,
+            position_results.positions,
+            n_e,
+            self._min_window,
+            self._max_window,
+        )
 
-        return self._matches
+        # Calculate the likelihood of the tokens given the entity for all of
+        # the windows and only keep those above the threshold
+        probs = self._likelihood.calc_batch(n_adds, n_removes, n_e[entity_idx])
+        keep = probs > self._min_probability
+
+        # Only evaluate the windows with at least the minimum count of the
+        # entity's tokens (so a window doesn't depend on the rest of the text)
+        n_common = ends - starts + 1 - n_adds
+        keep &= n_common >= min_count
+
+        for start, end, entity_id, prob in zip(
+            starts[keep].tolist(),
+            ends[keep].tolist(),
+            entity_ids[entity_idx[keep]].tolist(),
+            probs[keep].tolist(),
+        ):
+            yield ProbabilisticMatch(
+                start=start,
+                end=end,
+                entity_id=entity_id,
+                probability=prob,
+            )
 
     def reset(self) -> None:
         """Reset the matcher."""
 
         self._tokens = []
         self._matches = []
-        self._entity_ids_str = []
+        self._match_keys = set()
+        self._postings = []
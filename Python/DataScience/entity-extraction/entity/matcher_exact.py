@@ -1,12 +1,11 @@
 from __future__ import annotations
-from collections import deque
 
 from domain import Tokens, assert_token_valid, assert_tokens_valid
 
+from .automaton import ROOT_STATE, TokenAutomaton
 from .matcher import EntityMatcher, ProbabilisticMatch
-from .sequence import Window
 
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 
 class Node:
@@ -82,6 +81,18 @@ class Tree:
 
         return True, current_node.is_leaf(), current_node.get_entity_id()
 
+    def entities(self) -> Iterator[Tuple[int, Tokens]]:
+        """Iterate over the entity IDs and tokens of the entities in the tree."""
+
+        stack = [(self._root, [])]
+        while len(stack) > 0:
+            node, tokens = stack.pop()
+            if node.get_entity_id() is not None:
+                yield node.get_entity_id(), tokens
+
+            for token, child in node._children.items():
+                stack.append((child, tokens + [token]))
+
 
 def tree_from_entities(entities: Dict[int, Tokens]) -> Tuple[Tree, int]:
     """Returns a Tree for given dict of entities and the max number of tokens."""
@@ -106,50 +117,61 @@ def tree_from_entities(entities: Dict[int, Tokens]) -> Tuple[Tree, int]:
     return tree, max_num_tokens
 
 
+def automaton_from_tree(tree: Tree) -> TokenAutomaton:
+    """Returns a TokenAutomaton that matches the entities in a Tree."""
+
+    assert type(tree) == Tree
+    return TokenAutomaton.from_entities(dict(tree.entities()))
+
+
 class ExactEntityMatcher(EntityMatcher):
-    """Performs an exact entity match."""
+    """Performs an exact entity match using a token automaton."""
 
-    def __init__(self, tree: Tree, max_window_width: int):
-        assert type(tree) == Tree
+    def __init__(self, tree: Union[Tree, TokenAutomaton], max_window_width: int):
+        assert type(tree) in [Tree, TokenAutomaton]
         assert type(max_window_width) == int
         assert max_window_width > 0
 
-        self._tree: Tree = tree
+        if type(tree) == Tree:
+            tree = automaton_from_tree(tree)
+
+        self._automaton: TokenAutomaton = tree
         self._max_window_width: int = max_window_width
-        self._window: Window = Window(max_window_width)
+        self._state: int = ROOT_STATE
+        self._idx: int = -1
         self._matches: List[ProbabilisticMatch] = []
 
     def reset(self) -> None:
         """Reset the matcher."""
-        self._window = Window(self._max_window_width)
+        self._state = ROOT_STATE
+        self._idx = -1
         self._matches = []
 
     def next_token(self, token: str) -> None:
         """Receive the next token in the text."""
         assert_token_valid(token)
 
-        # Adjust the window by adding the token
-        self._window.add_token(token)
-
-        # Get the tokens in the window and the absolute start and end indices of
-        # the tokens in the text
-        tokens_in_window, _, end_idx = self._window.get_tokens()
+        self._idx += 1
 
-        for i in range(len(tokens_in_window)):
-            tokens_to_check = tokens_in_window[i:]
+        # Move the automaton to the state for the longest suffix of the text
+        # that is a prefix of an entity
+        self._state = self._automaton.next_state(
+            self._state, self._automaton.token_id(token)
+        )
 
-            # Look for a match
-            _, _, entity_id = self._tree.has_tokens(tokens_to_check)
+        # Entities ending at the token (the longest first)
+        for num_tokens, entity_id in self._automaton.outputs(self._state):
+            if num_tokens > self._max_window_width:
+                continue
 
-            if entity_id is not None:
-                m = ProbabilisticMatch(
-                    start=end_idx - len(tokens_to_check) + 1,
-                    end=end_idx,
-                    entity_id=entity_id,
-                    probability=1.0,
-                )
+            m = ProbabilisticMatch(
+                start=self._idx - num_tokens + 1,
+                end=self._idx,
+                entity_id=entity_id,
+                probability=1.0,
+            )
 
-                self._matches.append(m)
+            self._matches.append(m)
 
     def get_matches(self) -> List[ProbabilisticMatch]:
         """Return entity extraction results."""
@@ -8,6 +8,7 @@ from domain import (
 from entity.matcher import EntityMatcher, ProbabilisticMatch
 from likelihood.likelihood import LikelihoodFunction
 from lookup.lookup import Lookup
+from lookup.token_dictionary import TokenIds
 from loguru import logger
 
 
@@ -81,45 +82,34 @@ class GenericEntityMatcher(EntityMatcher):
                 self._entity_id_to_count.get(entity_id, 0) + 1
             )
 
-    def _calc_matches_for_entity(
-        self, start_idx: int, end_idx: int, entity_id: int, entity_tokens: Tokens
+    def _calc_matches_for_entity_in_subwindows(
+        self, entity_id: int, token_ids: TokenIds, windows: List[Tuple[int, int]]
     ) -> None:
-        """Calculate the matches in the text from start:end (inclusive) for a given entity."""
+        """Calculate matches for the entity in all sub-windows."""
 
-        assert type(start_idx) == int and start_idx >= 0
-        assert type(end_idx) == int and start_idx <= end_idx < len(self._tokens)
         assert_internal_entity_id_valid(entity_id)
 
-        # Calculate the likelihood of the tokens given the entity
-        tokens_to_check = self._tokens[start_idx : (end_idx + 1)]
-        prob = self._likelihood.calc(tokens_to_check, entity_tokens)
+        # Get the token IDs for the entity
+        entity_token_ids = self._lookup.token_ids_for_entity(entity_id)
+
+        # Calculate the likelihood of the tokens in each sub-window given the
+        # entity
+        probs = self._likelihood.calc_token_ids_batch(
+            [token_ids[start_idx : (end_idx + 1)] for start_idx, end_idx in windows],
+            [entity_token_ids] * len(windows),
+        )
 
         # If the likelihood is above the threshold, then store the match
-        if prob >= self._min_probability:
-            self._matches.append(
-                ProbabilisticMatch(
-                    start=end_idx - len(tokens_to_check) + 1,
-                    end=end_idx,
-                    entity_id=entity_id,
-                    probability=prob,
+        for (start_idx, end_idx), prob in zip(windows, probs.tolist()):
+            if prob >= self._min_probability:
+                self._matches.append(
+                    ProbabilisticMatch(
+                        start=start_idx,
+                        end=end_idx,
+                        entity_id=entity_id,
+                        probability=prob,
+                    )
                 )
-            )
-
-    def _calc_matches_for_entity_in_subwindows(self, entity_id: int) -> None:
-        """Calculate matches for the entity in all sub-windows."""
-
-        # Get the tokens for the entity
-        entity_tokens = self._lookup.tokens_for_entity(entity_id)
-
-        # Walk through each start and end position for the sub-window
-        for start_idx, end_idx in calc_windows(
-            num_tokens=len(self._tokens),
-            min_window=self._min_window,
-            max_window=self._max_window,
-        ):
-
-            # Calculate the matches for the entity in the sub-window
-            self._calc_matches_for_entity(start_idx, end_idx, entity_id, entity_tokens)
 
     def get_matches(self) -> List[ProbabilisticMatch]:
         """Return entity extraction results."""
@@ -134,6 +124,17 @@ class GenericEntityMatcher(EntityMatcher):
             f"Minimum number of times the entity must appear for evaluation: {min_count}"
         )
 
+        # Token IDs of the text and the sub-windows to check for each entity
+        if len(self._entity_id_to_count) > 0:
+            token_ids = self._lookup.token_ids(self._tokens)
+            windows = list(
+                calc_windows(
+                    num_tokens=len(self._tokens),
+                    min_window=self._min_window,
+                    max_window=self._max_window,
+                )
+            )
+
         # Walk through each entity first because getting the entity from the
         # lookup can be expensive
         num_tested = 0
@@ -143,7 +144,7 @@ class GenericEntityMatcher(EntityMatcher):
             if count < min_count:
                 continue
 
-            self._calc_matches_for_entity_in_subwindows(entity_id)
+            self._calc_matches_for_entity_in_subwindows(entity_id, token_ids, windows)
             num_tested += 1
 
         logger.debug(f"Number of entities tested: {num_tested}")
@@ -36,9 +36,9 @@ class MissingTokenEntityMatcher(EntityMatcher):
         self._matches: List[ProbabilisticMatch] = []
 
         # Initialise a cache that optimises the calculation of entities in
-        # common for a list of tokens
+        # common for a list of tokens (intersecting the compressed bitmaps)
         self._token_to_entities_cache = OptimisedTokenToEntitiesCache(
-            lookup.entity_ids_for_token
+            lookup.entity_ids_for_token_bitmap
         )
 
     def next_token(self, token: str) -> None:
@@ -58,27 +58,45 @@ class MissingTokenEntityMatcher(EntityMatcher):
         if len(tokens_in_window) < self._min_tokens_to_check:
             return
 
+        # Token IDs of the tokens in the window (for comparison with the token
+        # IDs of the entities)
+        token_ids_in_window = self._lookup.token_ids(tokens_in_window)
+
         # Walk from the last tokens to the first tokens
         for i in range(len(tokens_in_window) - self._min_tokens_to_check, -1, -1):
             tokens_to_check = tokens_in_window[i:]
             assert len(tokens_to_check) >= self._min_tokens_to_check
 
+            token_ids_to_check = token_ids_in_window[i:]
+            token_ids_to_check_list = token_ids_to_check.tolist()
+
             # Get the entities in common for the tokens to check
             entity_ids, _ = self._token_to_entities_cache.get(tokens_to_check)
 
-            # Walk through each of the entities in common
+            # Walk through each of the entities in common to find those with
+            # the tokens in the correct order
+            candidate_entity_ids = []
+            candidate_token_ids = []
             for entity_id in entity_ids:
 
-                # Get the tokens for the entity
-                entity_tokens = self._lookup.tokens_for_entity(entity_id)
+                # Get the token IDs for the entity
+                entity_token_ids = self._lookup.token_ids_for_entity(entity_id)
 
                 # Check the tokens appear in the correct order
-                if not correct_sequence(entity_tokens, tokens_to_check):
+                if not correct_sequence(
+                    entity_token_ids.tolist(), token_ids_to_check_list
+                ):
                     continue
 
-                # Calculate the probability of a match
-                prob = self._likelihood_function.calc(tokens_to_check, entity_tokens)
+                candidate_entity_ids.append(entity_id)
+                candidate_token_ids.append(entity_token_ids)
+
+            # Calculate the probability of a match for all of the candidates
+            probs = self._likelihood_function.calc_token_ids_batch(
+                [token_ids_to_check] * len(candidate_entity_ids), candidate_token_ids
+            )
 
+            for entity_id, prob in zip(candidate_entity_ids, probs.tolist()):
                 if prob >= self._min_probability:
                     self._matches.append(
                         ProbabilisticMatch(
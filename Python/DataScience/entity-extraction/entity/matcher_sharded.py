@@ -0,0 +1,147 @@
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+from loguru import logger
+from domain import Tokens, assert_probability_valid, assert_token_valid
+from entity.matcher import EntityMatcher, ProbabilisticMatch
+from entity.matcher_add_remove import EntityMatcherAddRemove
+from likelihood.likelihood_add_remove import LikelihoodAddRemoveFn
+from lookup.lmdb_lookup import LmdbLookup
+from lookup.sharded_lookup import ShardedLmdbLookup
+
+# A match as (start, end, local entity ID, probability)
+ShardMatch = Tuple[int, int, int, float]
+
+# Matcher for the shard held by a worker process
+shard_matcher: Optional[EntityMatcherAddRemove] = None
+
+
+def initialise_shard_matcher(
+    lmdb_folder: str,
+    likelihood: LikelihoodAddRemoveFn,
+    min_window: int,
+    max_window: int,
+    min_probability: float,
+) -> None:
+    """Initialise the matcher for a shard (in its worker process)."""
+
+    global shard_matcher
+
+    lookup = LmdbLookup(lmdb_folder, False)
+
+    # The entity IDs are local to the shard, so the memory allocated for
+    # counting the entities is proportional to the size of the shard
+    shard_matcher = EntityMatcherAddRemove(
+        lookup,
+        likelihood,
+        min_window,
+        max_window,
+        min_probability,
+        max(1, lookup.max_entity_id()),
+    )
+
+
+def match_shard(tokens: Tokens) -> List[ShardMatch]:
+    """Find the matches for the tokens in the worker process's shard."""
+
+    assert shard_matcher is not None
+
+    shard_matcher.reset()
+    for t in tokens:
+        shard_matcher.next_token(t)
+
+    return [
+        (m.start, m.end, m.entity_id, m.probability)
+        for m in shard_matcher.get_matches()
+    ]
+
+
+class ShardedEntityMatcher(EntityMatcher):
+    """Add-remove entity matcher that scatters the text across the shards.
+
+    Each shard of the lookup is matched in its own worker process and the
+    matches are gathered and mapped back to the (global) internal entity IDs.
+    The matches are the same as those of an EntityMatcherAddRemove on the
+    unsharded lookup.
+    """
+
+    def __init__(
+        self,
+        lookup: ShardedLmdbLookup,
+        likelihood: LikelihoodAddRemoveFn,
+        min_window: int,
+        max_window: int,
+        min_probability: float,
+    ):
+        assert isinstance(lookup, ShardedLmdbLookup)
+        assert isinstance(likelihood, LikelihoodAddRemoveFn)
+        assert type(min_window) == int and min_window > 0
+        assert type(max_window) == int and max_window >= min_window
+        assert_probability_valid(min_probability)
+
+        # List of tokens passed to this class
+        self._tokens: Tokens = []
+
+        # Matches (or None if they haven't been calculated)
+        self._matches: Optional[List[ProbabilisticMatch]] = None
+
+        # A single worker process per shard (the worker processes are spawned
+        # so that they don't inherit the parent's LMDB environments)
+        self._executors: List[Tuple[ProcessPoolExecutor, int]] = []
+        for folder, first_entity_id in lookup.shards():
+            executor = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=initialise_shard_matcher,
+                initargs=(folder, likelihood, min_window, max_window, min_probability),
+            )
+            self._executors.append((executor, first_entity_id))
+
+        logger.info(f"Sharded matcher with {len(self._executors)} shard(s)")
+
+    def next_token(self, token: str) -> None:
+        """Receive the next token in the text."""
+
+        assert_token_valid(token)
+        self._tokens.append(token)
+
+    def get_matches(self) -> List[ProbabilisticMatch]:
+        """Return entity extraction results."""
+
+        if self._matches is not None:
+            return self._matches
+
+        # Scatter the tokens to the shards
+        futures = [
+            (executor.submit(match_shard, self._tokens), first_entity_id)
+            for executor, first_entity_id in self._executors
+        ]
+
+        # Gather the matches, converting the local entity IDs to global IDs
+        self._matches = [
+            ProbabilisticMatch(
+                start=start,
+                end=end,
+                entity_id=first_entity_id + local_entity_id,
+                probability=probability,
+            )
+            for future, first_entity_id in futures
+            for start, end, local_entity_id, probability in future.result()
+        ]
+
+        return self._matches
+
+    def reset(self) -> None:
+        """Reset the matcher."""
+
+        self._tokens = []
+        self._matches = None
+
+    def close(self) -> None:
+        """Shut down the worker processes."""
+
+        for executor, _ in self._executors:
+            executor.shutdown()
+
+        self._executors = []
@@ -0,0 +1,164 @@
+from collections import deque
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+from domain import Tokens, assert_token_valid
+from entity.matcher import ProbabilisticMatch
+from entity.matcher_add_remove import EntityMatcherAddRemove
+from likelihood.likelihood_add_remove import LikelihoodAddRemoveFn
+from lookup.lookup import Lookup
+from lookup.postings import Postings
+
+# Default number of tokens whose matches are emitted each time the matches are
+# calculated
+DEFAULT_CHUNK_SIZE = 1024
+
+# A match and the tokens of the text that matched
+StreamedMatch = Tuple[ProbabilisticMatch, Tokens]
+
+
+class StreamingEntityMatcher:
+    """Finds the entities in an unbounded stream of tokens.
+
+    The tokens are held in a buffer of at most `chunk_size + 2 * context`
+    tokens, where the context is `max_window - 1` tokens. When the buffer is
+    full, the matches that start in the `chunk_size` tokens after the last
+    `context` tokens already emitted are found and the tokens before them are
+    discarded. The memory used is therefore independent of the length of the
+    stream.
+
+    Whether a window is a match only depends on the tokens within the context
+    of it, which are all in the buffer, so the matches are the same as those
+    of EntityMatcherAddRemove for the whole text (for any chunk size). If stop
+    tokens are pruned, a token's candidates depend on the tokens within
+    `max_window - 1` of it, so the context is doubled.
+    """
+
+    def __init__(
+        self,
+        lookup: Lookup,
+        likelihood: LikelihoodAddRemoveFn,
+        min_window: int,
+        max_window: int,
+        min_probability: float,
+        max_entity_id: int,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        stop_token_frequency: Optional[int] = None,
+    ):
+        assert type(chunk_size) == int and chunk_size > 0
+
+        # The matches in the buffer are found by an add-remove matcher
+        self._matcher = EntityMatcherAddRemove(
+            lookup,
+            likelihood,
+            min_window,
+            max_window,
+            min_probability,
+            max_entity_id,
+            stop_token_frequency,
+        )
+
+        self._lookup = lookup
+        self._chunk_size = chunk_size
+
+        # Number of tokens before and after a window that affect whether it is
+        # a match
+        self._context = (max_window - 1) * (1 if stop_token_frequency is None else 2)
+
+        # Index in the stream of the first token in the buffer
+        self._offset = 0
+
+        # Number of tokens at the start of the buffer whose matches have been
+        # emitted (kept as they affect the matches of the following tokens)
+        self._num_emitted = 0
+
+        # Tokens in the buffer and their posting lists
+        self._tokens: Deque[str] = deque()
+        self._postings: Deque[Optional[Postings]] = deque()
+
+    def next_token(self, token: str) -> List[StreamedMatch]:
+        """Receive the next token and return any matches that are complete."""
+
+        # Look up the entity IDs that match the token
+        return self.next_token_with_postings(
+            token, self._lookup.entity_ids_for_token_postings(token)
+        )
+
+    def next_token_with_postings(
+        self, token: str, postings: Optional[Postings]
+    ) -> List[StreamedMatch]:
+        """Receive the next token with its (already looked up) posting list."""
+
+        assert_token_valid(token)
+        self._tokens.append(token)
+        self._postings.append(postings)
+
+        num_pending = len(self._tokens) - self._num_emitted
+        if num_pending < self._chunk_size + self._context:
+            return []
+
+        return self._emit(self._chunk_size)
+
+    def buffer_offset(self) -> int:
+        """Index in the stream of the first token whose matches are pending.
+
+        A match returned later starts at or after this index.
+        """
+        return self._offset + self._num_emitted
+
+    def finish(self) -> List[StreamedMatch]:
+        """Return the matches in the remaining tokens at the end of the stream."""
+
+        return self._emit(len(self._tokens) - self._num_emitted)
+
+    def _emit(self, num_tokens: int) -> List[StreamedMatch]:
+        """Find the matches that start in the next `num_tokens` tokens of the
+        buffer and then discard the tokens that are no longer needed."""
+
+        tokens = list(self._tokens)
+        first = self._num_emitted
+        last = first + num_tokens
+
+        matches = [
+            (
+                ProbabilisticMatch(
+                    start=m.start + self._offset,
+                    end=m.end + self._offset,
+                    entity_id=m.entity_id,
+                    probability=m.probability,
+                ),
+                tokens[m.start : m.end + 1],
+            )
+            for m in self._matcher.find_matches(list(self._postings))
+            if first <= m.start < last
+        ]
+
+        # Keep the last `context` of the emitted tokens
+        num_discard = max(0, last - self._context)
+        for _ in range(num_discard):
+            self._tokens.popleft()
+            self._postings.popleft()
+
+        self._offset += num_discard
+        self._num_emitted = last - num_discard
+
+        return sorted(matches, key=lambda m: (m[0].start, m[0].end, m[0].entity_id))
+
+    def reset(self) -> None:
+        """Reset the matcher for a new stream."""
+
+        self._offset = 0
+        self._num_emitted = 0
+        self._tokens = deque()
+        self._postings = deque()
+
+
+def stream_matches(
+    matcher: StreamingEntityMatcher, tokens: Iterable[str]
+) -> Iterator[StreamedMatch]:
+    """Generate the matches (in order of their start) from a stream of tokens."""
+
+    matcher.reset()
+
+    for token in tokens:
+        yield from matcher.next_token(token)
+
+    yield from matcher.finish()
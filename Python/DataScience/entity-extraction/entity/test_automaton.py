@@ -0,0 +1,152 @@
+import os
+import random
+import shutil
+import pytest
+
+from lookup.in_memory_lookup import InMemoryLookup
+from lookup.lmdb_lookup import LmdbLookup
+
+from .automaton import ROOT_STATE, UNKNOWN_TOKEN_ID, TokenAutomaton
+
+TEST_LMDB_FOLDER = "./data/test-automaton"
+TEST_STAGING_FOLDER = "./data/test-automaton-staging"
+TEST_AUTOMATON_FILEPATH = "./data/test-automaton.bin"
+
+
+def delete_temp():
+    if os.path.exists(TEST_LMDB_FOLDER):
+        shutil.rmtree(TEST_LMDB_FOLDER)
+
+    if os.path.exists(TEST_STAGING_FOLDER):
+        shutil.rmtree(TEST_STAGING_FOLDER)
+
+    if os.path.exists(TEST_AUTOMATON_FILEPATH):
+        os.remove(TEST_AUTOMATON_FILEPATH)
+
+
+def brute_force_matches(entities, tokens):
+    """Exact matches found by comparing the tokens of every entity at every index."""
+
+    # An entity with the same tokens as a later entity isn't matched
+    entity_for_tokens = {tuple(t): entity_id for entity_id, t in entities.items()}
+
+    matches = []
+    for end in range(len(tokens)):
+        for start in range(end + 1):
+            entity_id = entity_for_tokens.get(tuple(tokens[start : end + 1]))
+            if entity_id is not None:
+                matches.append((start, end, entity_id))
+
+    return matches
+
+
+def test_token_automaton():
+    automaton = TokenAutomaton.from_entities(
+        {
+            1: "a b".split(),
+            2: "a b c".split(),
+            3: "b c".split(),
+            4: "c".split(),
+            5: "b c d e".split(),
+        }
+    )
+
+    assert automaton.num_tokens() == 5
+    assert automaton.token_id("a") == 0
+    assert automaton.token_id("e") == 4
+    assert automaton.token_id("f") == UNKNOWN_TOKEN_ID
+
+    # Index:    0 1 2 3 4
+    # Tokens:   a b c d e
+    # Matches:  ===          <-- e-1
+    #           =====        <-- e-2
+    #             ===        <-- e-3
+    #               =        <-- e-4
+    #             =======    <-- e-5
+    assert list(automaton.find_matches("a b c d e".split())) == [
+        (0, 1, 1),
+        (0, 2, 2),
+        (1, 2, 3),
+        (2, 2, 4),
+        (1, 4, 5),
+    ]
+
+    # An unknown token returns the automaton to the root state
+    assert list(automaton.find_matches("a f b c".split())) == [(2, 3, 3), (3, 3, 4)]
+    assert automaton.next_state(ROOT_STATE, UNKNOWN_TOKEN_ID) == ROOT_STATE
+    assert list(automaton.find_matches([])) == []
+
+    # An automaton without entities
+    automaton = TokenAutomaton.from_entities({})
+    assert list(automaton.find_matches("a b".split())) == []
+
+
+def test_token_automaton_random():
+    rng = random.Random(1)
+    vocabulary = [f"t{i}" for i in range(6)]
+
+    for _ in range(50):
+        entities = {
+            entity_id: rng.choices(vocabulary, k=rng.randint(1, 4))
+            for entity_id in range(rng.randint(1, 20))
+        }
+        tokens = rng.choices(vocabulary + ["x"], k=30)
+
+        automaton = TokenAutomaton.from_entities(entities)
+        assert sorted(automaton.find_matches(tokens)) == sorted(
+            brute_force_matches(entities, tokens)
+        )
+
+
+def test_token_automaton_save_load():
+    delete_temp()
+
+    entities = {10: "a b".split(), 20: "b c d".split()}
+    TokenAutomaton.from_entities(entities).save(TEST_AUTOMATON_FILEPATH)
+
+    automaton = TokenAutomaton.load(TEST_AUTOMATON_FILEPATH)
+    assert list(automaton.find_matches("a b c d".split())) == [
+        (0, 1, 10),
+        (1, 3, 20),
+    ]
+    automaton.close()
+
+    # A file that isn't an automaton can't be loaded
+    with open(TEST_AUTOMATON_FILEPATH, "wb") as fp:
+        fp.write(bytes(64))
+
+    with pytest.raises(Exception, match="Invalid automaton"):
+        TokenAutomaton.load(TEST_AUTOMATON_FILEPATH)
+
+    delete_temp()
+
+
+def test_token_automaton_from_lookup():
+    delete_temp()
+
+    entities = {0: "a b".split(), 1: "b c".split(), 2: "c".split()}
+
+    # Automaton from an in-memory lookup
+    in_memory_lookup = InMemoryLookup()
+    for entity_id, tokens in entities.items():
+        in_memory_lookup.add(entity_id, f"e-{entity_id}", tokens)
+
+    automaton = TokenAutomaton.from_lookup(in_memory_lookup)
+    expected = [(0, 1, 0), (1, 2, 1), (2, 2, 2)]
+    assert list(automaton.find_matches("a b c".split())) == expected
+
+    # Automaton from an LMDB lookup
+    lookup = LmdbLookup(TEST_LMDB_FOLDER, True, staging_folder=TEST_STAGING_FOLDER)
+    for entity_id, tokens in entities.items():
+        lookup.add(entity_id, f"e-{entity_id}", tokens)
+    lookup.finalise()
+    lookup.close()
+
+    lookup = LmdbLookup(TEST_LMDB_FOLDER, False)
+    assert sorted(lookup.entities()) == sorted(entities.items())
+
+    automaton = TokenAutomaton.from_lookup(lookup)
+    assert list(automaton.find_matches("a b c".split())) == expected
+    lookup.close()
+
+    delete_temp()
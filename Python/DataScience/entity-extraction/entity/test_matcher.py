@@ -1,4 +1,10 @@
-from entity.matcher import spans_overlap
+import random
+from entity.matcher import (
+    ProbabilisticMatch,
+    most_likely_matches,
+    most_likely_matches_reference,
+    spans_overlap,
+)
 
 
 def test_spans_overlap():
@@ -17,3 +23,49 @@ def test_spans_overlap():
     assert spans_overlap(1, 3, 2, 3)  # C, D
     assert not spans_overlap(1, 2, 5, 5)  # A, E
     assert spans_overlap(1, 2, 1, 2)  # F, A
+
+
+def test_most_likely_matches():
+    # Spans   0 1 2 3 4 5 6 7 8
+    # A (0.9)     =====
+    # B (0.8)       =====
+    # C (0.9)           =====
+    # D (0.5)                 =
+    # E (0.9)     ===
+    matches = [
+        ProbabilisticMatch(1, 3, 1, 0.9),
+        ProbabilisticMatch(2, 4, 2, 0.8),
+        ProbabilisticMatch(4, 6, 3, 0.9),
+        ProbabilisticMatch(7, 7, 4, 0.5),
+        ProbabilisticMatch(1, 2, 5, 0.9),
+    ]
+
+    # The groups aren't transitive: B overlaps C, but it is in A's group
+    assert most_likely_matches(matches) == [
+        [matches[0], matches[4]],
+        [matches[2]],
+        [matches[3]],
+    ]
+    assert most_likely_matches([]) == []
+
+
+def test_most_likely_matches_random():
+    rng = random.Random(1)
+
+    for _ in range(200):
+        matches = []
+        for _ in range(rng.randint(1, 60)):
+            start = rng.randint(0, 40)
+            end = start + rng.randint(0, 5)
+            probability = rng.choice([0.5, 0.6, 0.7, 0.8, 0.9])
+            matches.append(
+                ProbabilisticMatch(start, end, rng.randint(0, 10), probability)
+            )
+
+        actual = most_likely_matches(matches)
+        expected = most_likely_matches_reference(matches)
+
+        # The same matches in the same order
+        assert [[id(m) for m in g] for g in actual] == [
+            [id(m) for m in g] for g in expected
+        ]
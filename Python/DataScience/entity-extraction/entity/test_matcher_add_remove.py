@@ -1,10 +1,13 @@
+import numpy as np
+
+from adds_removes import adds_removes_from_flat_positions, adds_removes_from_positions
 from entity.matcher_add_remove import (
     EntityMatcherAddRemove,
-    adds_removes_from_positions,
-    subdivide_text,
+    use_sparse_kernel,
 )
 from likelihood.likelihood_add_remove import make_likelihood_add_remove_symmetric
 from lookup.in_memory_lookup import InMemoryLookup
+from lookup.postings import postings_to_bytes
 from text.tokeniser import tokenise_text
 
 
@@ -37,31 +40,47 @@ def test_adds_removes_from_positions():
         (2, 5, 1, 0),
     ]
 
+    # A token on its own is a window if no other token is within the maximum
+    # window
+    # Token index:   0 1 2 3 4 5 6 7 8 9 10
+    # Matching:      *       *   *       *
+    assert adds_removes_from_positions([0, 4, 6, 10], 2, 1, 3) == [
+        (0, 0, 0, 1),
+        (10, 10, 0, 1),
+        (4, 6, 1, 0),
+    ]
 
-def test_subdivide_test():
-    """Unit tests for subdivide_text()."""
 
-    # Text fits within a single segment
-    assert subdivide_text(8, 10, 5) == [(0, 8)]
-    assert subdivide_text(10, 10, 5) == [(0, 10)]
+def test_adds_removes_from_flat_positions():
+    """The windows of all entities match adds_removes_from_positions()."""
 
-    # Text spans two segments
-    # Token index:   0 1 2 3 4 5 6 7 8 9 10
-    # Segment 0:     =====
-    # Segment 1:       =====
-    assert subdivide_text(4, 3, 3) == [(0, 3), (1, 4)]
+    positions = [[1, 2, 4, 5], [3], [], [0, 1, 2, 7, 8], [0, 6, 9]]
+    n_entity_tokens = [3, 2, 4, 3, 2]
 
-    # Token index:   0 1 2 3 4 5 6 7 8 9 10
-    # Segment 0:     =====
-    # Segment 1:         =====
-    assert subdivide_text(5, 3, 2) == [(0, 3), (2, 5)]
+    expected = [
+        (idx, *window)
+        for idx, (pos, n_e) in enumerate(zip(positions, n_entity_tokens))
+        for window in adds_removes_from_positions(pos, n_e, 3, 4)
+    ]
 
-    # Text spans two segments
-    # Token index:   0 1 2 3 4 5 6 7 8 9 10
-    # Segment 0:     =========
-    # Segment 1:           =========
-    # Segment 2:                 =======
-    assert subdivide_text(10, 5, 3) == [(0, 5), (3, 8), (6, 10)]
+    offsets = np.cumsum([0] + [len(p) for p in positions]).astype(np.int64)
+    arrays = adds_removes_from_flat_positions(
+        offsets,
+        np.array(sum(positions, []), dtype=np.uint32),
+        np.array(n_entity_tokens, dtype=np.int64),
+        3,
+        4,
+    )
+    assert list(zip(*[a.tolist() for a in arrays])) == expected
+
+
+def test_use_sparse_kernel():
+    """Unit tests for use_sparse_kernel()."""
+
+    postings = [postings_to_bytes([1, 2]), None, postings_to_bytes([2])]
+    assert use_sparse_kernel(postings, 1000000)
+    assert not use_sparse_kernel(postings, 10)
+    assert use_sparse_kernel([None], 1)
 
 
 def test_matcher_add_remove():
@@ -85,14 +104,20 @@ def test_matcher_add_remove():
     # Make a simple likelihood function
     likelihood_symmetric = make_likelihood_add_remove_symmetric(0.2, 0.9, 0.5, 0.1)
 
-    # Instantiate the entity matcher
+    # Instantiate the entity matcher (the dense kernel is used for a small
+    # maximum entity ID and the sparse kernel for a large one)
+    for max_entity_id in [3, 1000000]:
+        check_matcher_add_remove(lookup, likelihood_symmetric, max_entity_id)
+
+
+def check_matcher_add_remove(lookup, likelihood_symmetric, max_entity_id):
     matcher = EntityMatcherAddRemove(
         lookup=lookup,
         likelihood=likelihood_symmetric,
         min_window=2,
         max_window=5,
         min_probability=0.8,
-        max_entity_id=3,
+        max_entity_id=max_entity_id,
     )
 
     for start_idx in range(240, 260):
@@ -112,3 +137,74 @@ def test_matcher_add_remove():
         assert matches[0].end == matches[0].start + 3
 
         matcher.reset()
+
+
+def test_matcher_add_remove_long_text():
+    """A long text is processed in a single call without duplicate matches."""
+
+    lookup = InMemoryLookup()
+    lookup.add(0, "100", ["78", "straight", "street", "london"])
+    lookup.add(1, "101", ["6", "the", "walk", "london"])
+
+    matcher = EntityMatcherAddRemove(
+        lookup=lookup,
+        likelihood=make_likelihood_add_remove_symmetric(0.2, 0.9, 0.5, 0.1),
+        min_window=2,
+        max_window=5,
+        min_probability=0.8,
+        max_entity_id=1,
+    )
+
+    tokens = ["a" for _ in range(3000)]
+    for start_idx in [10, 254, 1500, 2996]:
+        tokens[start_idx : start_idx + 4] = ["78", "straight", "street", "london"]
+
+    for t in tokens:
+        matcher.next_token(t)
+
+    # Calling get_matches() again doesn't duplicate the matches
+    matcher.get_matches()
+    matches = matcher.get_matches()
+
+    assert [(m.start, m.end, m.entity_id) for m in matches] == [
+        (10, 13, 0),
+        (254, 257, 0),
+        (1500, 1503, 0),
+        (2996, 2999, 0),
+    ]
+
+
+def test_matcher_add_remove_stop_tokens():
+    """Frequent tokens don't generate candidates, but still count for a match."""
+
+    lookup = InMemoryLookup()
+    lookup.add(0, "100", ["78", "straight", "street", "london"])
+    lookup.add(1, "101", ["6", "the", "walk", "london"])
+    lookup.add(2, "102", ["the", "street", "london"])
+
+    tokens = ["the", "78", "straight", "street", "london", "the", "street", "london"]
+
+    def matches(stop_token_frequency):
+        matcher = EntityMatcherAddRemove(
+            lookup=lookup,
+            likelihood=make_likelihood_add_remove_symmetric(0.2, 0.9, 0.5, 0.1),
+            min_window=2,
+            max_window=5,
+            min_probability=0.5,
+            max_entity_id=2,
+            stop_token_frequency=stop_token_frequency,
+        )
+
+        for t in tokens:
+            matcher.next_token(t)
+
+        return sorted([(m.start, m.end, m.entity_id) for m in matcher.get_matches()])
+
+    # "the", "street" and "london" are stop tokens, so entity 2 (which only has
+    # stop tokens) isn't found. Entity 0 is only found in the windows within
+    # max_window - 1 tokens of its rare tokens ("78" and "straight" at
+    # positions 1 and 2), as its other tokens are only candidates near them.
+    all_matches = matches(None)
+    assert (5, 7, 2) in all_matches
+    assert (3, 7, 0) in all_matches
+    assert matches(1) == [m for m in all_matches if m[2] == 0 and m[1] <= 6]
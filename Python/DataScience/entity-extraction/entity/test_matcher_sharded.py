@@ -0,0 +1,98 @@
+import os
+import shutil
+from entity.matcher_add_remove import EntityMatcherAddRemove
+from entity.matcher_sharded import ShardedEntityMatcher
+from likelihood.likelihood_add_remove import make_likelihood_add_remove_symmetric
+from lookup.in_memory_lookup import InMemoryLookup
+from lookup.sharded_lookup import ShardedLmdbLookup
+from text.tokeniser import tokenise_text
+
+TEST_SHARDED_FOLDER = "./data/test-sharded-matcher"
+TEST_SHARDED_STAGING_FOLDER = "./data/test-sharded-matcher-staging"
+
+
+def delete_temp():
+    for folder in [TEST_SHARDED_FOLDER, TEST_SHARDED_STAGING_FOLDER]:
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+
+def test_sharded_matcher():
+    """The sharded matcher finds the same matches as the unsharded matcher."""
+
+    delete_temp()
+
+    entities = [
+        (0, "100", "78 Straight Street London"),
+        (1, "101", "6 The Walk London"),
+        (2, "102", "10 The Mews Birmingham"),
+        (3, "103", "12 The Mews Birmingham"),
+        (4, "104", "6 The Walk Birmingham"),
+    ]
+
+    in_memory_lookup = InMemoryLookup()
+    sharded_lookup = ShardedLmdbLookup(
+        TEST_SHARDED_FOLDER,
+        True,
+        shard_size=2,
+        staging_folder=TEST_SHARDED_STAGING_FOLDER,
+    )
+
+    for internal_id, external_id, text in entities:
+        tokens = tokenise_text(text)
+        assert tokens is not None
+        in_memory_lookup.add(internal_id, external_id, tokens)
+        sharded_lookup.add(internal_id, external_id, tokens)
+
+    sharded_lookup.finalise()
+    sharded_lookup.close()
+    sharded_lookup = ShardedLmdbLookup(TEST_SHARDED_FOLDER, False)
+
+    likelihood_symmetric = make_likelihood_add_remove_symmetric(0.2, 0.9, 0.5, 0.1)
+
+    matcher = EntityMatcherAddRemove(
+        lookup=in_memory_lookup,
+        likelihood=likelihood_symmetric,
+        min_window=2,
+        max_window=5,
+        min_probability=0.5,
+        max_entity_id=4,
+    )
+
+    sharded_matcher = ShardedEntityMatcher(
+        lookup=sharded_lookup,
+        likelihood=likelihood_symmetric,
+        min_window=2,
+        max_window=5,
+        min_probability=0.5,
+    )
+
+    texts = [
+        "Visit 78 Straight Street London and 6 The Walk Birmingham",
+        "10 the mews birmingham or 12 the mews",
+        "nothing to see here",
+    ]
+
+    for text in texts:
+        tokens = tokenise_text(text)
+        assert tokens is not None
+
+        for t in tokens:
+            matcher.next_token(t)
+            sharded_matcher.next_token(t)
+
+        expected = sorted(
+            matcher.get_matches(), key=lambda m: (m.start, m.end, m.entity_id)
+        )
+        actual = sorted(
+            sharded_matcher.get_matches(), key=lambda m: (m.start, m.end, m.entity_id)
+        )
+        assert actual == expected
+        assert (len(expected) > 0) == (text != texts[-1])
+
+        matcher.reset()
+        sharded_matcher.reset()
+
+    sharded_matcher.close()
+    sharded_lookup.close()
+    delete_temp()
@@ -0,0 +1,158 @@
+from entity.matcher_add_remove import EntityMatcherAddRemove
+from entity.matcher_streaming import StreamingEntityMatcher, stream_matches
+from likelihood.likelihood_add_remove import make_likelihood_add_remove_symmetric
+from lookup.in_memory_lookup import InMemoryLookup
+from text.tokeniser import tokenise_text
+
+
+def make_lookup() -> InMemoryLookup:
+    lookup = InMemoryLookup()
+
+    entities = [
+        (0, "100", "78 Straight Street London"),
+        (1, "101", "6 The Walk London"),
+        (2, "102", "10 The Mews Birmingham"),
+        (3, "103", "12 The Mews Birmingham"),
+    ]
+
+    for internal_id, external_id, text in entities:
+        tokens = tokenise_text(text)
+        assert tokens is not None
+        lookup.add(internal_id, external_id, tokens)
+
+    return lookup
+
+
+def test_streaming_matcher():
+    """The streaming matcher finds the same matches as the batch matcher."""
+
+    lookup = make_lookup()
+    likelihood = make_likelihood_add_remove_symmetric(0.2, 0.9, 0.5, 0.1)
+
+    # Text with matches that span the boundaries of the chunks
+    tokens = ["a" for _ in range(100)]
+    for start_idx in [0, 8, 9, 30, 47, 96]:
+        tokens[start_idx : start_idx + 4] = ["78", "straight", "street", "london"]
+    tokens[60:64] = ["10", "the", "mews", "birmingham"]
+
+    matcher = EntityMatcherAddRemove(lookup, likelihood, 2, 5, 0.5, 3)
+    for t in tokens:
+        matcher.next_token(t)
+
+    expected = sorted(
+        [(m.start, m.end, m.entity_id, m.probability) for m in matcher.get_matches()]
+    )
+    assert len(expected) > 0
+
+    for chunk_size in [1, 2, 7, 10, 1000]:
+        streaming_matcher = StreamingEntityMatcher(
+            lookup, likelihood, 2, 5, 0.5, 3, chunk_size=chunk_size
+        )
+
+        actual = []
+        for m, matched_tokens in stream_matches(streaming_matcher, tokens):
+            assert matched_tokens == tokens[m.start : m.end + 1]
+            actual.append((m.start, m.end, m.entity_id, m.probability))
+
+        # The matches are generated in order of their start
+        assert actual == sorted(actual, key=lambda m: m[0])
+        assert sorted(actual) == expected
+
+
+def test_streaming_matcher_bounded_buffer():
+    """The buffer of tokens doesn't grow with the length of the stream."""
+
+    lookup = make_lookup()
+    likelihood = make_likelihood_add_remove_symmetric(0.2, 0.9, 0.5, 0.1)
+    matcher = StreamingEntityMatcher(lookup, likelihood, 2, 5, 0.5, 3, chunk_size=10)
+
+    tokens = []
+    for idx in range(10000):
+        tokens.extend(["6", "the", "walk", "london"] if idx % 100 == 0 else ["a"])
+
+    num_matches = 0
+    for t in tokens:
+        num_matches += len(matcher.next_token(t))
+        assert len(matcher._tokens) < 10 + 2 * (5 - 1)
+
+    num_matches += len(matcher.finish())
+    assert matcher.buffer_offset() == len(tokens)
+
+    batch_matcher = EntityMatcherAddRemove(lookup, likelihood, 2, 5, 0.5, 3)
+    for t in tokens:
+        batch_matcher.next_token(t)
+
+    assert num_matches == len(batch_matcher.get_matches())
+
+
+def test_streaming_matcher_single_token_windows():
+    """The single token windows don't depend on the chunk size."""
+
+    lookup = make_lookup()
+
+    # Likelihood function used by the service
+    likelihood = make_likelihood_add_remove_symmetric(0.3, 0.7, 0.9, 0.6)
+
+    # The occurrences of 'london' are too far apart to be in the same window
+    tokens = ["london"] + ["a"] * 30 + ["london"] + ["a"] * 2 + ["london"]
+
+    matcher = EntityMatcherAddRemove(lookup, likelihood, 1, 4, 0.5, 3)
+    for t in tokens:
+        matcher.next_token(t)
+
+    expected = sorted(
+        [(m.start, m.end, m.entity_id, m.probability) for m in matcher.get_matches()]
+    )
+    assert len(expected) > 0
+
+    for chunk_size in [1, 5, 31, 1000]:
+        streaming_matcher = StreamingEntityMatcher(
+            lookup, likelihood, 1, 4, 0.5, 3, chunk_size=chunk_size
+        )
+
+        actual = [
+            (m.start, m.end, m.entity_id, m.probability)
+            for m, _ in stream_matches(streaming_matcher, tokens)
+        ]
+        assert sorted(actual) == expected
+
+
+def test_streaming_matcher_stop_tokens():
+    """The streaming matcher finds the same matches as the batch matcher when
+    the stop tokens are pruned."""
+
+    lookup = make_lookup()
+    likelihood = make_likelihood_add_remove_symmetric(0.3, 0.7, 0.9, 0.6)
+
+    # "london", "the", "mews" and "birmingham" are stop tokens, which are near
+    # rare tokens in some places and far from them in others
+    tokens = ["a" for _ in range(60)]
+    tokens[3:7] = ["the", "walk", "london", "london"]
+    tokens[10:12] = ["the", "mews"]
+    tokens[14:18] = ["10", "a", "birmingham", "london"]
+    tokens[30:34] = ["london", "a", "78", "the"]
+    tokens[40:47] = ["the", "mews", "a", "a", "a", "12", "mews"]
+
+    # Each "birmingham" is a candidate for entity 3 because of the "12" three
+    # tokens away from it, which is outside the window of both occurrences
+    tokens[50:58] = ["12", "a", "a", "birmingham", "birmingham", "a", "a", "12"]
+
+    matcher = EntityMatcherAddRemove(lookup, likelihood, 1, 4, 0.5, 3, 1)
+    for t in tokens:
+        matcher.next_token(t)
+
+    expected = sorted(
+        [(m.start, m.end, m.entity_id, m.probability) for m in matcher.get_matches()]
+    )
+    assert len(expected) > 0
+
+    for chunk_size in [1, 2, 5, 7, 1000]:
+        streaming_matcher = StreamingEntityMatcher(
+            lookup, likelihood, 1, 4, 0.5, 3, chunk_size, stop_token_frequency=1
+        )
+
+        actual = [
+            (m.start, m.end, m.entity_id, m.probability)
+            for m, _ in stream_matches(streaming_matcher, tokens)
+        ]
+        assert sorted(actual) == expected
@@ -1,7 +1,11 @@
 # Entity extraction performance evaluator
 import itertools
+import numpy as np
 
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
 from domain import assert_internal_entity_id_valid
+from scipy.optimize import linear_sum_assignment
 
 
 class EntitySpan:
@@ -41,22 +45,14 @@ def error_pair(s1, s2):
     elif s1 is not None and s2 is None:
         return len(s1)
 
-    min_x = min(s1.start, s2.start)
-    max_x = max(s1.end, s2.end)
+    # An index is an error if it is in just one of the spans, or in both of
+    # them if they are of different entities
+    overlap = max(0, min(s1.end, s2.end) - max(s1.start, s2.start) + 1)
 
-    same_entity = s1.entity_id == s2.entity_id
-    total = 0
-    for i in range(min_x, max_x + 1):
-        s1_present = s1.in_span(i)
-        s2_present = s2.in_span(i)
+    if s1.entity_id == s2.entity_id:
+        return len(s1) + len(s2) - 2 * overlap
 
-        if not (
-            (not s1_present and not s2_present)
-            or (s1_present and s2_present and same_entity)
-        ):
-            total += 1
-
-    return total
+    return len(s1) + len(s2) - overlap
 
 
 def pad(spans, number):
@@ -85,8 +81,60 @@ def pairs(x, y):
     return all_pairs
 
 
+def error_matrix(ground_truth, actual) -> np.ndarray:
+    """Error between each pair of the padded ground-truth and actual spans.
+
+    Both lists are padded with None to the same length, as in calc_error.
+    """
+
+    n = max(len(ground_truth), len(actual))
+
+    def columns(spans):
+        """Start, end, length and entity ID of the spans (padded with None)."""
+        padding = n - len(spans)
+        start = np.array([s.start for s in spans] + [0] * padding, dtype=np.int64)
+        end = np.array([s.end for s in spans] + [-1] * padding, dtype=np.int64)
+        entity = np.array([s.entity_id for s in spans] + [-1] * padding)
+        return start, end, end - start + 1, entity
+
+    g_start, g_end, g_len, g_entity = columns(ground_truth)
+    a_start, a_end, a_len, a_entity = columns(actual)
+
+    # Number of indices in both spans (a padded span has a length of 0)
+    overlap = np.maximum(
+        0,
+        np.minimum.outer(g_end, a_end) - np.maximum.outer(g_start, a_start) + 1,
+    )
+
+    same_entity = np.equal.outer(g_entity, a_entity)
+    return np.add.outer(g_len, a_len) - np.where(same_entity, 2, 1) * overlap
+
+
 def calc_error(ground_truth, actual):
-    """Calculate the error between the actual and the ground-truth entities."""
+    """Calculate the error between the actual and the ground-truth entities.
+
+    This is the minimum total error over the pairings of the ground-truth and
+    actual spans (padded with None), which is found as an optimal assignment
+    (the Hungarian algorithm) in O(n^3) time rather than by trying each of the
+    n! pairings (see calc_error_permutations).
+    """
+
+    assert type(ground_truth) == list
+    assert all([type(g) == EntitySpan for g in ground_truth])
+    assert type(actual) == list
+    assert all([type(a) == EntitySpan for a in actual])
+
+    if max(len(ground_truth), len(actual)) == 0:
+        return 0
+
+    errors = error_matrix(ground_truth, actual)
+    rows, cols = linear_sum_assignment(errors)
+
+    return int(errors[rows, cols].sum())
+
+
+def calc_error_permutations(ground_truth, actual):
+    """Calculate the error by trying each pairing of the spans (reference)."""
 
     assert type(ground_truth) == list
     assert all([type(g) == EntitySpan for g in ground_truth])
@@ -97,9 +145,9 @@ def calc_error(ground_truth, actual):
     if max_number == 0:
         return 0
 
-    # Pad the lists
-    ground_truth = pad(ground_truth, max_number)
-    actual = pad(actual, max_number)
+    # Pad (copies of) the lists
+    ground_truth = pad(ground_truth[:], max_number)
+    actual = pad(actual[:], max_number)
 
     # Calculate the error for all possible pairings
     errors = []
@@ -112,3 +160,34 @@ def calc_error(ground_truth, actual):
 
     # Return the minimum error
     return min(errors)
+
+
+# A document as its ground-truth entity spans and actual entity spans
+Document = Tuple[List[EntitySpan], List[EntitySpan]]
+
+
+def calc_document_error(document: Document) -> int:
+    """Calculate the error for a document."""
+
+    ground_truth, actual = document
+    return calc_error(ground_truth, actual)
+
+
+def calc_errors(
+    documents: List[Document], num_workers: int = 0, chunk_size: int = 100
+) -> List[int]:
+    """Calculate the error for each of the documents.
+
+    The documents are scored in chunks by a pool of worker processes (or in
+    this process if num_workers is 0).
+    """
+
+    assert type(documents) == list
+    assert type(num_workers) == int and num_workers >= 0
+    assert type(chunk_size) == int and chunk_size > 0
+
+    if num_workers == 0:
+        return [calc_document_error(d) for d in documents]
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        return list(executor.map(calc_document_error, documents, chunksize=chunk_size))
@@ -1,3 +1,4 @@
+import random
 from .evaluator import *
 
 
@@ -187,3 +188,51 @@ def test_calc_error():
     ]
     actual = [EntitySpan(2, 4, 1), EntitySpan(6, 7, 2)]
     assert calc_error(ground_truth, actual) == 5
+
+
+def random_spans(rng, n):
+    """Random entity spans (which may overlap)."""
+
+    spans = []
+    for _ in range(n):
+        start = rng.randint(0, 20)
+        spans.append(EntitySpan(start, start + rng.randint(0, 4), rng.randint(0, 3)))
+
+    return spans
+
+
+def test_calc_error_random():
+    rng = random.Random(1)
+
+    for _ in range(300):
+        ground_truth = random_spans(rng, rng.randint(0, 5))
+        actual = random_spans(rng, rng.randint(0, 5))
+
+        assert calc_error(ground_truth, actual) == calc_error_permutations(
+            ground_truth, actual
+        )
+
+    # The lists of spans aren't padded in place
+    ground_truth = [EntitySpan(1, 3, 1)]
+    actual = [EntitySpan(1, 3, 1), EntitySpan(5, 6, 2)]
+    assert calc_error(ground_truth, actual) == 2
+    assert calc_error_permutations(ground_truth, actual) == 2
+    assert len(ground_truth) == 1
+
+    # Many spans
+    ground_truth = [EntitySpan(3 * i, 3 * i + 1, i) for i in range(200)]
+    actual = [EntitySpan(3 * i + 1, 3 * i + 1, i) for i in range(200)]
+    assert calc_error(ground_truth, actual) == 200
+
+
+def test_calc_errors():
+    rng = random.Random(2)
+    documents = [
+        (random_spans(rng, rng.randint(0, 4)), random_spans(rng, rng.randint(0, 4)))
+        for _ in range(50)
+    ]
+    expected = [calc_error_permutations(g, a) for g, a in documents]
+
+    assert calc_errors(documents) == expected
+    assert calc_errors(documents, num_workers=2, chunk_size=8) == expected
+    assert calc_errors([], num_workers=2) == []
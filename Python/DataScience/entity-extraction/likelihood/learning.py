@@ -0,0 +1,552 @@
+# Dataset and error function for learning the parameters of the likelihood
+# function (see 09_learn_parameters.py).
+#
+# Each sample of the dataset is an entity whose tokens have been mutated and
+# the entities that match the mutated tokens, with the number of tokens added
+# and removed relative to each of them. The dataset is held in columns (one
+# row per matching entity) so that the error for a set of parameters can be
+# calculated over all of the samples in one pass.
+import json
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from domain import Tokens, assert_tokens_valid
+from lookup.lmdb_lookup import LmdbLookup, items_per_second
+from lookup.lookup import Lookup
+
+# Columns of the dataset with one row per matching entity and their data types
+ROW_COLUMNS = {
+    "entity": np.dtype("<i8"),  # Internal ID of the matching entity
+    "n_adds": np.dtype("<i4"),  # Number of tokens added
+    "n_removes": np.dtype("<i4"),  # Number of tokens removed
+    "n_e": np.dtype("<i4"),  # Number of tokens of the expected entity
+}
+
+# Columns of the dataset with one row per sample and their data types
+SAMPLE_COLUMNS = {
+    "expected_entity": np.dtype("<i8"),  # Internal ID of the mutated entity
+    "n_rows": np.dtype("<i4"),  # Number of matching entities
+}
+
+# File (written last) holding the parameters used to build the dataset
+METADATA_FILENAME = "metadata.json"
+
+# Lookup used by a worker process to build the samples
+worker_lookup: Optional[LmdbLookup] = None
+
+
+def mutate(tokens: Tokens, min_tokens: int) -> Tokens:
+    """Mutate tokens by adding and removing tokens."""
+
+    assert_tokens_valid(tokens)
+    assert type(min_tokens) == int and min_tokens > 0
+
+    # Make a copy of the tokens
+    mutated_tokens = tokens[:]
+
+    # Number of tokens to remove
+    max_tokens_to_remove = max(0, len(mutated_tokens) - 3)
+    n_tokens_to_remove = random.randint(0, max_tokens_to_remove)
+
+    # Remove tokens at random
+    for _ in range(n_tokens_to_remove):
+        idx = random.randint(0, len(mutated_tokens) - 1)
+        del mutated_tokens[idx]
+
+    # Number of tokens to add
+    n_tokens_to_add = random.randint(0, 2)
+
+    # Add tokens at random
+    for i in range(n_tokens_to_add):
+        idx = random.randint(1, len(mutated_tokens) - 1)
+        mutated_tokens.insert(idx, f"--({i})--")
+
+    assert_tokens_valid(mutated_tokens)
+    return mutated_tokens
+
+
+def num_adds_removes(tokens: Tokens, entity: Tokens) -> Tuple[int, int]:
+    """Number of tokens added and removed."""
+
+    assert_tokens_valid(tokens)
+    assert_tokens_valid(entity)
+
+    set_tokens = set(tokens)  # Set of tokens in the text
+    set_entity = set(entity)  # Set of tokens in the entity
+
+    n_adds = len(set_tokens.difference(set_entity))
+    n_removes = len(set_entity.difference(set_tokens))
+
+    return n_adds, n_removes
+
+
+def entity_matches(
+    tokens: Tokens, lookup: Lookup, min_count: int
+) -> List[Tuple[int, int, int]]:
+    """Returns the number of adds and removes for a given list of tokens."""
+
+    assert_tokens_valid(tokens)
+    assert isinstance(lookup, Lookup)
+    assert type(min_count) == int and min_count > 0
+
+    # Dict of all entity IDs given the tokens to their count
+    entity_id_to_count: Dict[int, int] = dict()
+    for token in tokens:
+        entities = lookup.entity_ids_for_token(token)
+        if entities is None:
+            continue
+
+        for entity_id in entities:
+            if entity_id in entity_id_to_count:
+                entity_id_to_count[entity_id] += 1
+            else:
+                entity_id_to_count[entity_id] = 1
+
+    assert len(entity_id_to_count) > 0
+
+    # Walk through each matching entity and count the number of adds and removes
+    result = []
+    for entity_id, count in entity_id_to_count.items():
+        if count < min_count:
+            continue
+
+        entity_tokens = lookup.tokens_for_entity(entity_id)
+        assert entity_tokens is not None
+
+        n_adds, n_removes = num_adds_removes(tokens, entity_tokens)
+        result.append((entity_id, n_adds, n_removes))
+
+    return result
+
+
+def calc_error(
+    expected_entity: int,
+    n_tokens_expected_entity: int,
+    entity_matches: List[Tuple[int, int, int]],
+    likelihood: Callable[[float, float], float],
+) -> float:
+    """Calculate the error."""
+
+    # Calculate the likelihood of each entity
+    likelihoods = {}
+    for entity_id, n_adds, n_removes in entity_matches:
+        likelihoods[entity_id] = likelihood(
+            n_adds / n_tokens_expected_entity, n_removes / n_tokens_expected_entity
+        )
+
+    assert (
+        expected_entity in likelihoods
+    ), f"Failed to find expected entity {expected_entity} in likelihoods"
+    expected_entity_prob = likelihoods[expected_entity]
+
+    # Number of entities with a higher likelihood than the expected entity
+    n_higher = 0
+    n_equal = 0
+    n_lower = 0
+
+    for actual_entity, prob in likelihoods.items():
+        if actual_entity == expected_entity:
+            continue
+
+        if prob > expected_entity_prob:
+            n_higher += 1
+        elif prob < expected_entity_prob:
+            n_lower += 1
+        else:
+            n_equal += 1
+
+    return 2 * n_higher + n_equal
+
+
+def linear(x0, y0, x1, y1, x):
+    # To avoid floating point rounding issues
+    if x == x0:
+        return y0
+    elif x == x1:
+        return y1
+
+    return ((y1 - y0) / (x1 - x0)) * (x - x0) + y0
+
+
+def sorted_points(x: List[float], y: List[float]) -> Tuple[List[float], List[float]]:
+    """Check the points of a piecewise linear function and sort them by x."""
+
+    assert len(x) > 0
+    assert len(x) == len(y), f"differing lengths: {len(x)} vs {len(y)}"
+    assert all([0.0 <= xi <= 1.0 for xi in x]), f"invalid x positions: {x}"
+    assert all([0.0 <= yi <= 1.0 for yi in y]), f"invalid y positions: {y}"
+
+    # Allow the x positions to be unsorted
+    pairs = [(x[i], y[i]) for i in range(len(x))]
+    pairs = sorted(pairs, key=lambda y: y[0])
+
+    return [xi for xi, _ in pairs], [yi for _, yi in pairs]
+
+
+def build_likelihood_function(
+    x: List[float], y: List[float]
+) -> Callable[[float, float], float]:
+    """Build a symmetric likelihood function."""
+
+    x, y = sorted_points(x, y)
+
+    def f(prop: float) -> float:
+        """Piecewise linear function."""
+
+        # Ensure the proportion doesn't exceed 1
+        prop = min(prop, 1.0)
+
+        if prop < x[0]:
+            return linear(0, 1, x[0], y[0], prop)
+        elif prop >= x[-1]:
+            return linear(x[-1], y[-1], 1, 0, prop)
+
+        for i in range(len(x) - 1):
+            if x[i] <= prop < x[i + 1]:
+                return linear(x[i], y[i], x[i + 1], y[i + 1], prop)
+
+        return -1.0
+
+    def likelihood(prop_adds: float, prop_removes: float) -> float:
+        p_adds = f(prop_adds)
+        assert p_adds >= 0.0, f"p_adds={p_adds}"
+
+        p_removes = f(prop_removes)
+        assert p_removes >= 0.0, f"p_removes={p_removes}"
+
+        return p_adds * p_removes
+
+    return likelihood
+
+
+def piecewise_linear(x: List[float], y: List[float], props: np.ndarray) -> np.ndarray:
+    """Piecewise linear function of build_likelihood_function() for an array.
+
+    The values are identical to those of the scalar function.
+    """
+
+    x, y = sorted_points(x, y)
+
+    # Ensure the proportions don't exceed 1
+    props = np.minimum(props, 1.0)
+
+    # The function runs from (0, 1) through the points to (1, 0) and the
+    # segment for a proportion starts at the last point at or below it
+    knots_x = np.array([0.0] + x + [1.0])
+    knots_y = np.array([1.0] + y + [0.0])
+    segment = np.searchsorted(np.array(x), props, side="right")
+
+    x0 = knots_x[segment]
+    y0 = knots_y[segment]
+    x1 = knots_x[segment + 1]
+    y1 = knots_y[segment + 1]
+
+    # The same floating point operations as linear() (a segment of zero width
+    # is only used at one of its ends)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = ((y1 - y0) / (x1 - x0)) * (props - x0) + y0
+
+    values = np.where(props == x1, y1, values)
+    return np.where(props == x0, y0, values)
+
+
+def sample_columns(
+    lookup: Lookup, n_samples: int, min_tokens: int, min_count: int
+) -> Dict[str, np.ndarray]:
+    """Build the columns of n_samples samples using the lookup."""
+
+    assert isinstance(lookup, Lookup)
+    assert type(n_samples) == int and n_samples > 0
+
+    # Maximum internal entity ID
+    max_entity_id = lookup.max_entity_id()
+    assert max_entity_id > 0
+
+    rows: Dict[str, List[int]] = {name: [] for name in ROW_COLUMNS}
+    samples: Dict[str, List[int]] = {name: [] for name in SAMPLE_COLUMNS}
+
+    for _ in range(n_samples):
+
+        # Entity to mutate (note that an entity can be selected more than once)
+        entity_id = random.randint(0, max_entity_id)
+        tokens = lookup.tokens_for_entity(entity_id)
+        assert tokens is not None, f"no tokens for entity with ID={entity_id}"
+
+        # Find the number of adds and removes for the matching entities
+        matches = entity_matches(mutate(tokens, min_tokens), lookup, min_count)
+        assert entity_id in [
+            m[0] for m in matches
+        ], f"Entity {entity_id} is not included in the matches"
+
+        for matched_entity_id, n_adds, n_removes in matches:
+            rows["entity"].append(matched_entity_id)
+            rows["n_adds"].append(n_adds)
+            rows["n_removes"].append(n_removes)
+            rows["n_e"].append(len(tokens))
+
+        samples["expected_entity"].append(entity_id)
+        samples["n_rows"].append(len(matches))
+
+    columns = {
+        name: np.array(values, dtype=ROW_COLUMNS[name]) for name, values in rows.items()
+    }
+    columns.update(
+        {
+            name: np.array(values, dtype=SAMPLE_COLUMNS[name])
+            for name, values in samples.items()
+        }
+    )
+
+    return columns
+
+
+def initialise_worker_lookup(lmdb_folder: str) -> None:
+    """Open the lookup (in a worker process) for building the samples."""
+
+    global worker_lookup
+
+    worker_lookup = LmdbLookup(lmdb_folder, False)
+
+
+def build_batch(
+    seed: str, n_samples: int, min_tokens: int, min_count: int
+) -> Dict[str, np.ndarray]:
+    """Build a batch of samples (in a worker process) from its own seed."""
+
+    assert worker_lookup is not None
+
+    random.seed(seed)
+    return sample_columns(worker_lookup, n_samples, min_tokens, min_count)
+
+
+def build_training_data(
+    lmdb_folder: str,
+    folder: str,
+    n_samples: int,
+    min_tokens: int,
+    min_count: int,
+    seed: int = 0,
+    num_workers: int = 1,
+    batch_size: int = 1000,
+) -> bool:
+    """Build a dataset of n_samples samples in the folder using the lookup.
+
+    The batches of samples are built by a pool of worker processes. Each batch
+    is seeded from the seed and its index, so the dataset doesn't depend on
+    the number of workers. If the folder already holds a dataset built with
+    the same parameters, it is reused. Returns True if the dataset was built.
+    """
+
+    assert type(lmdb_folder) == str
+    assert type(folder) == str
+    assert type(n_samples) == int and n_samples > 0
+    assert type(min_tokens) == int and min_tokens > 0
+    assert type(min_count) == int and min_count > 0
+    assert type(seed) == int
+    assert type(num_workers) == int and num_workers > 0
+    assert type(batch_size) == int and batch_size > 0
+
+    # The lookup is part of the parameters so that the dataset is rebuilt if
+    # the lookup has been rebuilt
+    parameters = {
+        "lmdb_folder": os.path.abspath(lmdb_folder),
+        "lookup_modified": os.path.getmtime(os.path.join(lmdb_folder, "data.mdb")),
+        "n_samples": n_samples,
+        "min_tokens": min_tokens,
+        "min_count": min_count,
+        "seed": seed,
+        "batch_size": batch_size,
+    }
+
+    metadata_filepath = os.path.join(folder, METADATA_FILENAME)
+    if os.path.exists(metadata_filepath):
+        with open(metadata_filepath) as fp:
+            if json.load(fp)["parameters"] == parameters:
+                logger.info(f"Using the cached dataset in {folder}")
+                return False
+
+        os.remove(metadata_filepath)
+
+    os.makedirs(folder, exist_ok=True)
+    logger.info(f"Building dataset with {n_samples} samples in {folder}")
+
+    batches = [
+        min(batch_size, n_samples - start) for start in range(0, n_samples, batch_size)
+    ]
+
+    # Each column is written to its own file, appending each batch in turn
+    files = {
+        name: open(os.path.join(folder, f"{name}.bin"), "wb")
+        for name in list(ROW_COLUMNS) + list(SAMPLE_COLUMNS)
+    }
+
+    n_rows = 0
+    num_samples_built = 0
+    start_time = datetime.now()
+
+    try:
+        # The worker processes are spawned so that they don't inherit an LMDB
+        # environment
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initialise_worker_lookup,
+            initargs=(lmdb_folder,),
+        ) as executor:
+            results = executor.map(
+                build_batch,
+                [f"{seed}-{idx}" for idx in range(len(batches))],
+                batches,
+                [min_tokens] * len(batches),
+                [min_count] * len(batches),
+            )
+
+            for columns in results:
+                for name, values in columns.items():
+                    files[name].write(values.tobytes())
+
+                n_rows += len(columns["entity"])
+                num_samples_built += len(columns["expected_entity"])
+                logger.info(f"Built {num_samples_built} of {n_samples} samples")
+    finally:
+        for fp in files.values():
+            fp.close()
+
+    time_diff = (datetime.now() - start_time).total_seconds()
+    logger.info(
+        f"Built {n_samples} samples in {time_diff} seconds ({items_per_second(n_samples, time_diff)} samples/s)"
+    )
+
+    # The metadata is written last, so that an incomplete dataset isn't used
+    with open(metadata_filepath, "w") as fp:
+        json.dump(
+            {"parameters": parameters, "n_samples": n_samples, "n_rows": n_rows}, fp
+        )
+
+    return True
+
+
+class TrainingData:
+    """Dataset for learning the parameters of the likelihood function."""
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        assert set(columns) == set(ROW_COLUMNS) | set(SAMPLE_COLUMNS)
+
+        self.entity = columns["entity"]
+        self.n_adds = columns["n_adds"]
+        self.n_removes = columns["n_removes"]
+        self.n_e = columns["n_e"]
+        self.expected_entity = columns["expected_entity"]
+
+        n_rows = columns["n_rows"]
+        assert len(self.entity) == int(n_rows.sum())
+
+        # First row of each sample
+        self.offsets = np.concatenate([[0], np.cumsum(n_rows)])
+
+        # Sample of each row
+        self.sample = np.repeat(np.arange(len(n_rows)), n_rows)
+
+        # Row of the expected entity of each sample (an entity appears at most
+        # once in the matches of a sample)
+        self.expected_row = np.flatnonzero(
+            self.entity == self.expected_entity[self.sample]
+        )
+        assert len(self.expected_row) == len(n_rows)
+
+        # The likelihood is a function of the proportions of tokens added and
+        # removed, which take few distinct values, so each distinct value is
+        # only evaluated once
+        props = np.concatenate([self.n_adds / self.n_e, self.n_removes / self.n_e])
+        self.proportions, inverse = np.unique(props, return_inverse=True)
+        self.adds_index = inverse[: len(self.entity)]
+        self.removes_index = inverse[len(self.entity) :]
+
+    @staticmethod
+    def load(folder: str) -> "TrainingData":
+        """Load the dataset built by build_training_data()."""
+
+        metadata_filepath = os.path.join(folder, METADATA_FILENAME)
+        if not os.path.exists(metadata_filepath):
+            raise Exception(f"Dataset not found in {folder}")
+
+        logger.info(f"Loading dataset from folder: {folder}")
+
+        # The columns are memory-mapped (an empty file can't be mapped)
+        columns = {}
+        for name, dtype in (ROW_COLUMNS | SAMPLE_COLUMNS).items():
+            filepath = os.path.join(folder, f"{name}.bin")
+            if os.path.getsize(filepath) == 0:
+                columns[name] = np.zeros(0, dtype=dtype)
+            else:
+                columns[name] = np.memmap(filepath, dtype=dtype, mode="r")
+
+        return TrainingData(columns)
+
+    def num_samples(self) -> int:
+        """Number of samples in the dataset."""
+        return len(self.expected_entity)
+
+    def sample_matches(self, idx: int) -> List[Tuple[int, int, int]]:
+        """Matching entities with their number of adds and removes for a sample."""
+
+        rows = slice(self.offsets[idx], self.offsets[idx + 1])
+        return list(
+            zip(
+                self.entity[rows].tolist(),
+                self.n_adds[rows].tolist(),
+                self.n_removes[rows].tolist(),
+            )
+        )
+
+    def likelihoods(self, likelihood: Callable[[float, float], float]) -> np.ndarray:
+        """Likelihood of each row given a likelihood function."""
+
+        # Evaluate the function once for each distinct pair of proportions
+        pairs = self.adds_index * len(self.proportions) + self.removes_index
+        distinct, inverse = np.unique(pairs, return_inverse=True)
+        values = np.array(
+            [
+                likelihood(
+                    float(self.proportions[p // len(self.proportions)]),
+                    float(self.proportions[p % len(self.proportions)]),
+                )
+                for p in distinct.tolist()
+            ]
+        )
+
+        return values[inverse]
+
+    def piecewise_likelihoods(self, x: List[float], y: List[float]) -> np.ndarray:
+        """Likelihood of each row given the points of the likelihood function."""
+
+        values = piecewise_linear(x, y, self.proportions)
+        assert np.all(values >= 0.0), f"negative likelihood for x={x}, y={y}"
+
+        return values[self.adds_index] * values[self.removes_index]
+
+    def sample_errors(self, likelihoods: np.ndarray) -> np.ndarray:
+        """Error of each sample given the likelihood of each row (see calc_error)."""
+
+        assert len(likelihoods) == len(self.entity)
+
+        # Each entity with a higher likelihood than the expected entity scores
+        # 2 and each with an equal likelihood scores 1 (the expected entity
+        # itself is removed afterwards)
+        expected = likelihoods[self.expected_row][self.sample]
+        scores = 2 * (likelihoods > expected) + (likelihoods == expected)
+
+        errors = np.bincount(self.sample, weights=scores, minlength=self.num_samples())
+        return errors - 1
+
+    def total_error(self, x: List[float], y: List[float]) -> float:
+        """Total error given the points of the likelihood function."""
+
+        return float(self.sample_errors(self.piecewise_likelihoods(x, y)).sum())
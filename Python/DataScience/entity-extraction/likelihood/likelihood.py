@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
 from functools import lru_cache
 import math
-from typing import Tuple
+from typing import List, Tuple
 
+import numpy as np
 from domain import Tokens, assert_probability_valid, assert_tokens_valid
+from lookup.token_dictionary import TokenIds, token_set_counts
 
 
 class LikelihoodFunction(ABC):
@@ -12,6 +14,31 @@ class LikelihoodFunction(ABC):
         """Calculate the likelihood of the actual tokens given the entity tokens."""
         pass
 
+    def calc_token_ids_batch(
+        self, actual_token_ids: List[TokenIds], entity_token_ids: List[TokenIds]
+    ) -> np.ndarray:
+        """Calculate the likelihoods of pairs of actual and entity token IDs."""
+
+        n_present, n_missing, n_added = token_set_counts(
+            actual_token_ids, entity_token_ids
+        )
+        n_entity = np.array([len(t) for t in entity_token_ids], dtype=np.int64)
+
+        return self.calc_counts_batch(n_present, n_missing, n_added, n_entity)
+
+    @abstractmethod
+    def calc_counts_batch(
+        self,
+        n_present: np.ndarray,
+        n_missing: np.ndarray,
+        n_added: np.ndarray,
+        n_entity: np.ndarray,
+    ) -> np.ndarray:
+        """Calculate the likelihoods given arrays of the numbers of distinct
+        entity tokens present and missing, the number of distinct tokens added
+        and the number of entity tokens."""
+        pass
+
 
 class LikelihoodFunctionProbMissing(LikelihoodFunction):
     def __init__(self, p_m: float):
@@ -36,6 +63,17 @@ class LikelihoodFunctionProbMissing(LikelihoodFunction):
 
         return p
 
+    def calc_counts_batch(
+        self,
+        n_present: np.ndarray,
+        n_missing: np.ndarray,
+        n_added: np.ndarray,
+        n_entity: np.ndarray,
+    ) -> np.ndarray:
+        """Calculate the likelihoods given arrays of the token counts."""
+
+        return ((1 - self._p_m) ** n_present) * (self._p_m**n_missing)
+
 
 class LikelihoodFunctionLogistic(LikelihoodFunction):
     """Calculate the likelihood p(T|E) using a logistic function."""
@@ -61,6 +99,22 @@ class LikelihoodFunctionLogistic(LikelihoodFunction):
         # Probability
         return self._calc_prob(prop)
 
+    def calc_counts_batch(
+        self,
+        n_present: np.ndarray,
+        n_missing: np.ndarray,
+        n_added: np.ndarray,
+        n_entity: np.ndarray,
+    ) -> np.ndarray:
+        """Calculate the likelihoods given arrays of the token counts."""
+
+        prop = n_present / n_entity
+        y = 1 / (1 + np.exp(-self._k * (prop - self._x0)))
+
+        y[prop == 1.0] = 1.0
+        y[prop == 0.0] = 0.0
+        return y
+
     @lru_cache(maxsize=100)
     def _calc_prob(self, prop: float) -> float:
         """Calculate the probability of the proportion of tokens."""
@@ -1,5 +1,7 @@
 from functools import lru_cache, partial
-from typing import Callable, Tuple
+from typing import Callable, Optional, Tuple
+
+import numpy as np
 from domain import Tokens, assert_probability_valid, assert_tokens_valid
 from likelihood.likelihood import LikelihoodFunction
 from likelihood.piecewise_linear import piecewise_likelihood
@@ -47,6 +49,7 @@ class LikelihoodFunctionAddRemove(LikelihoodFunction):
             ]
             for n_tokens in range(1, self._n_max + 1)
         ]
+        self._table = np.array(self._lookup, dtype=np.float64)
 
     def calc(self, actual_tokens: Tokens, entity_tokens: Tokens) -> float:
         """Calculate the likelihood of the actual_tokens given the entity_tokens."""
@@ -56,6 +59,17 @@ class LikelihoodFunctionAddRemove(LikelihoodFunction):
         )
         return self._calc_prob_using_lookup(len(entity_tokens), num_adds, num_removes)
 
+    def calc_counts_batch(
+        self,
+        n_present: np.ndarray,
+        n_missing: np.ndarray,
+        n_added: np.ndarray,
+        n_entity: np.ndarray,
+    ) -> np.ndarray:
+        """Calculate the likelihoods given arrays of the token counts."""
+
+        return self._table[n_entity - 1, n_added, n_missing]
+
     def _calc_prob_using_lookup(
         self, n_tokens: int, n_additions: int, n_removals: int
     ) -> float:
@@ -103,6 +117,10 @@ class LikelihoodAddRemoveFn:
         self._likelihood_add = likelihood_add
         self._likelihood_remove = likelihood_remove
 
+        # Table of the likelihoods indexed by [n_adds, n_removes, n_e] (grown
+        # as required)
+        self._table: Optional[np.ndarray] = None
+
     @lru_cache(maxsize=100)
     def calc(self, n_adds: int, n_removes: int, n_e: int) -> float:
         """Calculate the likelihood."""
@@ -111,6 +129,50 @@ class LikelihoodAddRemoveFn:
             n_removes / n_e
         )
 
+    def table(self, max_adds: int, max_n_e: int) -> np.ndarray:
+        """Table of the likelihoods indexed by [n_adds, n_removes, n_e].
+
+        The table covers at least 0 <= n_adds <= max_adds and
+        0 <= n_removes <= n_e <= max_n_e (the likelihood is 0 for n_e = 0).
+        """
+
+        assert type(max_adds) == int and max_adds >= 0
+        assert type(max_n_e) == int and max_n_e >= 0
+
+        if (
+            self._table is not None
+            and self._table.shape[0] > max_adds
+            and self._table.shape[2] > max_n_e
+        ):
+            return self._table
+
+        # Grow the table to cover the existing and the requested sizes
+        if self._table is not None:
+            max_adds = max(max_adds, self._table.shape[0] - 1)
+            max_n_e = max(max_n_e, self._table.shape[2] - 1)
+
+        table = np.zeros((max_adds + 1, max_n_e + 1, max_n_e + 1), dtype=np.float64)
+        for n_e in range(1, max_n_e + 1):
+            for n_adds in range(max_adds + 1):
+                for n_removes in range(n_e + 1):
+                    table[n_adds, n_removes, n_e] = self._likelihood_add(
+                        n_adds / n_e
+                    ) * self._likelihood_remove(n_removes / n_e)
+
+        self._table = table
+        return table
+
+    def calc_batch(
+        self, n_adds: np.ndarray, n_removes: np.ndarray, n_e: np.ndarray
+    ) -> np.ndarray:
+        """Calculate the likelihoods of arrays of windows (with one gather)."""
+
+        if len(n_e) == 0:
+            return np.zeros(0, dtype=np.float64)
+
+        table = self.table(int(n_adds.max()), int(n_e.max()))
+        return table[n_adds, n_removes, n_e]
+
     def min_count(self, min_window: int, min_prob: float) -> int:
         assert type(min_window) == int and min_window > 0
         assert_probability_valid(min_prob)
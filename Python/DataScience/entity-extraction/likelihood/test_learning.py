@@ -0,0 +1,140 @@
+import os
+import random
+import shutil
+import numpy as np
+
+from lookup.lmdb_lookup import LmdbLookup
+
+from .learning import (
+    TrainingData,
+    build_likelihood_function,
+    build_training_data,
+    calc_error,
+    linear,
+    piecewise_linear,
+)
+
+TEST_LMDB_FOLDER = "./data/test-learning"
+TEST_STAGING_FOLDER = "./data/test-learning-staging"
+TEST_DATASET_FOLDER = "./data/test-learning-dataset"
+TEST_DATASET_FOLDER_2 = "./data/test-learning-dataset-2"
+
+
+def delete_temp():
+    for folder in [
+        TEST_LMDB_FOLDER,
+        TEST_STAGING_FOLDER,
+        TEST_DATASET_FOLDER,
+        TEST_DATASET_FOLDER_2,
+    ]:
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+
+def make_lookup():
+    """Make an LMDB lookup of entities that share some of their tokens."""
+
+    rng = random.Random(1)
+    vocabulary = [f"t{i}" for i in range(12)]
+
+    lookup = LmdbLookup(TEST_LMDB_FOLDER, True, staging_folder=TEST_STAGING_FOLDER)
+    for entity_id in range(50):
+        tokens = rng.sample(vocabulary, rng.randint(3, 6))
+        lookup.add(entity_id, f"e-{entity_id}", tokens)
+
+    lookup.finalise()
+    lookup.close()
+
+
+def test_piecewise_linear():
+    props = np.array([0.0, 0.1, 0.25, 0.3, 0.5, 2 / 3, 0.7, 0.9, 1.0, 1.5])
+
+    for x, y in [
+        ([0.3, 0.7], [0.7, 0.5]),
+        ([0.7, 0.3], [0.5, 0.7]),
+        ([0.25, 0.5, 0.75], [0.6, 0.5, 0.5]),
+        ([0.0, 1.0], [0.8, 0.2]),
+        ([0.5, 0.5], [0.6, 0.4]),
+    ]:
+        likelihood = build_likelihood_function(x, y)
+        expected = [likelihood(p, 0.0) for p in props.tolist()]
+        f_zero = piecewise_linear(x, y, np.zeros(len(props)))
+        assert (piecewise_linear(x, y, props) * f_zero).tolist() == expected
+
+
+def test_training_data():
+    delete_temp()
+    make_lookup()
+
+    # The dataset doesn't depend on the number of workers
+    assert build_training_data(
+        TEST_LMDB_FOLDER, TEST_DATASET_FOLDER, 40, 3, 2, seed=3, batch_size=7
+    )
+    assert build_training_data(
+        TEST_LMDB_FOLDER,
+        TEST_DATASET_FOLDER_2,
+        40,
+        3,
+        2,
+        seed=3,
+        num_workers=2,
+        batch_size=7,
+    )
+
+    dataset = TrainingData.load(TEST_DATASET_FOLDER)
+    dataset_2 = TrainingData.load(TEST_DATASET_FOLDER_2)
+    assert dataset.num_samples() == 40
+    assert np.array_equal(dataset.entity, dataset_2.entity)
+    assert np.array_equal(dataset.n_adds, dataset_2.n_adds)
+    assert np.array_equal(dataset.expected_entity, dataset_2.expected_entity)
+
+    # A dataset built with the same parameters is reused
+    assert not build_training_data(
+        TEST_LMDB_FOLDER, TEST_DATASET_FOLDER, 40, 3, 2, seed=3, batch_size=7
+    )
+    assert build_training_data(
+        TEST_LMDB_FOLDER, TEST_DATASET_FOLDER, 40, 3, 2, seed=4, batch_size=7
+    )
+
+    # The errors are the same as those calculated for each sample in turn
+    dataset = TrainingData.load(TEST_DATASET_FOLDER)
+    for x, y in [
+        ([0.3, 0.7], [0.7, 0.5]),
+        ([0.25, 0.5, 0.75], [0.6, 0.5, 0.5]),
+        ([0.1, 1.0], [0.9, 0.0]),
+    ]:
+        likelihood = build_likelihood_function(x, y)
+        expected = [
+            calc_error(
+                int(dataset.expected_entity[idx]),
+                int(dataset.n_e[dataset.offsets[idx]]),
+                dataset.sample_matches(idx),
+                likelihood,
+            )
+            for idx in range(dataset.num_samples())
+        ]
+
+        assert dataset.sample_errors(dataset.piecewise_likelihoods(x, y)).tolist() == (
+            expected
+        )
+        assert dataset.total_error(x, y) == sum(expected)
+
+    # Errors given a likelihood function
+    def linear_likelihood(prop_adds, prop_removes):
+        return linear(0.0, 1.0, 1.0, 0.0, prop_adds) * linear(
+            0.0, 1.0, 1.0, 0.0, prop_removes
+        )
+
+    expected = [
+        calc_error(
+            int(dataset.expected_entity[idx]),
+            int(dataset.n_e[dataset.offsets[idx]]),
+            dataset.sample_matches(idx),
+            linear_likelihood,
+        )
+        for idx in range(dataset.num_samples())
+    ]
+    errors = dataset.sample_errors(dataset.likelihoods(linear_likelihood))
+    assert errors.tolist() == expected
+
+    delete_temp()
@@ -1,4 +1,11 @@
-from .likelihood import LikelihoodFunctionProbMissing
+import random
+
+import numpy as np
+
+from lookup.token_dictionary import TokenDictionary
+
+from .likelihood import LikelihoodFunctionLogistic, LikelihoodFunctionProbMissing
+from .likelihood_add_remove import make_likelihood_symmetric
 
 
 def test_likelihood_missing_prob():
@@ -21,3 +28,31 @@ def test_likelihood_missing_prob():
 
     # Two missing
     assert is_close(likelihood.calc(["A"], ["A", "B", "C"]), (1 - p_m) * p_m**2)
+
+
+def test_calc_token_ids_batch():
+    """The likelihoods of token IDs match those of the tokens."""
+
+    rng = random.Random(1)
+    vocabulary = ["A", "B", "C", "D", "E"]
+
+    pairs = []
+    for _ in range(50):
+        entity = rng.sample(vocabulary, rng.randint(1, 4))
+        actual = rng.sample(vocabulary, rng.randint(1, 4)) + ["X"]
+        pairs.append((actual, entity))
+
+    dictionary = TokenDictionary()
+    entity_token_ids = [dictionary.encode(entity) for _, entity in pairs]
+    actual_token_ids = [dictionary.encode_text(actual) for actual, _ in pairs]
+
+    for likelihood in [
+        LikelihoodFunctionProbMissing(0.2),
+        LikelihoodFunctionLogistic(10.0, 0.5),
+        make_likelihood_symmetric(0.2, 0.5, 0.5, 0.1, 10),
+    ]:
+        expected = [likelihood.calc(actual, entity) for actual, entity in pairs]
+        actual = likelihood.calc_token_ids_batch(actual_token_ids, entity_token_ids)
+        assert np.allclose(actual, expected)
+
+        assert len(likelihood.calc_token_ids_batch([], [])) == 0
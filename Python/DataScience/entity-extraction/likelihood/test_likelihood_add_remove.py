@@ -1,4 +1,7 @@
+import numpy as np
+
 from likelihood.likelihood_add_remove import (
+    make_likelihood_add_remove_symmetric,
     make_likelihood_symmetric,
     num_token_additions_removals,
 )
@@ -81,3 +84,23 @@ def test_lookup_is_consistent():
                     n_tokens, num_adds, num_removes
                 )
                 assert abs(p_calc - p_lookup) < 1e-7
+
+
+def test_likelihood_add_remove_fn_calc_batch():
+    """The batched likelihoods are the same as those calculated one at a time."""
+
+    likelihood = make_likelihood_add_remove_symmetric(0.3, 0.7, 0.9, 0.6)
+
+    windows = [(0, 0, 1), (1, 2, 3), (0, 1, 2), (3, 0, 4), (2, 5, 6)]
+    n_adds, n_removes, n_e = [np.array(a, dtype=np.int64) for a in zip(*windows)]
+
+    assert likelihood.calc_batch(n_adds, n_removes, n_e).tolist() == [
+        likelihood.calc(*w) for w in windows
+    ]
+
+    # The table grows to cover larger windows and entities
+    assert likelihood.table(3, 6).shape == (4, 7, 7)
+    assert likelihood.table(1, 2).shape == (4, 7, 7)
+    assert likelihood.table(8, 2).shape == (9, 7, 7)
+
+    assert len(likelihood.calc_batch(n_adds[:0], n_removes[:0], n_e[:0])) == 0
@@ -0,0 +1,270 @@
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from lookup.postings import POSTINGS_DTYPE, Postings, bytes_to_postings
+
+# A roaring-style compressed bitmap of internal entity IDs. The entity IDs are
+# partitioned into chunks by their high 16 bits, and the low 16 bits of the
+# entity IDs in each chunk are held in a container, which is either:
+#
+# * an array container -- a sorted array of uint16 (for a sparse chunk); or
+# * a bitset container -- 1024 uint64 words with a bit per entity ID (for a
+#   dense chunk).
+#
+# Two bitmaps are intersected chunk by chunk, so only the chunks present in
+# both are visited, and a dense chunk is intersected by ANDing its words.
+
+# Maximum number of entity IDs in an array container
+MAX_ARRAY_CONTAINER_SIZE = 4096
+
+# Number of 64-bit words in a bitset container
+BITSET_WORDS = 1024
+
+# Data types of the containers (stored in little-endian order)
+ARRAY_DTYPE = np.dtype("<u2")
+BITSET_DTYPE = np.dtype("<u8")
+
+# Container kinds in the serialised bitmap
+ARRAY_CONTAINER = 0
+BITSET_CONTAINER = 1
+
+# The serialised bitmap is:
+#
+# <number of containers: uint32>
+# <header per container: key (uint32), kind (uint32), cardinality (uint32)>
+# <container per container (each padded to a multiple of 8 bytes)>
+HEADER_DTYPE = np.dtype("<u4")
+
+
+def bitset_to_array(words: np.ndarray) -> np.ndarray:
+    """Low 16 bits of the entity IDs set in a bitset container."""
+
+    bits = np.unpackbits(words.view(np.uint8), bitorder="little")
+    return np.flatnonzero(bits).astype(ARRAY_DTYPE)
+
+
+def array_to_bitset(low: np.ndarray) -> np.ndarray:
+    """Bitset container for the low 16 bits of the entity IDs."""
+
+    bits = np.zeros(BITSET_WORDS * 64, dtype=np.uint8)
+    bits[low] = 1
+    return np.packbits(bits, bitorder="little").view(BITSET_DTYPE)
+
+
+def make_container(low: np.ndarray) -> np.ndarray:
+    """Container for the (sorted) low 16 bits of the entity IDs in a chunk."""
+
+    if len(low) > MAX_ARRAY_CONTAINER_SIZE:
+        return array_to_bitset(low)
+
+    return low.astype(ARRAY_DTYPE)
+
+
+def is_bitset(container: np.ndarray) -> bool:
+    """Is the container a bitset (rather than an array)?"""
+
+    return container.dtype == BITSET_DTYPE
+
+
+def container_cardinality(container: np.ndarray) -> int:
+    """Number of entity IDs in a container."""
+
+    if is_bitset(container):
+        return int(np.bitwise_count(container).sum())
+
+    return len(container)
+
+
+def intersect_containers(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    """Intersection of two containers (None if it is empty)."""
+
+    if is_bitset(a) and is_bitset(b):
+        words = a & b
+        cardinality = int(np.bitwise_count(words).sum())
+        if cardinality == 0:
+            return None
+        elif cardinality <= MAX_ARRAY_CONTAINER_SIZE:
+            return bitset_to_array(words)
+        return words
+
+    if is_bitset(a):
+        a, b = b, a
+
+    if is_bitset(b):
+        # Test the bit of each entity ID in the array container
+        low = a.astype(np.uint64)
+        present = (b[low >> np.uint64(6)] >> (low & np.uint64(63))) & np.uint64(1)
+        result = a[present.astype(bool)]
+    else:
+        result = np.intersect1d(a, b, assume_unique=True)
+
+    if len(result) == 0:
+        return None
+
+    return result
+
+
+class Bitmap:
+    """Compressed bitmap of internal entity IDs."""
+
+    def __init__(self, containers: Dict[int, np.ndarray]) -> None:
+        assert type(containers) == dict
+
+        # Container for each chunk (by the high 16 bits of the entity IDs)
+        self._containers = containers
+
+    @staticmethod
+    def from_array(entity_ids: np.ndarray) -> "Bitmap":
+        """Bitmap of a sorted array of unique entity IDs."""
+
+        entity_ids = entity_ids.astype(POSTINGS_DTYPE, copy=False)
+        high = entity_ids >> 16
+        low = (entity_ids & 0xFFFF).astype(ARRAY_DTYPE)
+
+        # Split the entity IDs at the boundaries between the chunks
+        keys, starts = np.unique(high, return_index=True)
+        ends = list(starts[1:]) + [len(entity_ids)]
+
+        return Bitmap(
+            {
+                int(key): make_container(low[start:end])
+                for key, start, end in zip(keys, starts, ends)
+            }
+        )
+
+    @staticmethod
+    def from_postings(b: Postings) -> "Bitmap":
+        """Bitmap of a posting list."""
+
+        return Bitmap.from_array(bytes_to_postings(b))
+
+    @staticmethod
+    def from_list(entity_ids: List[int]) -> "Bitmap":
+        """Bitmap of a list of entity IDs."""
+
+        assert type(entity_ids) == list
+        return Bitmap.from_array(np.unique(np.asarray(entity_ids, dtype=np.int64)))
+
+    @staticmethod
+    def from_bytes(b: bytes) -> "Bitmap":
+        """Deserialise a bitmap (e.g. read from LMDB)."""
+
+        b = bytes(b)
+        num_containers = int(np.frombuffer(b, dtype=HEADER_DTYPE, count=1)[0])
+        header = np.frombuffer(
+            b,
+            dtype=HEADER_DTYPE,
+            count=num_containers * 3,
+            offset=HEADER_DTYPE.itemsize,
+        ).reshape(-1, 3)
+
+        offset = HEADER_DTYPE.itemsize * (1 + num_containers * 3)
+        containers = {}
+        for key, kind, cardinality in header.tolist():
+            if kind == BITSET_CONTAINER:
+                container = np.frombuffer(
+                    b, dtype=BITSET_DTYPE, count=BITSET_WORDS, offset=offset
+                )
+            elif kind == ARRAY_CONTAINER:
+                container = np.frombuffer(
+                    b, dtype=ARRAY_DTYPE, count=cardinality, offset=offset
+                )
+            else:
+                raise Exception(f"Invalid bitmap container kind: {kind}")
+
+            containers[key] = container
+            offset += padded_length(container.nbytes)
+
+        return Bitmap(containers)
+
+    def to_bytes(self) -> bytes:
+        """Serialise the bitmap (e.g. for storage in LMDB)."""
+
+        keys = sorted(self._containers)
+
+        header = [len(keys)]
+        for key in keys:
+            container = self._containers[key]
+            kind = BITSET_CONTAINER if is_bitset(container) else ARRAY_CONTAINER
+            header.extend([key, kind, container_cardinality(container)])
+
+        parts = [np.asarray(header, dtype=HEADER_DTYPE).tobytes()]
+        for key in keys:
+            data = self._containers[key].tobytes()
+            parts.append(data + bytes(padded_length(len(data)) - len(data)))
+
+        return b"".join(parts)
+
+    def intersection(self, other: "Bitmap") -> "Bitmap":
+        """Entity IDs in both this bitmap and the other bitmap."""
+
+        assert type(other) == Bitmap
+
+        # Only the chunks in both bitmaps can have entity IDs in common
+        containers = {}
+        for key in self._containers.keys() & other._containers.keys():
+            container = intersect_containers(
+                self._containers[key], other._containers[key]
+            )
+            if container is not None:
+                containers[key] = container
+
+        return Bitmap(containers)
+
+    def to_array(self) -> np.ndarray:
+        """Sorted array of the entity IDs."""
+
+        parts = []
+        for key in sorted(self._containers):
+            container = self._containers[key]
+            if is_bitset(container):
+                container = bitset_to_array(container)
+            parts.append(
+                (np.uint32(key) << np.uint32(16)) | container.astype(POSTINGS_DTYPE)
+            )
+
+        if len(parts) == 0:
+            return np.zeros(0, dtype=POSTINGS_DTYPE)
+
+        return np.concatenate(parts)
+
+    def to_set(self):
+        """Set of the entity IDs."""
+
+        return set(self.to_array().tolist())
+
+    def __len__(self) -> int:
+        return sum([container_cardinality(c) for c in self._containers.values()])
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.to_array().tolist())
+
+    def __contains__(self, entity_id: int) -> bool:
+        high, low = divmod(entity_id, 1 << 16)
+        container = self._containers.get(high)
+        if container is None:
+            return False
+        elif is_bitset(container):
+            return bool((int(container[low >> 6]) >> (low & 63)) & 1)
+
+        idx = int(np.searchsorted(container, low))
+        return idx < len(container) and int(container[idx]) == low
+
+    def __eq__(self, other) -> bool:
+        if type(other) != Bitmap:
+            return False
+
+        return np.array_equal(self.to_array(), other.to_array())
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def __repr__(self) -> str:
+        return f"Bitmap(containers={len(self._containers)}, cardinality={len(self)})"
+
+
+def padded_length(n: int) -> int:
+    """Length of a container padded to a multiple of 8 bytes."""
+
+    return (n + 7) // 8 * 8
@@ -0,0 +1,185 @@
+import heapq
+import os
+
+from typing import Iterable, Iterator, List, Optional, Tuple
+from loguru import logger
+
+# A (token, internal entity ID) pair
+TokenEntityPair = Tuple[str, int]
+
+# Default maximum number of pairs held in memory before a run is written
+DEFAULT_MAX_RUN_SIZE = 5 * 1000 * 1000
+
+# Maximum number of runs merged at once (to limit the number of open files)
+MAX_MERGE_FAN_IN = 128
+
+
+def write_run(pairs: List[TokenEntityPair], filepath: str) -> None:
+    """Sort the (token, entity ID) pairs and write them to a run file."""
+
+    assert type(pairs) == list
+    assert type(filepath) == str
+
+    pairs.sort()
+
+    # Each line of the file is: <token>\t<entity ID>
+    with open(filepath, "w", encoding="utf-8") as fp:
+        fp.writelines([f"{token}\t{entity_id}\n" for token, entity_id in pairs])
+
+
+def read_run(filepath: str) -> Iterator[TokenEntityPair]:
+    """Read the sorted (token, entity ID) pairs from a run file."""
+
+    assert type(filepath) == str
+
+    with open(filepath, "r", encoding="utf-8") as fp:
+        for line in fp:
+            token, entity_id = line.rstrip("\n").split("\t")
+            yield token, int(entity_id)
+
+
+def group_pairs(pairs: Iterable[TokenEntityPair]) -> Iterator[Tuple[str, List[int]]]:
+    """Group sorted (token, entity ID) pairs into a token and its entity IDs.
+
+    The entity IDs for a token are sorted and deduplicated (an entity may have
+    a repeated token).
+    """
+
+    current_token: Optional[str] = None
+    entity_ids: List[int] = []
+
+    for token, entity_id in pairs:
+        if token != current_token:
+            if current_token is not None:
+                yield current_token, entity_ids
+
+            current_token = token
+            entity_ids = [entity_id]
+
+        elif entity_id != entity_ids[-1]:
+            entity_ids.append(entity_id)
+
+    if current_token is not None:
+        yield current_token, entity_ids
+
+
+def merge_runs(filepaths: List[str]) -> Iterator[Tuple[str, List[int]]]:
+    """Perform a k-way merge of the run files, yielding tokens in sorted order."""
+
+    assert type(filepaths) == list
+
+    return group_pairs(heapq.merge(*[read_run(f) for f in filepaths]))
+
+
+def merge_runs_to_run(filepaths: List[str], filepath: str) -> None:
+    """Perform a k-way merge of the run files, writing the result to a run file."""
+
+    assert type(filepaths) == list
+    assert type(filepath) == str
+
+    with open(filepath, "w", encoding="utf-8") as fp:
+        for token, entity_id in heapq.merge(*[read_run(f) for f in filepaths]):
+            fp.write(f"{token}\t{entity_id}\n")
+
+
+class ExternalSorter:
+    """Sorts (token, entity ID) pairs that may not fit in memory.
+
+    Pairs are held in memory until `max_run_size` have been added, at which
+    point they are sorted and written to a run file in the `folder`. The runs
+    are then merged to produce each token and its entity IDs in token order.
+    """
+
+    def __init__(self, folder: str, max_run_size: int = DEFAULT_MAX_RUN_SIZE):
+        assert type(folder) == str
+        assert type(max_run_size) == int and max_run_size > 0
+
+        self._folder = folder
+        self._max_run_size = max_run_size
+
+        # Pairs that haven't yet been written to a run
+        self._pairs: List[TokenEntityPair] = []
+
+        # Filepaths of the runs written to disk
+        self._run_filepaths: List[str] = []
+
+        # Number of run filepaths that have been handed out
+        self._num_run_filepaths = 0
+
+        # Check that the folder doesn't already contain runs
+        if os.path.exists(self._folder) and len(os.listdir(self._folder)) > 0:
+            raise Exception(f"Staging folder is not empty: {self._folder}")
+
+        os.makedirs(self._folder, exist_ok=True)
+
+    def add(self, token: str, entity_id: int) -> None:
+        """Add a (token, entity ID) pair."""
+
+        self._pairs.append((token, entity_id))
+
+        if len(self._pairs) >= self._max_run_size:
+            self._spill()
+
+    def add_run(self, filepath: str) -> None:
+        """Add a run that has already been written (e.g. by another process)."""
+
+        assert type(filepath) == str
+        self._run_filepaths.append(filepath)
+
+    def next_run_filepath(self) -> str:
+        """Unique filepath in the folder for a new run."""
+
+        filepath = os.path.join(self._folder, f"run-{self._num_run_filepaths:06d}.tsv")
+        self._num_run_filepaths += 1
+        return filepath
+
+    def _spill(self) -> None:
+        """Sort the pairs in memory and write them to a run file."""
+
+        if len(self._pairs) == 0:
+            return
+
+        filepath = self.next_run_filepath()
+        logger.debug(f"Writing run of {len(self._pairs)} pairs to {filepath}")
+
+        write_run(self._pairs, filepath)
+        self._run_filepaths.append(filepath)
+        self._pairs = []
+
+    def merged(self) -> Iterator[Tuple[str, List[int]]]:
+        """Each token and its sorted entity IDs, in token order."""
+
+        self._spill()
+
+        # Merge groups of runs into intermediate runs until they can all be
+        # merged at once
+        while len(self._run_filepaths) > MAX_MERGE_FAN_IN:
+            logger.info(f"Merging {len(self._run_filepaths)} runs into fewer runs")
+
+            run_filepaths = self._run_filepaths
+            self._run_filepaths = []
+
+            for idx in range(0, len(run_filepaths), MAX_MERGE_FAN_IN):
+                group = run_filepaths[idx : idx + MAX_MERGE_FAN_IN]
+                filepath = self.next_run_filepath()
+                merge_runs_to_run(group, filepath)
+                self._run_filepaths.append(filepath)
+
+                for f in group:
+                    os.remove(f)
+
+        logger.info(f"Merging {len(self._run_filepaths)} run(s)")
+
+        return merge_runs(self._run_filepaths)
+
+    def cleanup(self) -> None:
+        """Delete the run files."""
+
+        for filepath in self._run_filepaths:
+            os.remove(filepath)
+
+        self._run_filepaths = []
+        self._pairs = []
+
+        if len(os.listdir(self._folder)) == 0:
+            os.rmdir(self._folder)
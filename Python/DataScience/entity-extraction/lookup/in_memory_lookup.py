@@ -1,4 +1,5 @@
-from typing import Dict, List, Optional, Set
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set
 
 from domain import (
     Tokens,
@@ -7,7 +8,10 @@ from domain import (
     assert_token_valid,
     assert_tokens_valid,
 )
-from lookup.lookup import Lookup
+from lookup.bitmap import Bitmap
+from lookup.lookup import Lookup, PostingsReader
+from lookup.postings import Postings, postings_to_bytes
+from lookup.token_dictionary import TokenDictionary, TokenIds
 
 
 class InMemoryLookup(Lookup):
@@ -18,6 +22,10 @@ class InMemoryLookup(Lookup):
         self._entity_id_to_tokens: Dict[int, List[str]] = {}
         self._internal_to_external_id: Dict[int, str] = {}
 
+        # Token IDs of the tokens and of each entity's tokens
+        self._dictionary = TokenDictionary()
+        self._entity_id_to_token_ids: Dict[int, TokenIds] = {}
+
     def add(
         self, internal_entity_id: int, external_entity_id: str, tokens: Tokens
     ) -> None:
@@ -33,6 +41,9 @@ class InMemoryLookup(Lookup):
         ), f"entity {internal_entity_id} already exists"
 
         self._entity_id_to_tokens[internal_entity_id] = tokens
+        self._entity_id_to_token_ids[internal_entity_id] = self._dictionary.encode(
+            tokens
+        )
 
         # Store the entity ID for the tokens
         for t in tokens:
@@ -50,6 +61,17 @@ class InMemoryLookup(Lookup):
         assert_internal_entity_id_valid(internal_entity_id)
         return self._entity_id_to_tokens.get(internal_entity_id, None)
 
+    def token_ids_for_entity(self, internal_entity_id: int) -> Optional[TokenIds]:
+        """Get the token IDs of an entity's tokens given its internal ID."""
+
+        assert_internal_entity_id_valid(internal_entity_id)
+        return self._entity_id_to_token_ids.get(internal_entity_id, None)
+
+    def token_ids(self, tokens: Tokens) -> TokenIds:
+        """Token IDs of the tokens in a text (comparable with an entity's token IDs)."""
+
+        return self._dictionary.encode_text(tokens)
+
     def entity_ids_for_token_list(self, token: str) -> Optional[List[int]]:
         """Get the entity IDs as a list for a given token."""
 
@@ -67,6 +89,28 @@ class InMemoryLookup(Lookup):
             return " ".join([str(e) for e in ids])
         return None
 
+    def entity_ids_for_token_postings(self, token: str) -> Optional[Postings]:
+        """Get the internal entity IDs as a posting list for a given token."""
+
+        assert_token_valid(token)
+        if token in self._token_to_entity_ids:
+            return postings_to_bytes(list(self._token_to_entity_ids[token]))
+        return None
+
+    def entity_ids_for_token_bitmap(self, token: str) -> Optional[Bitmap]:
+        """Get the internal entity IDs as a compressed bitmap for a given token."""
+
+        assert_token_valid(token)
+        if token in self._token_to_entity_ids:
+            return Bitmap.from_list(list(self._token_to_entity_ids[token]))
+        return None
+
+    @contextmanager
+    def postings_reader(self) -> Iterator[PostingsReader]:
+        """Context manager providing a function to read posting lists."""
+
+        yield PostingsReader(self.entity_ids_for_token_postings, self.max_entity_id())
+
     def entity_ids_for_token(self, token: str) -> Optional[Set[int]]:
         """Get the internal entity IDs for a given token."""
 
@@ -1,10 +1,12 @@
-from functools import lru_cache
+from contextlib import contextmanager
+from datetime import datetime
 import pickle
 import lmdb
+import numpy as np
 import os
 import sqlite3
 
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 from loguru import logger
 from domain import (
     Tokens,
@@ -12,7 +14,23 @@ from domain import (
     assert_internal_entity_id_valid,
     assert_tokens_valid,
 )
-from lookup.lookup import Lookup
+from lookup.bitmap import Bitmap
+from lookup.external_sort import ExternalSorter
+from lookup.lookup import Lookup, PostingsReader
+from lookup.shared_cache import SharedCache, key_hash
+from lookup.postings import (
+    Postings,
+    bytes_to_postings,
+    merge_postings,
+    postings_to_bytes,
+)
+from lookup.token_dictionary import (
+    TokenDictionary,
+    TokenIds,
+    bytes_to_token_ids,
+    encode_text,
+    token_ids_to_bytes,
+)
 
 # Sqlite database table name and column names
 TOKEN_TO_ENTITY_ID_TABLENAME = "TokenToEntityID"
@@ -22,15 +40,41 @@ TOKEN_COLUMN = "token"
 # LMDB map size in bytes
 LMDB_MAP_SIZE = 1000 * 1000 * 1000 * 100
 
+# Number of posting lists written per LMDB transaction in bulk mode
+BULK_TOKENS_PER_TRANSACTION = 100000
+
 # The key-value structure is:
 #
 # E<entity ID> = <pickled list of tokens>
-# T<token> = <pickled list of internal entity IDs>
-# S<token> = <space separated string of internal entity IDs>
+# P<token> = <posting list: sorted array of uint32 internal entity IDs>
+# B<token> = <compressed bitmap of the internal entity IDs in the posting list>
 # M = <maximum number of tokens for an entity (across all entities)>
 # N = <maximum internal entity ID>
 # C<internal entity ID> = <number of tokens for the entity>
 # I<internal entity ID> = <external entity ID>
+# F = <format version>
+# G = <generation (incremented by each update to a finalised lookup)>
+# D<internal entity ID> = <empty value, i.e. a tombstone for a removed entity>
+# A<internal entity ID> = <token IDs of the entity's tokens: array of uint32>
+# K<token> = <token ID of the token in the token dictionary>
+# V = <number of token IDs in the token dictionary>
+#
+# Lookups built before the token dictionary was introduced (format version 2)
+# don't have the A, K and V keys.
+#
+# Lookups built before the format version was introduced (format version 1)
+# hold the token to internal entity IDs as:
+#
+# T<token> = <pickled list of internal entity IDs>
+# S<token> = <space separated string of internal entity IDs>
+
+# Key for the format version of the lookup
+FORMAT_VERSION_KEY = "F"
+
+# Format versions
+LEGACY_FORMAT_VERSION = 1
+POSTINGS_FORMAT_VERSION = 2
+TOKEN_IDS_FORMAT_VERSION = 3
 
 # Key for the key-value pair for the maximum number of tokens for an entity
 MAX_TOKENS_KEY = "M"
@@ -41,6 +85,19 @@ MAX_ENTITY_ID_KEY = "N"
 # Key for the mapping from an internal entity ID to an external entity ID
 INT_TO_EXT_ENTITY_ID = "I"
 
+# Key for the generation of the lookup
+GENERATION_KEY = "G"
+
+# Key for the number of token IDs in the token dictionary
+NUM_TOKEN_IDS_KEY = "V"
+
+# Number of tokens written to the token dictionary per LMDB transaction
+TOKEN_IDS_PER_TRANSACTION = 100000
+
+# Prefix of a cached value for a key that isn't in the LMDB (or the value)
+CACHED_MISSING = b"\x00"
+CACHED_PRESENT = b"\x01"
+
 
 def pickle_list(l: List[int]) -> bytes:
     """Pickle a list for storage in the database."""
@@ -81,6 +138,26 @@ def token_to_string_key(token: str) -> bytes:
     return f"S{token}".encode("ascii")
 
 
+def token_to_postings_key(token: str) -> bytes:
+    """Token to key in the LMDB for the token's posting list."""
+    return f"P{token}".encode("ascii")
+
+
+def token_to_bitmap_key(token: str) -> bytes:
+    """Token to key in the LMDB for the token's compressed bitmap."""
+    return f"B{token}".encode("ascii")
+
+
+def internal_entity_id_to_token_ids_key(internal_entity_id: int) -> bytes:
+    """Internal entity ID to key in the LMDB for the token IDs of its tokens."""
+    return f"A{internal_entity_id}".encode("ascii")
+
+
+def token_to_token_id_key(token: str) -> bytes:
+    """Token to key in the LMDB for the token's ID in the token dictionary."""
+    return f"K{token}".encode("ascii")
+
+
 def internal_entity_id_to_token_count_key(internal_entity_id: int) -> bytes:
     """Internal entity ID to key in LMDB to retrieve the number of tokens."""
     return f"C{internal_entity_id}".encode("ascii")
@@ -102,6 +179,18 @@ def internal_entity_to_external_key(internal_entity_id: int) -> bytes:
     return f"I{internal_entity_id}".encode("ascii")
 
 
+def internal_entity_id_to_tombstone_key(internal_entity_id: int) -> bytes:
+    """Key for the tombstone of a removed entity."""
+    return f"D{internal_entity_id}".encode("ascii")
+
+
+def items_per_second(n: int, seconds: float) -> float:
+    """Throughput of `n` items processed in a number of `seconds`."""
+    if seconds <= 0.0:
+        return float(n)
+    return round(n / seconds, 1)
+
+
 class LmdbLookup(Lookup):
     """A lookup backed by an LMDB."""
 
@@ -111,16 +200,25 @@ class LmdbLookup(Lookup):
         load_mode: bool,
         sqlite_filepath: Optional[str] = None,
         token_count_filepath: Optional[str] = None,
+        staging_folder: Optional[str] = None,
+        update_mode: bool = False,
+        cache: Optional[SharedCache] = None,
     ):
         assert type(lmdb_folder) == str
         assert type(load_mode) == bool
+        assert type(update_mode) == bool
+        assert not (load_mode and update_mode), "load and update modes are exclusive"
         assert sqlite_filepath is None or type(sqlite_filepath) == str
         assert token_count_filepath is None or type(token_count_filepath) == str
+        assert staging_folder is None or type(staging_folder) == str
+        assert cache is None or isinstance(cache, SharedCache)
 
         self._lmdb_folder = lmdb_folder
         self._load_mode = load_mode
         self._token_to_count_filepath = token_count_filepath
         self._sqlite_filepath = sqlite_filepath
+        self._staging_folder = staging_folder
+        self._update_mode = update_mode
 
         # LMDB environment
         self._env: Any = None
@@ -138,24 +236,55 @@ class LmdbLookup(Lookup):
         # Maximum entity ID
         self._max_entity_id: int = -1
 
+        # Format version of the lookup (a lookup is always built using the
+        # latest format)
+        self._format_version: int = TOKEN_IDS_FORMAT_VERSION
+
+        # Token dictionary built in load mode (and used in place of the token
+        # dictionary in the LMDB for a lookup built without one)
+        self._dictionary = TokenDictionary()
+
         # Sqlite database connection and cursor for load mode
         self._conn: Optional[sqlite3.Connection] = None
         self._cursor: Optional[sqlite3.Cursor] = None
         self._num_adds: int = 0
 
+        # External sorter of the (token, entity ID) pairs for bulk load mode
+        # (used instead of Sqlite if a staging folder is provided)
+        self._sorter: Optional[ExternalSorter] = None
+
+        # Generation of the lookup that the cached values were read from
+        self._generation: int = 0
+
+        # Cache of the values read from the LMDB (which may be shared with
+        # other processes), or None to read the values from the LMDB every
+        # time. The cached values are keyed by the lookup's folder and
+        # generation, so an update to the lookup doesn't need the cache to be
+        # cleared
+        self._cache: Optional[SharedCache] = cache
+        self._cache_namespace = key_hash(
+            os.path.abspath(lmdb_folder).encode("utf-8")
+        ).to_bytes(8, "little")
+
         # Initialise the databse depending on the mode of operation
         if self._load_mode:
             self._initialise_load_mode()
+        elif self._update_mode:
+            self._initialise_update_mode()
         else:
             self._initialise_read_mode()
 
     def _initialise_load_mode(self):
         """Initialise two databases for loading."""
 
-        logger.info("Lookup in load mode")
-
         self._initialise_lmdb_for_writing()
-        self._initialise_sqlite_for_writing()
+
+        if self._staging_folder is None:
+            logger.info("Lookup in load mode")
+            self._initialise_sqlite_for_writing()
+        else:
+            logger.info(f"Lookup in bulk load mode (staging: {self._staging_folder})")
+            self._sorter = ExternalSorter(self._staging_folder)
 
     def _initialise_read_mode(self):
         """Initialise the LMDB for reading."""
@@ -165,6 +294,38 @@ class LmdbLookup(Lookup):
         self._env = lmdb.open(self._lmdb_folder, readonly=True)
         logger.debug(f"LMDB stats: {self._env.stat()}")
 
+        self._format_version = self._read_format_version()
+        logger.info(f"Lookup format version: {self._format_version}")
+
+        self._generation = self.generation()
+
+    def _initialise_update_mode(self):
+        """Initialise a finalised LMDB for updating in place."""
+
+        logger.info("Lookup in update mode")
+
+        if not os.path.exists(self._lmdb_folder):
+            raise Exception(f"LMDB folder doesn't exist: {self._lmdb_folder}")
+
+        self._initialise_lmdb_for_writing()
+
+        self._format_version = self._read_format_version()
+        if self._format_version == LEGACY_FORMAT_VERSION:
+            raise Exception("A lookup in the legacy format can't be updated")
+
+        self._generation = self.generation()
+
+    def _read_format_version(self) -> int:
+        """Read the format version of the lookup from LMDB."""
+
+        with self._env.begin() as txn:
+            value = txn.get(FORMAT_VERSION_KEY.encode("ascii"))
+
+        if value is None:
+            return LEGACY_FORMAT_VERSION
+
+        return int(value)
+
     def _initialise_lmdb_for_writing(self) -> None:
         """Initialise the LMDB for writing."""
 
@@ -212,11 +373,20 @@ class LmdbLookup(Lookup):
         assert_external_entity_id_valid(external_entity_id)
         assert_tokens_valid(tokens)
 
+        # Merge the entity into the finalised LMDB
+        if self._update_mode:
+            self.update([(internal_entity_id, external_entity_id, tokens)], [])
+            return
+
         # Add the entity ID to tokens mapping to the LMDB
         self._add_to_lmdb(internal_entity_id, external_entity_id, tokens)
 
-        # Add the token to entity ID to Sqlite
-        self._add_to_sqlite(internal_entity_id, tokens)
+        # Add the token to entity ID to Sqlite (or the external sorter)
+        if self._sorter is None:
+            self._add_to_sqlite(internal_entity_id, tokens)
+        else:
+            for token in tokens:
+                self._sorter.add(token, internal_entity_id)
 
         # Update the maximum number of tokens for an entity
         self._max_num_tokens = max(self._max_num_tokens, len(tokens))
@@ -227,6 +397,198 @@ class LmdbLookup(Lookup):
         # Record the tokens for the entity in the counts
         self._record_tokens(tokens)
 
+    def remove(self, internal_entity_id: int) -> None:
+        """Remove an entity from the lookup (update mode only)."""
+
+        self.update([], [internal_entity_id])
+
+    def update(
+        self,
+        adds: List[Tuple[int, str, Tokens]],
+        removes: List[int],
+    ) -> None:
+        """Add and remove entities in a finalised lookup (update mode only).
+
+        The posting lists and the metadata are updated in place in a single
+        transaction, which increments the lookup's generation. A lookup in read
+        mode sees the changes once it has been refreshed.
+        """
+
+        if not self._update_mode:
+            raise Exception("Lookup is not in update mode")
+
+        for internal_entity_id, external_entity_id, tokens in adds:
+            assert_internal_entity_id_valid(internal_entity_id)
+            assert_external_entity_id_valid(external_entity_id)
+            assert_tokens_valid(tokens)
+
+        for internal_entity_id in removes:
+            assert_internal_entity_id_valid(internal_entity_id)
+
+        # Entity IDs to add to and remove from the posting list of each token,
+        # so that each posting list is merged (and written) once
+        token_adds: Dict[str, List[int]] = {}
+        token_removes: Dict[str, List[int]] = {}
+
+        with self._env.begin(write=True) as txn:
+
+            # Remove the entities first, so that an entity can be replaced
+            for internal_entity_id in removes:
+                for token in self._remove_entity(txn, internal_entity_id):
+                    token_removes.setdefault(token, []).append(internal_entity_id)
+
+            max_num_tokens = int(txn.get(MAX_TOKENS_KEY.encode("ascii")))
+            max_entity_id = int(txn.get(MAX_ENTITY_ID_KEY.encode("ascii")))
+
+            for internal_entity_id, external_entity_id, tokens in adds:
+                if txn.get(internal_entity_id_to_key(internal_entity_id)) is not None:
+                    raise Exception(f"Entity {internal_entity_id} already exists")
+
+                self._put_entity(txn, internal_entity_id, external_entity_id, tokens)
+                txn.delete(internal_entity_id_to_tombstone_key(internal_entity_id))
+
+                for token in set(tokens):
+                    token_adds.setdefault(token, []).append(internal_entity_id)
+
+                max_num_tokens = max(max_num_tokens, len(tokens))
+                max_entity_id = max(max_entity_id, internal_entity_id)
+
+            for token in set(token_adds) | set(token_removes):
+                self._merge_postings(
+                    txn,
+                    token,
+                    token_adds.get(token, []),
+                    token_removes.get(token, []),
+                )
+
+            # The maximum number of tokens isn't reduced when entities are
+            # removed, as it is only used as an upper bound
+            txn.put(MAX_TOKENS_KEY.encode("ascii"), str(max_num_tokens).encode("ascii"))
+            txn.put(
+                MAX_ENTITY_ID_KEY.encode("ascii"), str(max_entity_id).encode("ascii")
+            )
+
+            self._generation = int(txn.get(GENERATION_KEY.encode("ascii"), b"0")) + 1
+            txn.put(
+                GENERATION_KEY.encode("ascii"), str(self._generation).encode("ascii")
+            )
+
+        self._env.sync()
+
+        logger.info(
+            f"Updated lookup to generation {self._generation} ({len(adds)} added, {len(removes)} removed)"
+        )
+
+    def _merge_postings(
+        self, txn: Any, token: str, adds: List[int], removes: List[int]
+    ) -> None:
+        """Merge the changes into a token's posting list and bitmap."""
+
+        key = token_to_postings_key(token)
+        postings = merge_postings(txn.get(key), adds, removes)
+
+        if postings is None:
+            txn.delete(key)
+            txn.delete(token_to_bitmap_key(token))
+        else:
+            txn.put(key, postings)
+            txn.put(
+                token_to_bitmap_key(token), Bitmap.from_postings(postings).to_bytes()
+            )
+
+    def _remove_entity(self, txn: Any, internal_entity_id: int) -> Set[str]:
+        """Remove an entity, returning the tokens whose posting lists hold it."""
+
+        result = txn.get(internal_entity_id_to_key(internal_entity_id))
+        if result is None:
+            raise Exception(f"Entity {internal_entity_id} doesn't exist")
+
+        txn.delete(internal_entity_id_to_key(internal_entity_id))
+        txn.delete(internal_entity_id_to_token_ids_key(internal_entity_id))
+        txn.delete(internal_entity_id_to_token_count_key(internal_entity_id))
+        txn.delete(internal_entity_to_external_key(internal_entity_id))
+
+        # Record a tombstone for the removed entity
+        txn.put(internal_entity_id_to_tombstone_key(internal_entity_id), b"")
+
+        return set(unpickle_list_str(result))
+
+    def is_removed(self, internal_entity_id: int) -> bool:
+        """Has the entity been removed from the lookup?"""
+
+        with self._env.begin() as txn:
+            value = txn.get(internal_entity_id_to_tombstone_key(internal_entity_id))
+
+        return value is not None
+
+    def generation(self) -> int:
+        """Generation of the lookup (0 if it hasn't been updated)."""
+
+        with self._env.begin() as txn:
+            value = txn.get(GENERATION_KEY.encode("ascii"))
+
+        if value is None:
+            return 0
+
+        return int(value)
+
+    def refresh(self) -> bool:
+        """Read the values of the latest generation if the lookup has been updated.
+
+        Returns True if the lookup has changed since it was opened or last
+        refreshed.
+        """
+
+        generation = self.generation()
+        if generation == self._generation:
+            return False
+
+        logger.info(
+            f"Lookup updated from generation {self._generation} to {generation}"
+        )
+        self._generation = generation
+
+        return True
+
+    def _read_cached(
+        self, key: bytes, read: Callable[[Any], Optional[bytes]]
+    ) -> Optional[bytes]:
+        """Read the value for a key via the cache.
+
+        On a cache miss, the value is read using a transaction and cached
+        (including if it is missing).
+        """
+
+        if self._cache is None:
+            with self._env.begin() as txn:
+                return read(txn)
+
+        cache_key = self._cache_namespace + self._generation.to_bytes(8, "little") + key
+
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            if cached == CACHED_MISSING:
+                return None
+            return cached[1:]
+
+        with self._env.begin() as txn:
+            value = read(txn)
+
+        if value is None:
+            self._cache.put(cache_key, CACHED_MISSING)
+        else:
+            self._cache.put(cache_key, CACHED_PRESENT + value)
+
+        return value
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Hit, miss and eviction counters and the size of the cache."""
+
+        if self._cache is None:
+            return {}
+
+        return self._cache.stats()
+
     def _record_tokens(self, tokens: Tokens) -> None:
         """Record the tokens for a single entity."""
 
@@ -246,23 +608,7 @@ class LmdbLookup(Lookup):
         """Add an entity to the LMDB lookup."""
 
         with self._env.begin(write=True) as txn:
-
-            # Add internal entity ID -> pickled list of strings
-            txn.put(
-                internal_entity_id_to_key(internal_entity_id), pickle_list_str(tokens)
-            )
-
-            # Add internal entity ID -> number of tokens
-            txn.put(
-                internal_entity_id_to_token_count_key(internal_entity_id),
-                count_to_bytes(len(tokens)),
-            )
-
-            # Add internal entity ID -> external entity ID
-            txn.put(
-                internal_entity_to_external_key(internal_entity_id),
-                external_entity_id.encode("ascii"),
-            )
+            self._put_entity(txn, internal_entity_id, external_entity_id, tokens)
 
         self._num_lmdb_adds += 1
         if self._num_lmdb_adds % 10000 == 0:
@@ -270,6 +616,99 @@ class LmdbLookup(Lookup):
             self._num_lmdb_adds = 0
             logger.debug(f"LMDB stats: {self._env.stat()}")
 
+    def _put_entity(
+        self,
+        txn: Any,
+        internal_entity_id: int,
+        external_entity_id: str,
+        tokens: Tokens,
+    ) -> None:
+        """Put an entity's keys into the LMDB using a write transaction."""
+
+        # Add internal entity ID -> pickled list of strings
+        txn.put(internal_entity_id_to_key(internal_entity_id), pickle_list_str(tokens))
+
+        # Add internal entity ID -> token IDs of its tokens
+        token_ids = self._encode_entity_tokens(txn, tokens)
+        if token_ids is not None:
+            txn.put(
+                internal_entity_id_to_token_ids_key(internal_entity_id),
+                token_ids_to_bytes(token_ids),
+            )
+
+        # Add internal entity ID -> number of tokens
+        txn.put(
+            internal_entity_id_to_token_count_key(internal_entity_id),
+            count_to_bytes(len(tokens)),
+        )
+
+        # Add internal entity ID -> external entity ID
+        txn.put(
+            internal_entity_to_external_key(internal_entity_id),
+            external_entity_id.encode("ascii"),
+        )
+
+    def _encode_entity_tokens(self, txn: Any, tokens: Tokens) -> Optional[TokenIds]:
+        """Token IDs of an entity's tokens (adding new tokens to the dictionary).
+
+        Returns None if the lookup was built without a token dictionary.
+        """
+
+        if not self._update_mode:
+            return self._dictionary.encode(tokens)
+        elif self._format_version < TOKEN_IDS_FORMAT_VERSION:
+            return None
+
+        # Look up the token IDs in the LMDB and assign the next token ID to a
+        # new token
+        token_ids = []
+        for token in tokens:
+            key = token_to_token_id_key(token)
+            value = txn.get(key)
+            if value is None:
+                token_id = int(txn.get(NUM_TOKEN_IDS_KEY.encode("ascii"), b"0"))
+                txn.put(key, str(token_id).encode("ascii"))
+                txn.put(
+                    NUM_TOKEN_IDS_KEY.encode("ascii"),
+                    str(token_id + 1).encode("ascii"),
+                )
+            else:
+                token_id = int(value)
+            token_ids.append(token_id)
+
+        return np.array(token_ids, dtype=np.uint32)
+
+    def next_run_filepath(self) -> str:
+        """Filepath in the staging folder for a run written by another process."""
+
+        if self._sorter is None:
+            raise Exception("Lookup is not in bulk load mode")
+
+        return self._sorter.next_run_filepath()
+
+    def add_entities(
+        self, entities: List[Tuple[int, str, Tokens]], run_filepath: str
+    ) -> None:
+        """Add a batch of entities whose (token, entity ID) pairs are in a run.
+
+        The run must have been written with `write_run()` to a filepath from
+        `next_run_filepath()`. The entities are written to the LMDB in a single
+        transaction.
+        """
+
+        if self._sorter is None:
+            raise Exception("Lookup is not in bulk load mode")
+
+        with self._env.begin(write=True) as txn:
+            for internal_entity_id, external_entity_id, tokens in entities:
+                self._put_entity(txn, internal_entity_id, external_entity_id, tokens)
+
+                self._max_num_tokens = max(self._max_num_tokens, len(tokens))
+                self._max_entity_id = max(self._max_entity_id, internal_entity_id)
+                self._record_tokens(tokens)
+
+        self._sorter.add_run(run_filepath)
+
     def _add_to_sqlite(self, entity_id: int, tokens: Tokens) -> None:
         """Add an entity to the Sqlite lookup."""
 
@@ -297,15 +736,6 @@ class LmdbLookup(Lookup):
 
         logger.info(f"Performing lookup finalisation")
 
-        if self._conn is None:
-            raise Exception("Sqlite connection is None")
-        elif self._cursor is None:
-            raise Exception("Sqlite cursor is None")
-
-        # Commit any remaining Sqlite insert operations
-        if self._num_adds > 0:
-            self._conn.commit()
-
         # Commit any remaining LMDB put operations
         if self._num_lmdb_adds > 0:
             self._env.sync()
@@ -318,6 +748,33 @@ class LmdbLookup(Lookup):
         logger.info(f"Writing maximum entity ID ({self._max_entity_id})")
         self._write_max_entity_id()
 
+        # Write the format version
+        self._write_format_version()
+
+        if self._sorter is None:
+            self._finalise_sqlite()
+        else:
+            self._finalise_bulk()
+
+        # Write the token dictionary (after the posting lists, which are
+        # appended in key order in bulk mode)
+        self._write_token_dictionary()
+
+        # Write the token counts to file
+        self._write_token_counts()
+
+    def _finalise_sqlite(self) -> None:
+        """Write the token to entity IDs from Sqlite and delete the database."""
+
+        if self._conn is None:
+            raise Exception("Sqlite connection is None")
+        elif self._cursor is None:
+            raise Exception("Sqlite cursor is None")
+
+        # Commit any remaining Sqlite insert operations
+        if self._num_adds > 0:
+            self._conn.commit()
+
         # Add an index to the Sqlite token to entity ID table
         logger.info(f"Adding index to Sqlite database")
         self._cursor.execute(
@@ -341,8 +798,72 @@ class LmdbLookup(Lookup):
         logger.info(f"Deleting temporary Sqlite database: {self._sqlite_filepath}")
         os.remove(self._sqlite_filepath)
 
-        # Write the token counts to file
-        self._write_token_counts()
+    def _finalise_bulk(self) -> None:
+        """Merge the sorted runs into LMDB and delete the runs."""
+
+        if self._sorter is None:
+            raise Exception("External sorter is None")
+
+        self.write_postings(self._sorter.merged(), len(self._tokens))
+
+        logger.info(f"Deleting the staging folder: {self._staging_folder}")
+        self._sorter.cleanup()
+
+    def write_postings(
+        self, postings: Iterator[Tuple[str, List[int]]], num_tokens: int
+    ) -> None:
+        """Write the tokens and their sorted entity IDs to LMDB.
+
+        The tokens must be in sorted order so that the posting lists can be
+        appended to the LMDB in key order. The compressed bitmap of each
+        posting list is written alongside it.
+        """
+
+        logger.info(f"Building the posting lists in LMDB for {num_tokens} tokens")
+
+        start_time = datetime.now()
+        start_time_batch = start_time
+        idx = 0
+
+        batch: List[Tuple[bytes, bytes]] = []
+        for idx, (token, entity_ids) in enumerate(postings, start=1):
+            batch.append((token_to_postings_key(token), postings_to_bytes(entity_ids)))
+
+            if len(batch) == BULK_TOKENS_PER_TRANSACTION:
+                self._append_postings(batch)
+                batch = []
+
+                time_diff = (datetime.now() - start_time_batch).total_seconds()
+                logger.info(
+                    f"Processed {idx} of {num_tokens} tokens ({items_per_second(BULK_TOKENS_PER_TRANSACTION, time_diff)} tokens/s)"
+                )
+                logger.debug(f"LMDB stats: {self._env.stat()}")
+                start_time_batch = datetime.now()
+
+        self._append_postings(batch)
+        self._env.sync()
+
+        time_diff = (datetime.now() - start_time).total_seconds()
+        logger.info(
+            f"Processed {idx} tokens in {time_diff} seconds ({items_per_second(idx, time_diff)} tokens/s)"
+        )
+
+    def _append_postings(self, batch: List[Tuple[bytes, bytes]]) -> None:
+        """Append the posting lists to the LMDB in a single transaction."""
+
+        # The bitmap keys sort before the entity keys, so they can't be appended
+        bitmaps = [
+            (b"B" + key[1:], Bitmap.from_postings(postings).to_bytes())
+            for key, postings in batch
+        ]
+
+        with self._env.begin(write=True) as txn:
+            cursor = txn.cursor()
+            _, num_added = cursor.putmulti(batch, append=True)
+            cursor.putmulti(bitmaps)
+
+        if num_added != len(batch):
+            raise Exception("Failed to append posting lists (tokens not in order)")
 
     def _write_token_counts(self):
         """Pickle the token counts and write to file."""
@@ -364,6 +885,8 @@ class LmdbLookup(Lookup):
         )
 
         num_tokens = len(self._tokens)
+        start_time = datetime.now()
+        start_time_batch = start_time
 
         with self._env.begin(write=True) as txn:
             for idx, token in enumerate(self._tokens):
@@ -372,24 +895,31 @@ class LmdbLookup(Lookup):
                 entity_ids = self._entity_ids_for_token_sqlite(token)
                 assert entity_ids is not None
 
-                # Deduplicate the entity IDs (this is required for entities that
-                # have repeated tokens)
-                entity_ids = list(set(entity_ids))
-
-                # Store the token to a pickled list of entity IDs in LMDB
-                txn.put(token_to_key(token), pickle_list(entity_ids))
-
-                # Store the token to a string of entity IDs in LMDB
-                s = " ".join([str(e) for e in entity_ids])
-                txn.put(token_to_string_key(token), s.encode("ascii"))
+                # Store the token to the posting list in LMDB (the entity IDs
+                # are deduplicated, which is required for entities that have
+                # repeated tokens)
+                postings = postings_to_bytes(entity_ids)
+                txn.put(token_to_postings_key(token), postings)
+                txn.put(
+                    token_to_bitmap_key(token),
+                    Bitmap.from_postings(postings).to_bytes(),
+                )
 
                 if idx % 100 == 0:
-                    logger.info(f"Processed {idx+1} of {num_tokens} tokens")
+                    time_diff = (datetime.now() - start_time_batch).total_seconds()
+                    logger.info(
+                        f"Processed {idx+1} of {num_tokens} tokens ({items_per_second(100, time_diff)} tokens/s)"
+                    )
                     logger.debug(f"LMDB stats: {self._env.stat()}")
                     self._env.sync()
+                    start_time_batch = datetime.now()
 
         self._env.sync()
-        logger.info(f"Processed {num_tokens} tokens")
+
+        time_diff = (datetime.now() - start_time).total_seconds()
+        logger.info(
+            f"Processed {num_tokens} tokens in {time_diff} seconds ({items_per_second(num_tokens, time_diff)} tokens/s)"
+        )
 
     def _entity_ids_for_token_sqlite(self, token: str) -> Optional[List[int]]:
         """Returns the entity IDs for a token from Sqlite."""
@@ -424,6 +954,35 @@ class LmdbLookup(Lookup):
 
         self._env.sync()
 
+    def _write_token_dictionary(self) -> None:
+        """Write the token to token ID mapping of the token dictionary to LMDB."""
+
+        logger.info(f"Writing the token dictionary ({len(self._dictionary)} tokens)")
+
+        items = sorted(
+            (token_to_token_id_key(token), str(token_id).encode("ascii"))
+            for token, token_id in self._dictionary.items()
+        )
+
+        for idx in range(0, len(items), TOKEN_IDS_PER_TRANSACTION):
+            with self._env.begin(write=True) as txn:
+                txn.cursor().putmulti(items[idx : idx + TOKEN_IDS_PER_TRANSACTION])
+
+        with self._env.begin(write=True) as txn:
+            value = str(len(self._dictionary)).encode("ascii")
+            txn.put(NUM_TOKEN_IDS_KEY.encode("ascii"), value)
+
+        self._env.sync()
+
+    def _write_format_version(self) -> None:
+        """Write the format version to LMDB."""
+
+        with self._env.begin(write=True) as txn:
+            value = str(self._format_version).encode("ascii")
+            txn.put(FORMAT_VERSION_KEY.encode("ascii"), value)
+
+        self._env.sync()
+
     def max_number_tokens_for_entity(self) -> int:
         """Get the maximum number of tokens for an entity."""
 
@@ -433,21 +992,105 @@ class LmdbLookup(Lookup):
         assert value is not None
         return int(value)
 
-    @lru_cache(maxsize=100000)
     def tokens_for_entity(self, internal_entity_id: int) -> Optional[Tokens]:
         """Get tokens for an entity given its internal ID."""
 
         assert_internal_entity_id_valid(internal_entity_id)
 
-        with self._env.begin() as txn:
-            result = txn.get(internal_entity_id_to_key(internal_entity_id))
+        key = internal_entity_id_to_key(internal_entity_id)
+        result = self._read_cached(key, lambda txn: txn.get(key))
 
         if result is None:
             return None
 
         return unpickle_list_str(result)
 
-    @lru_cache(maxsize=100000)
+    def token_ids_for_entity(self, internal_entity_id: int) -> Optional[TokenIds]:
+        """Get the token IDs of an entity's tokens given its internal ID."""
+
+        assert_internal_entity_id_valid(internal_entity_id)
+
+        # The lookup was built without a token dictionary
+        if self._format_version < TOKEN_IDS_FORMAT_VERSION:
+            tokens = self.tokens_for_entity(internal_entity_id)
+            if tokens is None:
+                return None
+            return self._dictionary.encode(tokens)
+
+        key = internal_entity_id_to_token_ids_key(internal_entity_id)
+        result = self._read_cached(key, lambda txn: txn.get(key))
+
+        if result is None:
+            return None
+
+        return bytes_to_token_ids(result)
+
+    def token_id(self, token: str) -> Optional[int]:
+        """Token ID of a token (None if the token isn't in any entity)."""
+
+        if self._format_version < TOKEN_IDS_FORMAT_VERSION:
+            return self._dictionary.token_id(token)
+
+        key = token_to_token_id_key(token)
+        result = self._read_cached(key, lambda txn: txn.get(key))
+
+        if result is None:
+            return None
+
+        return int(result)
+
+    def token_ids(self, tokens: Tokens) -> TokenIds:
+        """Token IDs of the tokens in a text (comparable with an entity's token IDs)."""
+
+        if self._format_version >= TOKEN_IDS_FORMAT_VERSION:
+            return encode_text(self.token_id, tokens)
+
+        # The tokens of a lookup built without a token dictionary are interned
+        # as they are seen, so that a token gets the same token ID if it is
+        # later read from an entity. Only the tokens of the entities are
+        # interned (so the dictionary doesn't grow with the texts)
+        return encode_text(self._intern_entity_token, tokens)
+
+    def _intern_entity_token(self, token: str) -> Optional[int]:
+        """Intern a token if it is in an entity (None if it isn't)."""
+
+        token_id = self._dictionary.token_id(token)
+        if token_id is None and self.has_token(token):
+            token_id = self._dictionary.add(token)
+
+        return token_id
+
+    def has_token(self, token: str) -> bool:
+        """Is the token in an entity (without reading its posting list)?"""
+
+        if self._format_version == LEGACY_FORMAT_VERSION:
+            key = token_to_string_key(token)
+        else:
+            key = token_to_postings_key(token)
+
+        with self._env.begin(buffers=True) as txn:
+            return txn.get(key) is not None
+
+    def entities(self) -> Iterator[Tuple[int, Tokens]]:
+        """Iterate over the internal entity IDs and tokens of all entities.
+
+        The entities are read with a cursor (bypassing the cache), so this is
+        suitable for scanning the whole lookup, e.g. to build an automaton.
+        """
+
+        prefix = internal_entity_id_to_key(0)[:1]
+
+        with self._env.begin() as txn:
+            cursor = txn.cursor()
+            if not cursor.set_range(prefix):
+                return
+
+            for key, value in cursor:
+                if not key.startswith(prefix):
+                    break
+
+                yield int(key[len(prefix) :]), unpickle_list_str(value)
+
     def entity_ids_for_token(self, token: str) -> Optional[Set[int]]:
         """Get the internal entity IDs for a given token."""
 
@@ -457,37 +1100,127 @@ class LmdbLookup(Lookup):
 
         return set(entity_ids)
 
-    @lru_cache(maxsize=100000)
     def entity_ids_for_token_list(self, token: str) -> Optional[List[int]]:
         """Get the internal entity IDs as a list for a given token."""
 
-        with self._env.begin() as txn:
-            result = txn.get(token_to_key(token))
+        if self._format_version == LEGACY_FORMAT_VERSION:
+            key = token_to_key(token)
+            result = self._read_cached(key, lambda txn: txn.get(key))
 
-        if result is None:
+            if result is None:
+                return None
+
+            return unpickle_list(result)
+
+        postings = self.entity_ids_for_token_postings(token)
+        if postings is None:
             return None
 
-        return unpickle_list(result)
+        return bytes_to_postings(postings).tolist()
 
-    @lru_cache(maxsize=100000)
     def entity_ids_for_token_string(self, token: str) -> Optional[str]:
         """Get the internal entity IDs as a string for a given token."""
 
-        with self._env.begin() as txn:
+        if self._format_version == LEGACY_FORMAT_VERSION:
+            with self._env.begin() as txn:
+                return self._entity_ids_string_for_token(txn, token)
+
+        entity_ids = self.entity_ids_for_token_list(token)
+        if entity_ids is None:
+            return None
+
+        return " ".join([str(e) for e in entity_ids])
+
+    def _entity_ids_string_for_token(self, txn: Any, token: str) -> Optional[str]:
+        """Get the internal entity IDs as a string for a token using a transaction."""
+
+        if self._format_version == LEGACY_FORMAT_VERSION:
             result = txn.get(token_to_string_key(token))
+            if result is None:
+                return None
 
+            # Convert the bytes (or buffer) returned by LMDB to a string
+            return bytes(result).decode("ascii")
+
+        result = txn.get(token_to_postings_key(token))
         if result is None:
             return None
 
-        # Convert the bytes returned by LMDB to a string
-        return result.decode("ascii")
+        return " ".join([str(e) for e in bytes_to_postings(result).tolist()])
+
+    def entity_ids_for_token_postings(self, token: str) -> Optional[Postings]:
+        """Get the internal entity IDs as a posting list for a given token."""
+
+        return self._read_cached(
+            token_to_postings_key(token),
+            lambda txn: self._entity_ids_postings_for_token(txn, token),
+        )
+
+    def _entity_ids_postings_for_token(
+        self, txn: Any, token: str
+    ) -> Optional[Postings]:
+        """Get the posting list for a token using a transaction."""
+
+        if self._format_version == LEGACY_FORMAT_VERSION:
+            result = self._entity_ids_string_for_token(txn, token)
+            if result is None:
+                return None
+
+            return postings_to_bytes([int(e) for e in result.split()])
+
+        return txn.get(token_to_postings_key(token))
+
+    def entity_ids_for_token_bitmap(self, token: str) -> Optional[Bitmap]:
+        """Get the internal entity IDs as a compressed bitmap for a given token."""
+
+        result = self._read_cached(
+            token_to_bitmap_key(token),
+            lambda txn: self._entity_ids_bitmap_for_token(txn, token),
+        )
+
+        if result is None:
+            return None
+
+        return Bitmap.from_bytes(result)
+
+    def _entity_ids_bitmap_for_token(self, txn: Any, token: str) -> Optional[bytes]:
+        """Get the serialised bitmap for a token using a transaction."""
+
+        if self._format_version != LEGACY_FORMAT_VERSION:
+            result = txn.get(token_to_bitmap_key(token))
+            if result is not None:
+                return result
+
+        # The lookup was built without the bitmaps
+        postings = self._entity_ids_postings_for_token(txn, token)
+        if postings is None:
+            return None
+
+        return Bitmap.from_postings(postings).to_bytes()
+
+    @contextmanager
+    def postings_reader(self) -> Iterator[PostingsReader]:
+        """Context manager providing a function to read posting lists.
+
+        The posting lists are memoryviews onto the LMDB's memory map, so they
+        are read without being copied, but they are only valid in the context.
+        The posting lists and the maximum entity ID are read in the same
+        transaction, so they are consistent if the lookup is being updated.
+        """
+
+        with self._env.begin(buffers=True) as txn:
+            max_entity_id = int(bytes(txn.get(MAX_ENTITY_ID_KEY.encode("ascii"))))
+            yield PostingsReader(
+                lambda token: self._entity_ids_postings_for_token(txn, token),
+                max_entity_id,
+            )
 
     def matching_entries(self, tokens: Tokens) -> Optional[Set[int]]:
         """Find the matching internal entities in the lookup given the tokens."""
 
-        # Get the entities for each token
+        # Intersect the compressed bitmaps of the tokens
         for idx, t in enumerate(tokens):
-            es = self.entity_ids_for_token(t)
+            es = self.entity_ids_for_token_bitmap(t)
 
             if es is None:
                 return None
@@ -501,7 +1234,7 @@ class LmdbLookup(Lookup):
             if len(entity_ids) == 0:
                 return None
 
-        return entity_ids
+        return entity_ids.to_set()
 
     def num_tokens_for_entity(self, internal_entity_id: int) -> Optional[int]:
         """Number of tokens for an entity given its internal ID."""
@@ -546,3 +1279,6 @@ class LmdbLookup(Lookup):
     def close(self):
         logger.info(f"Closing lookup. LMDB stats: {self._env.stat()}")
         self._env.close()
+
+        if self._cache is not None:
+            logger.info(f"Lookup cache stats: {self._cache.stats()}")
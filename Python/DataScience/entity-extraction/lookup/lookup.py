@@ -1,7 +1,27 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional, Set
+from typing import Callable, ContextManager, List, Optional, Set
 
 from domain import Tokens
+from lookup.bitmap import Bitmap
+from lookup.postings import Postings
+from lookup.token_dictionary import TokenIds
+
+
+class PostingsReader:
+    """Function to read posting lists from a consistent view of a lookup.
+
+    The maximum entity ID is read from the same view, so it is at least the
+    largest entity ID in any of the posting lists that are read.
+    """
+
+    def __init__(
+        self, read: Callable[[str], Optional[Postings]], max_entity_id: int
+    ) -> None:
+        self._read = read
+        self.max_entity_id = max_entity_id
+
+    def __call__(self, token: str) -> Optional[Postings]:
+        return self._read(token)
 
 
 class Lookup(ABC):
@@ -19,6 +39,16 @@ class Lookup(ABC):
         """Get tokens for an entity given its internal ID."""
         pass
 
+    @abstractmethod
+    def token_ids_for_entity(self, internal_entity_id: int) -> Optional[TokenIds]:
+        """Get the token IDs of an entity's tokens given its internal ID."""
+        pass
+
+    @abstractmethod
+    def token_ids(self, tokens: Tokens) -> TokenIds:
+        """Token IDs of the tokens in a text (comparable with an entity's token IDs)."""
+        pass
+
     @abstractmethod
     def entity_ids_for_token(self, token: str) -> Optional[Set[int]]:
         """Get the internal entity IDs for a given token."""
@@ -34,6 +64,27 @@ class Lookup(ABC):
         """Get the internal entity IDs as a string for a given token."""
         pass
 
+    @abstractmethod
+    def entity_ids_for_token_postings(self, token: str) -> Optional[Postings]:
+        """Get the internal entity IDs as a posting list for a given token."""
+        pass
+
+    @abstractmethod
+    def entity_ids_for_token_bitmap(self, token: str) -> Optional[Bitmap]:
+        """Get the internal entity IDs as a compressed bitmap for a given token."""
+        pass
+
+    @abstractmethod
+    def postings_reader(
+        self,
+    ) -> ContextManager[PostingsReader]:
+        """Context manager providing a function to read posting lists.
+
+        The posting lists returned by the function are only valid within the
+        context, which allows them to be read without being copied.
+        """
+        pass
+
     @abstractmethod
     def matching_entries(self, tokens: Tokens) -> Optional[Set[int]]:
         """Find the matching internal entities in the lookup given the tokens."""
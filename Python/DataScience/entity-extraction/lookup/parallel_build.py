@@ -0,0 +1,120 @@
+# Build an LmdbLookup in parallel from rows read from a DB-API database.
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Deque, List, Sequence, Tuple
+
+from loguru import logger
+from domain import Tokens
+from lookup.external_sort import write_run
+from lookup.lmdb_lookup import LmdbLookup, items_per_second
+
+# An entity as (internal entity ID, external entity ID, tokens)
+Entity = Tuple[int, str, Tokens]
+
+
+def tokenise_address(text: str) -> Tokens:
+    """Tokenise an address from the database."""
+
+    return [ri.replace(",", "").lower() for ri in text.split()]
+
+
+def tokenise_rows(
+    first_internal_entity_id: int,
+    rows: List[Sequence[Any]],
+    tokeniser: Callable[[str], Tokens],
+    run_filepath: str,
+) -> List[Entity]:
+    """Tokenise a batch of rows and write the (token, entity ID) pairs to a run.
+
+    Each row is (external entity ID, text). The rows are assigned consecutive
+    internal entity IDs starting at `first_internal_entity_id`.
+    """
+
+    entities: List[Entity] = []
+    pairs = []
+
+    for idx, row in enumerate(rows):
+        internal_entity_id = first_internal_entity_id + idx
+        tokens = tokeniser(row[1])
+
+        entities.append((internal_entity_id, str(row[0]), tokens))
+        pairs.extend([(token, internal_entity_id) for token in tokens])
+
+    write_run(pairs, run_filepath)
+
+    return entities
+
+
+def load_lookup_parallel(
+    lookup: LmdbLookup,
+    cursor: Any,
+    query: str,
+    num_workers: int,
+    batch_size: int = 10000,
+    tokeniser: Callable[[str], Tokens] = tokenise_address,
+) -> int:
+    """Load the lookup (in bulk load mode) from the rows returned by the query.
+
+    The rows are streamed from the DB-API `cursor` in batches and tokenised by
+    a pool of worker processes. Each worker writes the sorted (token, entity
+    ID) pairs for its batch to a run in the lookup's staging folder, which are
+    merged when the lookup is finalised. Returns the number of rows processed.
+    """
+
+    assert type(query) == str
+    assert type(num_workers) == int and num_workers > 0
+    assert type(batch_size) == int and batch_size > 0
+
+    cursor.execute(query)
+
+    num_rows_processed = 0
+    next_internal_entity_id = 0
+    start_time = datetime.now()
+    start_time_batch = datetime.now()
+
+    # Batches that have been submitted to the workers (in submission order)
+    pending: Deque[Tuple[Future, str]] = deque()
+
+    def add_completed_batch() -> None:
+        """Wait for the oldest batch and add its entities to the lookup."""
+
+        nonlocal num_rows_processed, start_time_batch
+
+        future, run_filepath = pending.popleft()
+        entities = future.result()
+        lookup.add_entities(entities, run_filepath)
+
+        num_rows_processed += len(entities)
+        time_diff = (datetime.now() - start_time_batch).total_seconds()
+        logger.info(
+            f"Processed {num_rows_processed} rows (batch of {len(entities)} at {items_per_second(len(entities), time_diff)} rows/s)"
+        )
+        start_time_batch = datetime.now()
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if len(rows) == 0:
+                break
+
+            run_filepath = lookup.next_run_filepath()
+            future = executor.submit(
+                tokenise_rows, next_internal_entity_id, rows, tokeniser, run_filepath
+            )
+            pending.append((future, run_filepath))
+            next_internal_entity_id += len(rows)
+
+            # Limit the number of batches held in memory
+            if len(pending) >= 2 * num_workers:
+                add_completed_batch()
+
+        while len(pending) > 0:
+            add_completed_batch()
+
+    time_diff = (datetime.now() - start_time).total_seconds()
+    logger.info(
+        f"Processed {num_rows_processed} rows in {time_diff} seconds ({items_per_second(num_rows_processed, time_diff)} rows/s)"
+    )
+
+    return num_rows_processed
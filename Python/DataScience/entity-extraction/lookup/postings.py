@@ -0,0 +1,106 @@
+from typing import List, Optional, Union
+
+import numpy as np
+
+# A posting list is a sorted array of unique internal entity IDs for a token,
+# stored as unsigned 32-bit integers (in the native byte order). It can be
+# held as bytes or as a memoryview of a buffer (e.g. one returned by LMDB).
+Postings = Union[bytes, memoryview]
+
+# Data type of an entity ID in a posting list
+POSTINGS_DTYPE = np.uint32
+
+
+def postings_to_bytes(entity_ids: List[int]) -> bytes:
+    """Convert a list of internal entity IDs to a posting list."""
+
+    assert type(entity_ids) == list
+    return np.unique(np.asarray(entity_ids, dtype=POSTINGS_DTYPE)).tobytes()
+
+
+def bytes_to_postings(b: Postings) -> np.ndarray:
+    """View a posting list as an array of internal entity IDs (without a copy)."""
+
+    return np.frombuffer(b, dtype=POSTINGS_DTYPE)
+
+
+def num_postings(b: Postings) -> int:
+    """Number of internal entity IDs in a posting list."""
+
+    return len(b) // np.dtype(POSTINGS_DTYPE).itemsize
+
+
+def merge_postings(
+    b: Optional[Postings], adds: List[int], removes: List[int]
+) -> Optional[bytes]:
+    """Remove and then add internal entity IDs to a (possibly missing) posting list.
+
+    The posting list is copied once however many entity IDs change. Returns
+    None if the posting list is empty.
+    """
+
+    entity_ids = (
+        np.empty(0, dtype=POSTINGS_DTYPE) if b is None else bytes_to_postings(b)
+    )
+
+    if len(removes) > 0:
+        entity_ids = np.setdiff1d(
+            entity_ids, np.asarray(removes, dtype=POSTINGS_DTYPE), assume_unique=True
+        )
+
+    if len(adds) > 0:
+        entity_ids = np.union1d(entity_ids, np.asarray(adds, dtype=POSTINGS_DTYPE))
+
+    if len(entity_ids) == 0:
+        return None
+
+    return entity_ids.astype(POSTINGS_DTYPE).tobytes()
+
+
+def prune_postings(
+    postings: List[Optional[Postings]], stop_token_frequency: int, max_window: int
+) -> List[Optional[Postings]]:
+    """Prune the posting lists of the frequent (stop) tokens in a text.
+
+    The tokens that belong to at most `stop_token_frequency` entities are
+    rare. The candidate entities of a stop token are those in the posting
+    lists of the rare tokens within `max_window - 1` tokens of it, so they only
+    depend on the tokens near it (not on the rest of the text). The posting
+    list of a stop token is reduced to its candidates, which are found by
+    binary search, so its cost is bounded by the number of candidates rather
+    than its length. An entity's stop tokens therefore only count towards a
+    match if one of its rare tokens is within `max_window - 1` tokens of them.
+    """
+
+    assert type(stop_token_frequency) == int and stop_token_frequency > 0
+    assert type(max_window) == int and max_window > 0
+
+    is_rare = [
+        p is not None and num_postings(p) <= stop_token_frequency for p in postings
+    ]
+
+    pruned: List[Optional[Postings]] = []
+    for position, p in enumerate(postings):
+        if p is None or is_rare[position]:
+            pruned.append(p)
+            continue
+
+        # Candidates from the rare tokens within the window of the stop token
+        first = max(0, position - (max_window - 1))
+        last = min(len(postings), position + max_window)
+        rare = [
+            bytes_to_postings(postings[j]) for j in range(first, last) if is_rare[j]
+        ]
+        if len(rare) == 0:
+            pruned.append(None)
+            continue
+
+        candidates = np.unique(np.concatenate(rare))
+
+        # Find the candidates in the sorted posting list
+        entity_ids = bytes_to_postings(p)
+        idx = np.minimum(np.searchsorted(entity_ids, candidates), len(entity_ids) - 1)
+        members = candidates[entity_ids[idx] == candidates]
+        pruned.append(members.tobytes() if len(members) > 0 else None)
+
+    return pruned
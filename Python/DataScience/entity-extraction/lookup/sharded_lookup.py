@@ -0,0 +1,313 @@
+import json
+import os
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from loguru import logger
+from domain import (
+    Tokens,
+    assert_external_entity_id_valid,
+    assert_internal_entity_id_valid,
+    assert_token_valid,
+    assert_tokens_valid,
+)
+from lookup.bitmap import Bitmap
+from lookup.lmdb_lookup import LmdbLookup
+from lookup.lookup import Lookup, PostingsReader
+from lookup.postings import POSTINGS_DTYPE, Postings, bytes_to_postings
+from lookup.shared_cache import SharedCache
+from lookup.token_dictionary import TokenDictionary, TokenIds, encode_text
+
+# Name of the file (in the lookup's folder) that describes the shards
+SHARDS_FILENAME = "shards.json"
+
+
+def shard_folder(folder: str, shard_idx: int) -> str:
+    """Folder of a shard within the sharded lookup's folder."""
+
+    assert type(folder) == str
+    assert type(shard_idx) == int and shard_idx >= 0
+
+    return os.path.join(folder, f"shard-{shard_idx:03d}")
+
+
+class ShardedLmdbLookup(Lookup):
+    """Entities partitioned by internal entity ID range across LMDB lookups.
+
+    Entity `i` is held in shard `i // shard_size` with a local entity ID of
+    `i % shard_size`, so the entity IDs within a shard are bounded by the shard
+    size. The methods of the Lookup interface use the (global) internal entity
+    IDs.
+    """
+
+    def __init__(
+        self,
+        lmdb_folder: str,
+        load_mode: bool,
+        shard_size: Optional[int] = None,
+        staging_folder: Optional[str] = None,
+        cache: Optional[SharedCache] = None,
+    ):
+        assert type(lmdb_folder) == str
+        assert type(load_mode) == bool
+
+        self._lmdb_folder = lmdb_folder
+        self._load_mode = load_mode
+        self._staging_folder = staging_folder
+
+        # Cache shared by the shards in read mode (None if the values aren't
+        # cached)
+        self._cache = cache
+
+        # Lookup for each shard (by shard index)
+        self._shards: Dict[int, LmdbLookup] = {}
+
+        # Each shard has its own token dictionary, so the token IDs across
+        # the shards are interned in a dictionary local to this process
+        self._dictionary = TokenDictionary()
+
+        if self._load_mode:
+            assert type(shard_size) == int and shard_size > 0
+            assert type(staging_folder) == str
+
+            logger.info(f"Sharded lookup in load mode (shard size: {shard_size})")
+            self._shard_size = shard_size
+            os.makedirs(self._lmdb_folder, exist_ok=True)
+        else:
+            self._initialise_read_mode()
+
+    def _initialise_read_mode(self) -> None:
+        """Open each of the shards for reading."""
+
+        filepath = os.path.join(self._lmdb_folder, SHARDS_FILENAME)
+        if not os.path.exists(filepath):
+            raise Exception(f"Sharded lookup description doesn't exist: {filepath}")
+
+        with open(filepath, "r") as fp:
+            description = json.load(fp)
+
+        self._shard_size = description["shard_size"]
+        logger.info(
+            f"Sharded lookup in read mode ({len(description['shards'])} shards of size {self._shard_size})"
+        )
+
+        for shard_idx in description["shards"]:
+            self._shards[shard_idx] = LmdbLookup(
+                shard_folder(self._lmdb_folder, shard_idx), False, cache=self._cache
+            )
+
+    def shard_size(self) -> int:
+        """Number of internal entity IDs in the range held by each shard."""
+
+        return self._shard_size
+
+    def shards(self) -> List[Tuple[str, int]]:
+        """Folder and first internal entity ID of each shard."""
+
+        return [
+            (shard_folder(self._lmdb_folder, shard_idx), shard_idx * self._shard_size)
+            for shard_idx in sorted(self._shards)
+        ]
+
+    def _shard_for_entity(self, internal_entity_id: int) -> Tuple[int, int]:
+        """Shard index and local entity ID of an entity."""
+
+        assert_internal_entity_id_valid(internal_entity_id)
+        return divmod(internal_entity_id, self._shard_size)
+
+    def _shard_for_loading(self, shard_idx: int) -> LmdbLookup:
+        """Lookup for a shard in load mode (created on first use)."""
+
+        if shard_idx not in self._shards:
+            assert self._staging_folder is not None
+
+            self._shards[shard_idx] = LmdbLookup(
+                shard_folder(self._lmdb_folder, shard_idx),
+                True,
+                staging_folder=os.path.join(
+                    self._staging_folder, f"shard-{shard_idx:03d}"
+                ),
+            )
+
+        return self._shards[shard_idx]
+
+    def add(
+        self, internal_entity_id: int, external_entity_id: str, tokens: Tokens
+    ) -> None:
+        """Add an entity to the shard that holds its entity ID range."""
+
+        assert self._load_mode
+        assert_external_entity_id_valid(external_entity_id)
+        assert_tokens_valid(tokens)
+
+        shard_idx, local_entity_id = self._shard_for_entity(internal_entity_id)
+        self._shard_for_loading(shard_idx).add(
+            local_entity_id, external_entity_id, tokens
+        )
+
+    def finalise(self) -> None:
+        """Finalise each of the shards and write the description of the shards."""
+
+        assert self._load_mode
+
+        for shard_idx in sorted(self._shards):
+            logger.info(f"Finalising shard {shard_idx}")
+            self._shards[shard_idx].finalise()
+
+        with open(os.path.join(self._lmdb_folder, SHARDS_FILENAME), "w") as fp:
+            json.dump(
+                {"shard_size": self._shard_size, "shards": sorted(self._shards)}, fp
+            )
+
+    def tokens_for_entity(self, internal_entity_id: int) -> Optional[Tokens]:
+        """Get tokens for an entity given its internal ID."""
+
+        shard_idx, local_entity_id = self._shard_for_entity(internal_entity_id)
+        if shard_idx not in self._shards:
+            return None
+
+        return self._shards[shard_idx].tokens_for_entity(local_entity_id)
+
+    def token_ids_for_entity(self, internal_entity_id: int) -> Optional[TokenIds]:
+        """Get the token IDs of an entity's tokens given its internal ID."""
+
+        tokens = self.tokens_for_entity(internal_entity_id)
+        if tokens is None:
+            return None
+
+        return self._dictionary.encode(tokens)
+
+    def token_ids(self, tokens: Tokens) -> TokenIds:
+        """Token IDs of the tokens in a text (comparable with an entity's token IDs).
+
+        The tokens of the entities are added to the local dictionary, so that a
+        token gets the same token ID if it is later read from an entity. The
+        other tokens are given unknown token IDs (so the dictionary doesn't
+        grow with the texts).
+        """
+
+        return encode_text(self._intern_entity_token, tokens)
+
+    def _intern_entity_token(self, token: str) -> Optional[int]:
+        """Intern a token if it is in an entity of any shard (None if it isn't)."""
+
+        token_id = self._dictionary.token_id(token)
+        if token_id is not None:
+            return token_id
+
+        for shard in self._shards.values():
+            if shard.has_token(token):
+                return self._dictionary.add(token)
+
+        return None
+
+    def entity_ids_for_token(self, token: str) -> Optional[Set[int]]:
+        """Get the entity IDs for a given token."""
+
+        entity_ids = self.entity_ids_for_token_list(token)
+        if entity_ids is None:
+            return None
+
+        return set(entity_ids)
+
+    def entity_ids_for_token_list(self, token: str) -> Optional[List[int]]:
+        """Get the sorted entity IDs as a list for a given token."""
+
+        postings = self.entity_ids_for_token_postings(token)
+        if postings is None:
+            return None
+
+        return bytes_to_postings(postings).tolist()
+
+    def entity_ids_for_token_string(self, token: str) -> Optional[str]:
+        """Get the entity IDs as a space-separated string for a given token."""
+
+        entity_ids = self.entity_ids_for_token_list(token)
+        if entity_ids is None:
+            return None
+
+        return " ".join([str(e) for e in entity_ids])
+
+    def entity_ids_for_token_postings(self, token: str) -> Optional[Postings]:
+        """Get the posting list of (global) entity IDs for a given token."""
+
+        assert_token_valid(token)
+
+        # The shards hold ascending ranges of entity IDs, so concatenating the
+        # offset posting lists in shard order gives a sorted posting list
+        parts = []
+        for shard_idx in sorted(self._shards):
+            postings = self._shards[shard_idx].entity_ids_for_token_postings(token)
+            if postings is not None:
+                parts.append(
+                    bytes_to_postings(postings) + shard_idx * self._shard_size
+                )
+
+        if len(parts) == 0:
+            return None
+
+        return np.concatenate(parts).astype(POSTINGS_DTYPE).tobytes()
+
+    def entity_ids_for_token_bitmap(self, token: str) -> Optional[Bitmap]:
+        """Get the (global) entity IDs as a compressed bitmap for a given token."""
+
+        postings = self.entity_ids_for_token_postings(token)
+        if postings is None:
+            return None
+
+        return Bitmap.from_postings(postings)
+
+    @contextmanager
+    def postings_reader(self) -> Iterator[PostingsReader]:
+        """Context in which posting lists can be read."""
+
+        yield PostingsReader(self.entity_ids_for_token_postings, self.max_entity_id())
+
+    def matching_entries(self, tokens: Tokens) -> Optional[Set[int]]:
+        """Find the matching internal entities in the lookup given the tokens."""
+
+        entity_ids: Set[int] = set()
+        for shard_idx in sorted(self._shards):
+            matches = self._shards[shard_idx].matching_entries(tokens)
+            if matches is not None:
+                entity_ids.update([shard_idx * self._shard_size + e for e in matches])
+
+        if len(entity_ids) == 0:
+            return None
+
+        return entity_ids
+
+    def max_number_tokens_for_entity(self) -> int:
+        """Get the maximum number of tokens for an entity."""
+
+        return max([s.max_number_tokens_for_entity() for s in self._shards.values()])
+
+    def num_tokens_for_entity(self, internal_entity_id: int) -> Optional[int]:
+        """Number of tokens for an entity given its internal ID."""
+
+        shard_idx, local_entity_id = self._shard_for_entity(internal_entity_id)
+        if shard_idx not in self._shards:
+            return None
+
+        return self._shards[shard_idx].num_tokens_for_entity(local_entity_id)
+
+    def max_entity_id(self) -> int:
+        """Maximum entity ID."""
+
+        shard_idx = max(self._shards)
+        return shard_idx * self._shard_size + self._shards[shard_idx].max_entity_id()
+
+    def external_entity_id(self, internal_entity_id: int) -> Optional[str]:
+        """Get the external entity ID given its internal ID."""
+
+        shard_idx, local_entity_id = self._shard_for_entity(internal_entity_id)
+        if shard_idx not in self._shards:
+            return None
+
+        return self._shards[shard_idx].external_entity_id(local_entity_id)
+
+    def close(self) -> None:
+        for shard in self._shards.values():
+            shard.close()
@@ -0,0 +1,436 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import threading
+import time
+
+from typing import Dict, Optional
+from loguru import logger
+
+# A cache of byte strings (keyed by byte strings) held in a single block of
+# memory. The block is either anonymous (private to the process) or a memory
+# mapped file (e.g. in /dev/shm), which is shared by all of the processes that
+# open it. The block is laid out as:
+#
+# <header: HEADER_FIELDS x uint64>
+# <index: num_buckets x BUCKET_WAYS x (hash, offset, length, seq) as uint64>
+# <arena: records of (seq, hash, key length, value length, key, value)>
+#
+# The records are written to the arena as a ring buffer. When there isn't
+# room for a new record, the oldest records are evicted, so the memory used
+# is bounded by the size of the block (in bytes) rather than the number of
+# entries. The eviction is first in, first out: reading a record doesn't
+# keep it in the cache for longer (which would need a write on every read).
+#
+# A lookup finds the record via the key's bucket in the index, which holds up
+# to BUCKET_WAYS entries (the oldest entry in a full bucket is replaced).
+#
+# Writers hold an exclusive lock (a thread lock and a lock on the file).
+# Readers don't take the lock: they read the header's version before and
+# after reading a record and retry if a write happened in between. A writer
+# that holds the lock sets the version (rather than incrementing it), so a
+# version left odd by a process killed part way through a write is repaired
+# by the next write.
+
+# Identifies an initialised cache
+MAGIC = 0x45584143484543
+
+# Header fields (indices into the header)
+MAGIC_FIELD = 0
+VERSION_FIELD = 1  # Odd while a write is in progress
+NUM_BUCKETS_FIELD = 2
+ARENA_SIZE_FIELD = 3
+HEAD_FIELD = 4  # Offset of the oldest record
+TAIL_FIELD = 5  # Offset at which the next record is written
+WRAP_FIELD = 6  # End of the records before the ring buffer wrapped
+COUNT_FIELD = 7  # Number of records in the arena
+USED_FIELD = 8  # Number of bytes of records in the arena
+SEQ_FIELD = 9  # Sequence number of the last record written
+ENTRIES_FIELD = 10  # Number of entries in the index
+HITS_FIELD = 11
+MISSES_FIELD = 12
+EVICTIONS_FIELD = 13
+HEADER_FIELDS = 16
+
+# Number of entries in a bucket of the index
+BUCKET_WAYS = 4
+
+# Fields of an index entry
+INDEX_FIELDS = 4
+
+# Number of bytes of the arena per bucket in the index
+ARENA_BYTES_PER_BUCKET = 1024
+
+# Size of a record's header in bytes (seq, hash, key and value lengths)
+RECORD_HEADER_SIZE = 24
+
+# Minimum capacity of a cache in bytes
+MIN_CAPACITY = 64 * 1024
+
+# Number of times a read is retried before it is treated as a miss
+MAX_READ_ATTEMPTS = 10
+
+# Time in seconds that a reader waits for a write to finish before retrying
+READ_RETRY_DELAY = 0.00001
+
+
+def key_hash(key: bytes) -> int:
+    """Hash of a key that is the same in every process (and non-zero)."""
+
+    h = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+    return h or 1
+
+
+def record_size(key: bytes, value: bytes) -> int:
+    """Size of a record in the arena (padded to a multiple of 8 bytes)."""
+
+    return (RECORD_HEADER_SIZE + len(key) + len(value) + 7) // 8 * 8
+
+
+class SharedCache:
+    """Byte-bounded FIFO cache that can be shared across processes."""
+
+    def __init__(self, capacity: int, filepath: Optional[str] = None) -> None:
+        assert type(capacity) == int and capacity >= MIN_CAPACITY
+        assert filepath is None or type(filepath) == str
+
+        self._filepath = filepath
+        self._thread_lock = threading.Lock()
+
+        # File descriptor of the memory mapped file (None if private)
+        self._fd: Optional[int] = None
+
+        if filepath is None:
+            self._mmap = mmap.mmap(-1, capacity)
+            self._layout(capacity)
+            self._initialise()
+        else:
+            self._fd = os.open(filepath, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                # The first process to open the file initialises it
+                initialise = os.fstat(self._fd).st_size == 0
+                if initialise:
+                    os.ftruncate(self._fd, capacity)
+                else:
+                    capacity = os.fstat(self._fd).st_size
+
+                self._mmap = mmap.mmap(self._fd, capacity)
+                self._layout(capacity)
+
+                if initialise:
+                    self._initialise()
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+            if self._header[MAGIC_FIELD] != MAGIC:
+                self.close()
+                raise Exception(f"Invalid shared cache file: {filepath}")
+
+        if filepath is None:
+            logger.info(f"Private cache of {capacity} bytes")
+        else:
+            logger.info(f"Shared cache of {capacity} bytes: {filepath}")
+
+    def _layout(self, capacity: int) -> None:
+        """Views of the header, index and arena in the memory block."""
+
+        num_buckets = max(1, capacity // ARENA_BYTES_PER_BUCKET)
+        index_end = HEADER_FIELDS * 8 + num_buckets * BUCKET_WAYS * INDEX_FIELDS * 8
+
+        # The header and index are viewed as unsigned 64-bit integers
+        self._view = memoryview(self._mmap)
+        self._header = self._view[: HEADER_FIELDS * 8].cast("Q")
+        self._index = self._view[HEADER_FIELDS * 8 : index_end].cast("Q")
+
+        self._arena_offset = index_end
+        self._arena_size = (capacity - index_end) // 8 * 8
+        self._num_buckets = num_buckets
+
+    def _initialise(self) -> None:
+        """Initialise the header of a new (zeroed) memory block."""
+
+        self._header[NUM_BUCKETS_FIELD] = self._num_buckets
+        self._header[ARENA_SIZE_FIELD] = self._arena_size
+        self._header[WRAP_FIELD] = self._arena_size
+        self._header[MAGIC_FIELD] = MAGIC
+
+    def _bucket(self, h: int) -> int:
+        """Offset in the index of the first entry of a key's bucket."""
+
+        return (h % self._num_buckets) * BUCKET_WAYS * INDEX_FIELDS
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        """Get the value for a key (None if it isn't in the cache)."""
+
+        h = key_hash(key)
+        bucket = self._bucket(h)
+        header = self._header
+
+        for attempt in range(MAX_READ_ATTEMPTS):
+            # Give the writer a chance to finish before retrying
+            if attempt > 0:
+                time.sleep(READ_RETRY_DELAY)
+
+            version = header[VERSION_FIELD]
+            if version % 2 == 1:
+                continue
+
+            value = self._read(bucket, h, key)
+
+            if header[VERSION_FIELD] == version:
+                break
+        else:
+            value = None
+
+        # The counters are updated without the lock, so they are approximate
+        if value is None:
+            header[MISSES_FIELD] += 1
+        else:
+            header[HITS_FIELD] += 1
+
+        return value
+
+    def _read(self, bucket: int, h: int, key: bytes) -> Optional[bytes]:
+        """Read the value for a key from its bucket (which may be torn)."""
+
+        entries = self._index[bucket : bucket + BUCKET_WAYS * INDEX_FIELDS].tolist()
+
+        for way in range(0, BUCKET_WAYS * INDEX_FIELDS, INDEX_FIELDS):
+            entry_hash, offset, length, seq = entries[way : way + INDEX_FIELDS]
+            if seq == 0 or entry_hash != h or offset + length > self._arena_size:
+                continue
+
+            start = self._arena_offset + offset
+            record = self._mmap[start : start + length]
+            if int.from_bytes(record[0:8], "little") != seq:
+                continue
+
+            key_length = int.from_bytes(record[16:20], "little")
+            value_length = int.from_bytes(record[20:24], "little")
+            end = RECORD_HEADER_SIZE + key_length
+            if record[RECORD_HEADER_SIZE:end] != key:
+                continue
+
+            return record[end : end + value_length]
+
+        return None
+
+    def put(self, key: bytes, value: bytes) -> None:
+        """Put a key and its value into the cache (evicting the oldest)."""
+
+        size = record_size(key, value)
+
+        # Don't cache values that would evict a large part of the cache
+        if size > self._arena_size // 4:
+            return
+
+        with self._write_lock():
+            h = key_hash(key)
+            offset = self._allocate(size)
+
+            seq = self._header[SEQ_FIELD] + 1
+            self._header[SEQ_FIELD] = seq
+
+            # Write the record
+            start = self._arena_offset + offset
+            self._mmap[start : start + RECORD_HEADER_SIZE] = (
+                seq.to_bytes(8, "little")
+                + h.to_bytes(8, "little")
+                + len(key).to_bytes(4, "little")
+                + len(value).to_bytes(4, "little")
+            )
+            end = start + RECORD_HEADER_SIZE + len(key)
+            self._mmap[start + RECORD_HEADER_SIZE : end] = key
+            self._mmap[end : end + len(value)] = value
+
+            # Replace an existing entry for the key, an empty entry or the
+            # oldest entry in the bucket
+            entry = self._entry_for_key(h, key)
+            if self._index[entry + 3] == 0:
+                self._header[ENTRIES_FIELD] += 1
+            elif not self._has_key(entry, h, key):
+                self._header[EVICTIONS_FIELD] += 1
+
+            self._set_entry(entry, h, offset, size, seq)
+
+    def _set_entry(self, entry: int, h: int, offset: int, size: int, seq: int) -> None:
+        """Set the fields of an entry in the index."""
+
+        self._index[entry] = h
+        self._index[entry + 1] = offset
+        self._index[entry + 2] = size
+        self._index[entry + 3] = seq
+
+    def _entry_for_key(self, h: int, key: bytes) -> int:
+        """Entry of the key's bucket in which to store the key."""
+
+        bucket = self._bucket(h)
+        entries = range(bucket, bucket + BUCKET_WAYS * INDEX_FIELDS, INDEX_FIELDS)
+
+        for entry in entries:
+            if self._has_key(entry, h, key):
+                return entry
+
+        for entry in entries:
+            if self._index[entry + 3] == 0:
+                return entry
+
+        # The entry with the oldest record
+        return min(entries, key=lambda entry: self._index[entry + 3])
+
+    def _has_key(self, entry: int, h: int, key: bytes) -> bool:
+        """Is the entry in the index for the key?"""
+
+        if self._index[entry + 3] == 0 or self._index[entry] != h:
+            return False
+
+        start = self._arena_offset + self._index[entry + 1]
+        key_length = int.from_bytes(self._mmap[start + 16 : start + 20], "little")
+        end = start + RECORD_HEADER_SIZE + key_length
+        return self._mmap[start + RECORD_HEADER_SIZE : end] == key
+
+    def _allocate(self, size: int) -> int:
+        """Allocate a record in the arena, evicting the oldest records."""
+
+        header = self._header
+
+        while True:
+            head = header[HEAD_FIELD]
+            tail = header[TAIL_FIELD]
+
+            # The records run from the head to the tail unless the ring buffer
+            # has wrapped (so the records run from the head to the wrap and
+            # from the start to the tail)
+            wrapped = tail < head or (tail == head and header[COUNT_FIELD] > 0)
+
+            if not wrapped:
+                if tail + size <= self._arena_size:
+                    break
+
+                if size <= head:
+                    header[WRAP_FIELD] = tail
+                    header[TAIL_FIELD] = 0
+                    continue
+
+            elif tail + size <= head:
+                break
+
+            self._evict_oldest()
+
+        header[TAIL_FIELD] = tail + size
+        header[COUNT_FIELD] += 1
+        header[USED_FIELD] += size
+
+        return tail
+
+    def _evict_oldest(self) -> None:
+        """Evict the oldest record in the arena."""
+
+        header = self._header
+        head = header[HEAD_FIELD]
+
+        start = self._arena_offset + head
+        seq = int.from_bytes(self._mmap[start : start + 8], "little")
+        h = int.from_bytes(self._mmap[start + 8 : start + 16], "little")
+        key_length = int.from_bytes(self._mmap[start + 16 : start + 20], "little")
+        value_length = int.from_bytes(self._mmap[start + 20 : start + 24], "little")
+        size = (RECORD_HEADER_SIZE + key_length + value_length + 7) // 8 * 8
+
+        # Remove the record's entry from the index (unless it has already
+        # been replaced)
+        bucket = self._bucket(h)
+        for entry in range(bucket, bucket + BUCKET_WAYS * INDEX_FIELDS, INDEX_FIELDS):
+            if self._index[entry + 3] == seq:
+                self._set_entry(entry, 0, 0, 0, 0)
+                header[EVICTIONS_FIELD] += 1
+                header[ENTRIES_FIELD] -= 1
+
+        head += size
+        header[COUNT_FIELD] -= 1
+        header[USED_FIELD] -= size
+
+        if header[COUNT_FIELD] == 0:
+            header[HEAD_FIELD] = 0
+            header[TAIL_FIELD] = 0
+            header[WRAP_FIELD] = self._arena_size
+        elif head >= header[WRAP_FIELD]:
+            header[HEAD_FIELD] = 0
+            header[WRAP_FIELD] = self._arena_size
+        else:
+            header[HEAD_FIELD] = head
+
+    def _write_lock(self):
+        """Context in which the cache is written."""
+
+        return _WriteLock(self)
+
+    def clear(self) -> None:
+        """Remove all of the entries from the cache (keeping the counters)."""
+
+        with self._write_lock():
+            self._mmap[HEADER_FIELDS * 8 : self._arena_offset] = bytes(
+                self._arena_offset - HEADER_FIELDS * 8
+            )
+            for field in [HEAD_FIELD, TAIL_FIELD, COUNT_FIELD, USED_FIELD]:
+                self._header[field] = 0
+            self._header[ENTRIES_FIELD] = 0
+            self._header[WRAP_FIELD] = self._arena_size
+
+    def stats(self) -> Dict[str, int]:
+        """Counters and sizes of the cache."""
+
+        return {
+            "hits": self._header[HITS_FIELD],
+            "misses": self._header[MISSES_FIELD],
+            "evictions": self._header[EVICTIONS_FIELD],
+            "entries": self._header[ENTRIES_FIELD],
+            "bytes": self._header[USED_FIELD],
+            "capacity": self._arena_size,
+        }
+
+    def close(self) -> None:
+        """Close the cache (the shared file remains for other processes)."""
+
+        # Release the views of the memory map before closing it
+        self._header.release()
+        self._index.release()
+        self._view.release()
+        self._mmap.close()
+
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def unlink(self) -> None:
+        """Delete the shared file (once all of the processes are done with it)."""
+
+        if self._filepath is not None and os.path.exists(self._filepath):
+            os.remove(self._filepath)
+
+
+class _WriteLock:
+    """Exclusive lock on the cache across threads and processes."""
+
+    def __init__(self, cache: SharedCache) -> None:
+        self._cache = cache
+
+    def __enter__(self) -> None:
+        self._cache._thread_lock.acquire()
+        if self._cache._fd is not None:
+            fcntl.flock(self._cache._fd, fcntl.LOCK_EX)
+
+        # Mark a write as being in progress for the readers (the lock means
+        # that no other writer is running, so the version may have been left
+        # odd by a writer that died)
+        header = self._cache._header
+        header[VERSION_FIELD] = header[VERSION_FIELD] | 1
+
+    def __exit__(self, *args) -> None:
+        header = self._cache._header
+        header[VERSION_FIELD] = (header[VERSION_FIELD] | 1) + 1
+
+        if self._cache._fd is not None:
+            fcntl.flock(self._cache._fd, fcntl.LOCK_UN)
+        self._cache._thread_lock.release()
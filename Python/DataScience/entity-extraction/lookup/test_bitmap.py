@@ -0,0 +1,61 @@
+import numpy as np
+
+from lookup.bitmap import MAX_ARRAY_CONTAINER_SIZE, Bitmap, is_bitset
+from lookup.postings import postings_to_bytes
+
+
+def test_bitmap():
+    entity_ids = [3, 1, 65535, 65536, 200000, 3000000000]
+    bitmap = Bitmap.from_list(entity_ids)
+
+    assert len(bitmap) == 6
+    assert list(bitmap) == sorted(entity_ids)
+    assert bitmap.to_set() == set(entity_ids)
+    assert 65536 in bitmap
+    assert 2 not in bitmap
+    assert 131072 not in bitmap
+
+    # The bitmap of a posting list
+    assert Bitmap.from_postings(postings_to_bytes(entity_ids)) == bitmap
+
+    # Serialise and deserialise the bitmap
+    assert Bitmap.from_bytes(bitmap.to_bytes()) == bitmap
+    assert len(Bitmap.from_list([])) == 0
+    assert Bitmap.from_bytes(Bitmap.from_list([]).to_bytes()) == Bitmap.from_list([])
+
+
+def test_bitmap_intersection():
+    rng = np.random.default_rng(1)
+
+    # Sets of entity IDs giving array and bitset containers
+    sparse = rng.choice(200000, 3000, replace=False).tolist()
+    dense = rng.choice(200000, 100000, replace=False).tolist()
+    dense_2 = rng.choice(200000, 100000, replace=False).tolist()
+
+    for a in [sparse, dense]:
+        for b in [sparse, dense, dense_2, [], [5, 199999]]:
+            expected = set(a).intersection(b)
+            actual = Bitmap.from_list(a).intersection(Bitmap.from_list(b))
+            assert actual.to_set() == expected
+            assert len(actual) == len(expected)
+
+            # Intersecting a deserialised bitmap
+            actual = Bitmap.from_bytes(Bitmap.from_list(a).to_bytes()).intersection(
+                Bitmap.from_list(b)
+            )
+            assert actual.to_set() == expected
+
+
+def test_bitmap_containers():
+    # A dense chunk is held as a bitset, which reverts to an array when the
+    # intersection is sparse
+    dense = Bitmap.from_list(list(range(0, 2 * MAX_ARRAY_CONTAINER_SIZE)))
+    assert is_bitset(dense._containers[0])
+
+    sparse = dense.intersection(Bitmap.from_list(list(range(0, 10))))
+    assert not is_bitset(sparse._containers[0])
+    assert list(sparse) == list(range(0, 10))
+
+    dense = dense.intersection(dense)
+    assert is_bitset(dense._containers[0])
+    assert len(dense) == 2 * MAX_ARRAY_CONTAINER_SIZE
@@ -0,0 +1,76 @@
+import os
+import shutil
+
+from lookup.external_sort import ExternalSorter, group_pairs, merge_runs, write_run
+
+TEST_STAGING_FOLDER = "./data/test-external-sort"
+
+
+def delete_temp():
+    if os.path.exists(TEST_STAGING_FOLDER):
+        shutil.rmtree(TEST_STAGING_FOLDER)
+
+
+def test_group_pairs():
+    assert list(group_pairs([])) == []
+    assert list(group_pairs([("a", 1)])) == [("a", [1])]
+    assert list(group_pairs([("a", 1), ("a", 1), ("a", 3), ("b", 2)])) == [
+        ("a", [1, 3]),
+        ("b", [2]),
+    ]
+
+
+def test_merge_runs():
+    delete_temp()
+    os.makedirs(TEST_STAGING_FOLDER)
+
+    run_0 = os.path.join(TEST_STAGING_FOLDER, "run-0.tsv")
+    run_1 = os.path.join(TEST_STAGING_FOLDER, "run-1.tsv")
+    write_run([("c", 2), ("a", 4), ("a", 0)], run_0)
+    write_run([("b", 3), ("a", 1), ("c", 2)], run_1)
+
+    assert list(merge_runs([run_0, run_1])) == [
+        ("a", [0, 1, 4]),
+        ("b", [3]),
+        ("c", [2]),
+    ]
+
+    delete_temp()
+
+
+def test_external_sorter():
+    delete_temp()
+
+    # Each run holds at most two pairs, so the pairs are spread over runs
+    sorter = ExternalSorter(TEST_STAGING_FOLDER, max_run_size=2)
+
+    pairs = [("street", 2), ("london", 1), ("78", 0), ("street", 0), ("london", 0)]
+    for token, entity_id in pairs:
+        sorter.add(token, entity_id)
+
+    assert list(sorter.merged()) == [
+        ("78", [0]),
+        ("london", [0, 1]),
+        ("street", [0, 2]),
+    ]
+    assert len(os.listdir(TEST_STAGING_FOLDER)) == 3
+
+    sorter.cleanup()
+    assert not os.path.exists(TEST_STAGING_FOLDER)
+
+
+def test_external_sorter_many_runs(monkeypatch):
+    delete_temp()
+
+    # Force the runs to be merged into intermediate runs
+    monkeypatch.setattr("lookup.external_sort.MAX_MERGE_FAN_IN", 2)
+    sorter = ExternalSorter(TEST_STAGING_FOLDER, max_run_size=1)
+
+    for entity_id in range(7):
+        sorter.add("token", 6 - entity_id)
+
+    assert list(sorter.merged()) == [("token", [0, 1, 2, 3, 4, 5, 6])]
+    assert len(os.listdir(TEST_STAGING_FOLDER)) == 2
+
+    sorter.cleanup()
+    assert not os.path.exists(TEST_STAGING_FOLDER)
@@ -1,4 +1,5 @@
 from lookup.in_memory_lookup import InMemoryLookup
+from lookup.postings import bytes_to_postings
 
 
 def test_lookup():
@@ -34,6 +35,12 @@ def test_lookup():
     assert l.entity_ids_for_token_string("Broad") == "1"
     assert l.entity_ids_for_token_string("Way") is None
 
+    assert bytes_to_postings(l.entity_ids_for_token_postings("80")).tolist() == [0, 1]
+    assert l.entity_ids_for_token_postings("Way") is None
+
+    with l.postings_reader() as read_postings:
+        assert bytes_to_postings(read_postings("Broad")).tolist() == [1]
+
     assert l.num_tokens_for_entity(0) == 3
     assert l.num_tokens_for_entity(1) == 3
     assert l.num_tokens_for_entity(100) is None  # Doesn't exist
@@ -69,3 +76,14 @@ def test_matching_entries():
     # Match three tokens
     assert l.matching_entries(["80", "Street", "Straight"]) == {0}
     assert l.matching_entries(["81", "Street", "Straight"]) is None
+
+
+def test_lookup_token_ids():
+    l = InMemoryLookup()
+    l.add(0, "100", ["80", "Straight", "Street"])
+    l.add(1, "200", ["80", "Broad", "Street"])
+
+    assert l.token_ids_for_entity(0).tolist() == [0, 1, 2]
+    assert l.token_ids_for_entity(1).tolist() == [0, 3, 2]
+    assert l.token_ids_for_entity(2) is None
+    assert l.token_ids(["Broad", "Walk", "80"]).tolist() == [3, 1 << 32, 0]
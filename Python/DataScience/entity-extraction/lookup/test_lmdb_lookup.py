@@ -1,16 +1,27 @@
+import lmdb
+import multiprocessing
 import os
 import shutil
+from typing import List
 from lookup.lmdb_lookup import (
+    MAX_ENTITY_ID_KEY,
     LmdbLookup,
     bytes_to_count,
     count_to_bytes,
+    internal_entity_id_to_key,
     pickle_list,
+    pickle_list_str,
+    token_to_key,
+    token_to_string_key,
     unpickle_list,
 )
-
+from lookup.postings import bytes_to_postings, num_postings, postings_to_bytes
+from lookup.shared_cache import MIN_CAPACITY, SharedCache
+from lookup.token_dictionary import UNKNOWN_TOKEN_ID_BASE
 
 TEST_LMDB_FOLDER = "./data/test"
 TEST_SQLITE_DATABASE = "./data/test.db"
+TEST_STAGING_FOLDER = "./data/test-staging"
 
 
 def delete_temp():
@@ -22,12 +33,21 @@ def delete_temp():
     if os.path.exists(TEST_LMDB_FOLDER):
         shutil.rmtree(TEST_LMDB_FOLDER)
 
+    # Delete the staging folder if it exists
+    if os.path.exists(TEST_STAGING_FOLDER):
+        shutil.rmtree(TEST_STAGING_FOLDER)
+
 
 def lmdb_for_writing():
     delete_temp()
     return LmdbLookup(TEST_LMDB_FOLDER, True, TEST_SQLITE_DATABASE)
 
 
+def lmdb_for_bulk_writing():
+    delete_temp()
+    return LmdbLookup(TEST_LMDB_FOLDER, True, staging_folder=TEST_STAGING_FOLDER)
+
+
 def lmdb_for_reading():
     return LmdbLookup(TEST_LMDB_FOLDER, False)
 
@@ -49,6 +69,14 @@ def test_pickle_unpickle():
     assert l == unpickle_list(pickle_list(l))
 
 
+def test_postings():
+    b = postings_to_bytes([5, 1, 3000000000, 1])
+    assert num_postings(b) == 3
+    assert bytes_to_postings(b).tolist() == [1, 5, 3000000000]
+    assert bytes_to_postings(memoryview(b)).tolist() == [1, 5, 3000000000]
+    assert num_postings(postings_to_bytes([])) == 0
+
+
 def test_write_read_max_tokens():
     lookup = lmdb_for_writing()
     lookup._max_num_tokens = 10
@@ -63,8 +91,15 @@ def test_token_count():
 
 
 def test_full_test():
-    lookup = lmdb_for_writing()
+    full_test(lmdb_for_writing())
+
+
+def test_full_test_bulk():
+    full_test(lmdb_for_bulk_writing())
+    assert not os.path.exists(TEST_STAGING_FOLDER)
 
+
+def full_test(lookup: LmdbLookup):
     # Populate the lookup
     dataset = {1: ("100", ["a"]), 2: ("101", ["a", "b"]), 3: ("102", ["b", "c", "d"])}
 
@@ -107,6 +142,23 @@ def test_full_test():
     assert lookup.entity_ids_for_token_list("d") == [3]
     assert lookup.entity_ids_for_token_list("z") is None
 
+    # Check the entity IDs for a given token, returned as a posting list
+    assert bytes_to_postings(lookup.entity_ids_for_token_postings("a")).tolist() == [
+        1,
+        2,
+    ]
+    assert lookup.entity_ids_for_token_postings("z") is None
+
+    with lookup.postings_reader() as read_postings:
+        assert read_postings.max_entity_id == 3
+        assert bytes_to_postings(read_postings("b")).tolist() == [2, 3]
+        assert bytes_to_postings(read_postings("d")).tolist() == [3]
+        assert read_postings("z") is None
+
+    # Check the entity IDs for a given token, returned as a compressed bitmap
+    assert lookup.entity_ids_for_token_bitmap("b").to_set() == {2, 3}
+    assert lookup.entity_ids_for_token_bitmap("z") is None
+
     # Check the matching entities
     assert lookup.matching_entries(["a"]) == {1, 2}
     assert lookup.matching_entries(["a", "b"]) == {2}
@@ -121,6 +173,19 @@ def test_full_test():
     assert lookup.num_tokens_for_entity(3) == 3
     assert lookup.num_tokens_for_entity(100) is None
 
+    # Check the token IDs of the entities and of a text
+    token_ids = {t: lookup.token_id(t) for t in ["a", "b", "c", "d"]}
+    assert sorted(token_ids.values()) == [0, 1, 2, 3]
+    assert lookup.token_id("z") is None
+    assert lookup.token_ids_for_entity(2).tolist() == [token_ids["a"], token_ids["b"]]
+    assert lookup.token_ids_for_entity(100) is None
+    assert lookup.token_ids(["d", "z", "a", "z"]).tolist() == [
+        token_ids["d"],
+        UNKNOWN_TOKEN_ID_BASE,
+        token_ids["a"],
+        UNKNOWN_TOKEN_ID_BASE,
+    ]
+
     # Check the mapping of internal to external entity IDs
     assert lookup.external_entity_id(1) == "100"
     assert lookup.external_entity_id(2) == "101"
@@ -128,3 +193,222 @@ def test_full_test():
     assert lookup.external_entity_id(4) is None
 
     cleanup(lookup)
+
+
+def remove_entity(internal_entity_id: int) -> None:
+    """Remove an entity from the test lookup (run in another process)."""
+
+    lookup = LmdbLookup(TEST_LMDB_FOLDER, False, update_mode=True)
+    lookup.remove(internal_entity_id)
+    lookup.close()
+
+
+def add_entity(internal_entity_id: int, tokens: List[str]) -> None:
+    """Add an entity to the test lookup (run in another process)."""
+
+    lookup = LmdbLookup(TEST_LMDB_FOLDER, False, update_mode=True)
+    lookup.add(internal_entity_id, str(internal_entity_id + 100), tokens)
+    lookup.close()
+
+
+def test_update():
+    lookup = lmdb_for_writing()
+    lookup.add(1, "100", ["a"])
+    lookup.add(2, "101", ["a", "b"])
+    lookup.finalise()
+    lookup.close()
+
+    # Add an entity and remove another from the finalised lookup
+    lookup = LmdbLookup(TEST_LMDB_FOLDER, False, update_mode=True)
+    assert lookup.generation() == 0
+    lookup.update([(5, "104", ["b", "c", "d", "b"])], [1])
+    assert lookup.generation() == 1
+    assert lookup.is_removed(1)
+    assert not lookup.is_removed(2)
+
+    # An entity that has been removed can't be removed again
+    try:
+        lookup.remove(1)
+        assert False
+    except Exception as e:
+        assert str(e) == "Entity 1 doesn't exist"
+
+    # A removed entity ID can be reused
+    lookup.add(1, "105", ["e"])
+    assert lookup.generation() == 2
+    assert not lookup.is_removed(1)
+
+    # The entities of an update that share a token are merged into its posting
+    # list together, and an entity can be replaced in the same update
+    lookup.update(
+        [(3, "106", ["f", "g"]), (4, "107", ["f"]), (2, "101", ["a", "b", "f"])], [2]
+    )
+    lookup.update([], [3, 4])
+    lookup.close()
+
+    # Check the updated lookup
+    lookup = lmdb_for_reading()
+    assert lookup.generation() == 4
+    assert lookup.tokens_for_entity(1) == ["e"]
+    assert lookup.tokens_for_entity(2) == ["a", "b", "f"]
+    assert lookup.entity_ids_for_token_list("f") == [2]
+    assert lookup.entity_ids_for_token_bitmap("f").to_set() == {2}
+    assert lookup.entity_ids_for_token_list("g") is None
+    assert lookup.external_entity_id(1) == "105"
+    assert lookup.tokens_for_entity(5) == ["b", "c", "d", "b"]
+    assert lookup.num_tokens_for_entity(5) == 4
+    assert lookup.external_entity_id(5) == "104"
+    assert lookup.entity_ids_for_token_list("a") == [2]
+    assert lookup.entity_ids_for_token_list("b") == [2, 5]
+    assert lookup.entity_ids_for_token_list("e") == [1]
+    assert lookup.entity_ids_for_token_bitmap("a").to_set() == {2}
+    assert lookup.entity_ids_for_token_bitmap("b").to_set() == {2, 5}
+    assert lookup.matching_entries(["b", "c"]) == {5}
+    assert lookup.max_number_tokens_for_entity() == 4
+    assert lookup.max_entity_id() == 5
+
+    # New tokens are added to the token dictionary
+    assert [lookup.token_id(t) for t in ["a", "b", "c", "d", "e"]] == [0, 1, 2, 3, 4]
+    assert lookup.token_ids_for_entity(5).tolist() == [1, 2, 3, 1]
+    assert lookup.token_ids_for_entity(1).tolist() == [4]
+
+    # Removing the only entity with a token removes its posting list
+    lookup.close()
+    lookup = LmdbLookup(TEST_LMDB_FOLDER, False, update_mode=True)
+    lookup.remove(1)
+    lookup.close()
+
+    lookup = LmdbLookup(TEST_LMDB_FOLDER, False, cache=SharedCache(MIN_CAPACITY))
+    assert lookup.entity_ids_for_token_list("e") is None
+    assert lookup.entity_ids_for_token_bitmap("e") is None
+    assert lookup.tokens_for_entity(1) is None
+
+    # An update made by another process is seen once the lookup is refreshed
+    # (the lookup's cache holds the values of the previous generation)
+    assert lookup.entity_ids_for_token_list("b") == [2, 5]
+    assert not lookup.refresh()
+    process = multiprocessing.get_context("spawn").Process(
+        target=remove_entity, args=(5,)
+    )
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert lookup.entity_ids_for_token_list("b") == [2, 5]  # Cached
+    assert lookup.refresh()
+    assert lookup.generation() == 6
+    assert lookup.entity_ids_for_token_list("b") == [2]
+    assert lookup.entity_ids_for_token_bitmap("b").to_set() == {2}
+    assert lookup.tokens_for_entity(5) is None
+
+    # A posting lists reader sees the maximum entity ID of the posting lists
+    # it reads (rather than of an update made in the meantime)
+    with lookup.postings_reader() as read_postings:
+        process = multiprocessing.get_context("spawn").Process(
+            target=add_entity, args=(9, ["b"])
+        )
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+
+        assert read_postings.max_entity_id == 5
+        assert bytes_to_postings(read_postings("b")).tolist() == [2]
+
+    with lookup.postings_reader() as read_postings:
+        assert read_postings.max_entity_id == 9
+        assert bytes_to_postings(read_postings("b")).tolist() == [2, 9]
+
+    cleanup(lookup)
+
+
+def test_cache():
+    lookup = lmdb_for_writing()
+    lookup.add(1, "100", ["a"])
+    lookup.add(2, "101", ["a", "b"])
+    lookup.finalise()
+    lookup.close()
+
+    # The values aren't cached unless the lookup is given a cache
+    lookup = lmdb_for_reading()
+    assert lookup.tokens_for_entity(2) == ["a", "b"]
+    assert lookup.cache_stats() == {}
+    lookup.close()
+
+    # A lookup reads the values via the cache it is given
+    cache = SharedCache(MIN_CAPACITY)
+    lookup = LmdbLookup(TEST_LMDB_FOLDER, False, cache=cache)
+    assert lookup.tokens_for_entity(2) == ["a", "b"]
+    assert lookup.tokens_for_entity(2) == ["a", "b"]
+    assert lookup.entity_ids_for_token_list("z") is None
+    assert lookup.entity_ids_for_token_list("z") is None
+    assert lookup.entity_ids_for_token_list("a") == [1, 2]
+    assert lookup.cache_stats() == cache.stats()
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (2, 3)
+    lookup.close()
+
+    # The cached values are for a generation of the lookup
+    lookup = LmdbLookup(TEST_LMDB_FOLDER, False, update_mode=True, cache=cache)
+    assert lookup.entity_ids_for_token_list("a") == [1, 2]
+    lookup.remove(1)
+    assert lookup.entity_ids_for_token_list("a") == [2]
+    lookup.close()
+
+    cache.close()
+    delete_temp()
+
+
+def test_update_legacy_format():
+    """A lookup in the legacy format can't be updated in place."""
+
+    delete_temp()
+    env = lmdb.open(TEST_LMDB_FOLDER)
+    with env.begin(write=True) as txn:
+        txn.put(token_to_key("a"), pickle_list([1]))
+    env.close()
+
+    try:
+        LmdbLookup(TEST_LMDB_FOLDER, False, update_mode=True)
+        assert False
+    except Exception as e:
+        assert str(e) == "A lookup in the legacy format can't be updated"
+
+    delete_temp()
+
+
+def test_read_legacy_format():
+    """A lookup without a format version stores the tokens as T and S keys."""
+
+    delete_temp()
+    env = lmdb.open(TEST_LMDB_FOLDER)
+    with env.begin(write=True) as txn:
+        txn.put(token_to_key("a"), pickle_list([2, 1]))
+        txn.put(token_to_string_key("a"), "2 1".encode("ascii"))
+        txn.put(MAX_ENTITY_ID_KEY.encode("ascii"), "2".encode("ascii"))
+        txn.put(internal_entity_id_to_key(2), pickle_list_str(["a", "b"]))
+    env.close()
+
+    lookup = lmdb_for_reading()
+
+    assert lookup.entity_ids_for_token_list("a") == [2, 1]
+    assert lookup.entity_ids_for_token_string("a") == "2 1"
+    assert lookup.entity_ids_for_token_list("z") is None
+    assert bytes_to_postings(lookup.entity_ids_for_token_postings("a")).tolist() == [
+        1,
+        2,
+    ]
+
+    with lookup.postings_reader() as read_postings:
+        assert bytes_to_postings(read_postings("a")).tolist() == [1, 2]
+        assert read_postings("z") is None
+
+    # The bitmap is built from the legacy keys
+    assert lookup.entity_ids_for_token_bitmap("a").to_set() == {1, 2}
+    assert lookup.matching_entries(["a"]) == {1, 2}
+
+    # Without a token dictionary, the tokens of the entities are interned as
+    # they are seen and the other tokens of a text aren't interned
+    assert lookup.token_ids(["a", "z"]).tolist() == [0, UNKNOWN_TOKEN_ID_BASE]
+    assert lookup.token_ids_for_entity(2).tolist() == [0, 1]
+    assert lookup.token_ids(["z", "b"]).tolist() == [UNKNOWN_TOKEN_ID_BASE, 1]
+    assert lookup.token_id("z") is None
+
+    cleanup(lookup)
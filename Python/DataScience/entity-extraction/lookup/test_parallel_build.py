@@ -0,0 +1,86 @@
+import os
+import shutil
+import sqlite3
+
+from lookup.lmdb_lookup import LmdbLookup
+from lookup.parallel_build import load_lookup_parallel, tokenise_address
+
+TEST_LMDB_FOLDER = "./data/test-parallel"
+TEST_STAGING_FOLDER = "./data/test-parallel-staging"
+TEST_SOURCE_DATABASE = "./data/test-parallel-source.db"
+
+
+def delete_temp():
+    for folder in [TEST_LMDB_FOLDER, TEST_STAGING_FOLDER]:
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+    if os.path.exists(TEST_SOURCE_DATABASE):
+        os.remove(TEST_SOURCE_DATABASE)
+
+
+def test_tokenise_address():
+    assert tokenise_address("78 Straight Street, London") == [
+        "78",
+        "straight",
+        "street",
+        "london",
+    ]
+
+
+def test_load_lookup_parallel():
+    delete_temp()
+
+    addresses = [
+        (1000 + idx, f"{idx} {street} Street, {town}")
+        for idx, (street, town) in enumerate(
+            [
+                ("Straight", "London"),
+                ("Broad", "London"),
+                ("Straight", "Birmingham"),
+                ("High", "Leeds"),
+                ("High", "London"),
+                ("Church", "Leeds"),
+                ("Straight", "Leeds"),
+            ]
+        )
+    ]
+
+    # Make the source database
+    conn = sqlite3.connect(TEST_SOURCE_DATABASE)
+    conn.execute("CREATE TABLE address(address_id, address_full);")
+    conn.executemany("INSERT INTO address VALUES(?,?);", addresses)
+    conn.commit()
+
+    # Load the lookup with batches of rows spread across the workers
+    lookup = LmdbLookup(TEST_LMDB_FOLDER, True, staging_folder=TEST_STAGING_FOLDER)
+    num_rows = load_lookup_parallel(
+        lookup,
+        conn.cursor(),
+        "SELECT address_id, address_full FROM address ORDER BY address_id",
+        num_workers=2,
+        batch_size=3,
+    )
+    conn.close()
+
+    assert num_rows == len(addresses)
+
+    lookup.finalise()
+    lookup.close()
+
+    # Check the contents of the lookup
+    lookup = LmdbLookup(TEST_LMDB_FOLDER, False)
+
+    for internal_entity_id, (external_entity_id, text) in enumerate(addresses):
+        assert lookup.tokens_for_entity(internal_entity_id) == tokenise_address(text)
+        assert lookup.external_entity_id(internal_entity_id) == str(external_entity_id)
+
+    assert lookup.max_entity_id() == len(addresses) - 1
+    assert lookup.max_number_tokens_for_entity() == 4
+    assert lookup.entity_ids_for_token_list("straight") == [0, 2, 6]
+    assert lookup.entity_ids_for_token_list("london") == [0, 1, 4]
+    assert lookup.entity_ids_for_token_list("street") == list(range(len(addresses)))
+    assert lookup.entity_ids_for_token_list("york") is None
+
+    lookup.close()
+    delete_temp()
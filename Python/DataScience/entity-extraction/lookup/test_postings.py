@@ -0,0 +1,62 @@
+from lookup.postings import (
+    bytes_to_postings,
+    merge_postings,
+    postings_to_bytes,
+    prune_postings,
+)
+
+
+def to_lists(postings):
+    return [None if p is None else bytes_to_postings(p).tolist() for p in postings]
+
+
+def test_prune_postings():
+    postings = [
+        postings_to_bytes([1, 2, 3, 4, 5, 6, 7, 8]),  # Stop token
+        postings_to_bytes([2, 9]),
+        None,
+        memoryview(postings_to_bytes([4, 5, 6, 7])),  # Stop token
+        postings_to_bytes([0, 4]),
+        postings_to_bytes([10, 11, 12]),  # Stop token
+    ]
+
+    # The stop tokens are reduced to the candidates from the other tokens
+    assert to_lists(prune_postings(postings, 2, 6)) == [
+        [2, 4],
+        [2, 9],
+        None,
+        [4],
+        [0, 4],
+        None,
+    ]
+
+    # The candidates are only from the tokens within the window
+    assert to_lists(prune_postings(postings, 2, 2)) == [
+        [2],
+        [2, 9],
+        None,
+        [4],
+        [0, 4],
+        None,
+    ]
+
+    # No stop tokens
+    assert to_lists(prune_postings(postings, 8, 2)) == to_lists(postings)
+
+    # Only stop tokens
+    assert to_lists(prune_postings(postings[:1] + [None], 2, 6)) == [None, None]
+
+
+def test_merge_postings():
+    postings = memoryview(postings_to_bytes([2, 4, 6]))
+
+    assert to_lists([merge_postings(postings, [5, 1, 4], [])]) == [[1, 2, 4, 5, 6]]
+    assert to_lists([merge_postings(postings, [], [4, 2, 7])]) == [[6]]
+    assert to_lists([merge_postings(None, [3], [])]) == [[3]]
+
+    # The entity IDs are removed before they are added
+    assert to_lists([merge_postings(postings, [4], [4, 6])]) == [[2, 4]]
+
+    # An empty posting list is removed
+    assert merge_postings(postings, [], [2, 4, 6]) is None
+    assert merge_postings(None, [], [1]) is None
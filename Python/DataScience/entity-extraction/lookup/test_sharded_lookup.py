@@ -0,0 +1,102 @@
+import os
+import shutil
+from lookup.postings import bytes_to_postings
+from lookup.sharded_lookup import ShardedLmdbLookup, shard_folder
+from lookup.token_dictionary import UNKNOWN_TOKEN_ID_BASE
+
+TEST_SHARDED_FOLDER = "./data/test-sharded"
+TEST_SHARDED_STAGING_FOLDER = "./data/test-sharded-staging"
+
+
+def delete_temp():
+    for folder in [TEST_SHARDED_FOLDER, TEST_SHARDED_STAGING_FOLDER]:
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+
+def test_shard_folder():
+    assert shard_folder("./data", 0) == os.path.join("./data", "shard-000")
+    assert shard_folder("./data", 12) == os.path.join("./data", "shard-012")
+
+
+def test_sharded_lookup():
+    delete_temp()
+
+    # Entities 1 and 2 are in shard 0, 3 and 5 in shard 1 and 9 in shard 3
+    dataset = {
+        1: ("100", ["a"]),
+        2: ("101", ["a", "b"]),
+        3: ("102", ["b", "c", "d"]),
+        5: ("103", ["a", "c"]),
+        9: ("104", ["a", "e", "f", "g"]),
+    }
+
+    lookup = ShardedLmdbLookup(
+        TEST_SHARDED_FOLDER,
+        True,
+        shard_size=3,
+        staging_folder=TEST_SHARDED_STAGING_FOLDER,
+    )
+    for internal_entity_id, (external_entity_id, tokens) in dataset.items():
+        lookup.add(internal_entity_id, external_entity_id, tokens)
+
+    lookup.finalise()
+    lookup.close()
+
+    # Open the lookup for reading
+    lookup = ShardedLmdbLookup(TEST_SHARDED_FOLDER, False)
+    assert lookup.shard_size() == 3
+    assert lookup.shards() == [
+        (shard_folder(TEST_SHARDED_FOLDER, 0), 0),
+        (shard_folder(TEST_SHARDED_FOLDER, 1), 3),
+        (shard_folder(TEST_SHARDED_FOLDER, 3), 9),
+    ]
+
+    for entity_id, (external_entity_id, tokens) in dataset.items():
+        assert lookup.tokens_for_entity(entity_id) == tokens
+        assert lookup.num_tokens_for_entity(entity_id) == len(tokens)
+        assert lookup.external_entity_id(entity_id) == external_entity_id
+
+    assert lookup.tokens_for_entity(4) is None
+    assert lookup.tokens_for_entity(6) is None
+
+    # The token IDs of the text and of the entities (across the shards) are
+    # comparable
+    text_token_ids = lookup.token_ids(["a", "c"]).tolist()
+    for entity_id, (_, tokens) in dataset.items():
+        token_ids = lookup.token_ids_for_entity(entity_id).tolist()
+        assert (token_ids[0] == text_token_ids[0]) == (tokens[0] == "a")
+    assert lookup.token_ids_for_entity(4) is None
+
+    # A token that isn't in an entity isn't added to the dictionary
+    assert lookup.token_ids(["z", "a"]).tolist() == [
+        UNKNOWN_TOKEN_ID_BASE,
+        text_token_ids[0],
+    ]
+    assert lookup._dictionary.token_id("z") is None
+    assert lookup.external_entity_id(100) is None
+
+    assert lookup.max_number_tokens_for_entity() == 4
+    assert lookup.max_entity_id() == 9
+
+    assert lookup.entity_ids_for_token("a") == {1, 2, 5, 9}
+    assert lookup.entity_ids_for_token_list("c") == [3, 5]
+    assert lookup.entity_ids_for_token_list("z") is None
+    assert lookup.entity_ids_for_token_string("b") == "2 3"
+    assert bytes_to_postings(lookup.entity_ids_for_token_postings("a")).tolist() == [
+        1,
+        2,
+        5,
+        9,
+    ]
+
+    with lookup.postings_reader() as read_postings:
+        assert bytes_to_postings(read_postings("c")).tolist() == [3, 5]
+        assert read_postings("z") is None
+
+    assert lookup.matching_entries(["a", "c"]) == {5}
+    assert lookup.matching_entries(["a"]) == {1, 2, 5, 9}
+    assert lookup.matching_entries(["b", "e"]) is None
+
+    lookup.close()
+    delete_temp()
@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import pytest
+
+from lookup.shared_cache import MIN_CAPACITY, VERSION_FIELD, SharedCache
+
+TEST_CACHE_FILEPATH = "./data/test-cache"
+
+
+def delete_temp():
+    if os.path.exists(TEST_CACHE_FILEPATH):
+        os.remove(TEST_CACHE_FILEPATH)
+
+
+def test_shared_cache():
+    cache = SharedCache(MIN_CAPACITY)
+
+    assert cache.get(b"a") is None
+    cache.put(b"a", b"1")
+    cache.put(b"b", b"")
+    assert cache.get(b"a") == b"1"
+    assert cache.get(b"b") == b""
+
+    # Replace the value of a key
+    cache.put(b"a", b"22")
+    assert cache.get(b"a") == b"22"
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (3, 1, 0)
+    assert stats["entries"] == 2
+    assert stats["capacity"] < MIN_CAPACITY
+
+    cache.clear()
+    assert cache.get(b"a") is None
+    assert cache.stats()["entries"] == 0
+
+    cache.close()
+
+
+def test_shared_cache_eviction():
+    cache = SharedCache(MIN_CAPACITY)
+    capacity = cache.stats()["capacity"]
+
+    # Write many more bytes than the capacity of the cache
+    values = {f"key-{i}".encode("ascii"): bytes([i % 256]) * 1000 for i in range(500)}
+    for key, value in values.items():
+        cache.put(key, value)
+        assert cache.stats()["bytes"] <= capacity
+
+    # The oldest values have been evicted and the newest are in the cache
+    stats = cache.stats()
+    assert stats["evictions"] > 0
+    assert stats["entries"] + stats["evictions"] == len(values)
+    assert cache.get(b"key-0") is None
+    assert cache.get(b"key-499") == values[b"key-499"]
+
+    for key, value in values.items():
+        assert cache.get(key) in [None, value]
+
+    # A value that is too large isn't cached
+    cache.put(b"large", bytes(capacity))
+    assert cache.get(b"large") is None
+
+    cache.close()
+
+
+def put_values(filepath: str) -> None:
+    """Put values into a shared cache (run in another process)."""
+
+    cache = SharedCache(MIN_CAPACITY, filepath)
+    cache.put(b"a", b"from another process")
+    cache.close()
+
+
+def test_shared_cache_across_processes():
+    delete_temp()
+
+    cache = SharedCache(MIN_CAPACITY, TEST_CACHE_FILEPATH)
+
+    process = multiprocessing.get_context("spawn").Process(
+        target=put_values, args=(TEST_CACHE_FILEPATH,)
+    )
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+    assert cache.get(b"a") == b"from another process"
+    cache.close()
+
+    # The cache can't be opened from a file that isn't a cache
+    with open(TEST_CACHE_FILEPATH, "wb") as fp:
+        fp.write(bytes(MIN_CAPACITY))
+
+    with pytest.raises(Exception, match="Invalid shared cache file"):
+        SharedCache(MIN_CAPACITY, TEST_CACHE_FILEPATH)
+
+    cache.unlink()
+    assert not os.path.exists(TEST_CACHE_FILEPATH)
+
+
+def test_shared_cache_interrupted_write():
+    """A version left odd by a writer that died is repaired by the next write."""
+
+    cache = SharedCache(MIN_CAPACITY)
+    cache.put(b"a", b"1")
+
+    # A writer was killed part way through a write
+    cache._header[VERSION_FIELD] += 1
+    assert cache.get(b"a") is None
+
+    cache.put(b"b", b"2")
+    assert cache._header[VERSION_FIELD] % 2 == 0
+    assert cache.get(b"a") == b"1"
+    assert cache.get(b"b") == b"2"
+
+    cache.close()
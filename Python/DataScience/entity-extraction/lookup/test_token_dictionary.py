@@ -0,0 +1,71 @@
+import random
+
+import numpy as np
+
+from lookup.token_dictionary import (
+    UNKNOWN_TOKEN_ID_BASE,
+    TokenDictionary,
+    bytes_to_token_ids,
+    encode_text,
+    token_ids_to_bytes,
+    token_set_counts,
+)
+
+
+def test_token_dictionary():
+    dictionary = TokenDictionary()
+    assert len(dictionary) == 0
+
+    assert dictionary.add("b") == 0
+    assert dictionary.add("a") == 1
+    assert dictionary.add("b") == 0
+    assert len(dictionary) == 2
+    assert "a" in dictionary and "c" not in dictionary
+
+    assert dictionary.token_id("a") == 1
+    assert dictionary.token_id("c") is None
+    assert dictionary.token(0) == "b"
+    assert sorted(dictionary.items()) == [("a", 1), ("b", 0)]
+
+    # Encoding an entity's tokens adds new tokens
+    token_ids = dictionary.encode(["c", "a", "c"])
+    assert token_ids.tolist() == [2, 1, 2]
+    assert dictionary.decode(token_ids) == ["c", "a", "c"]
+    assert bytes_to_token_ids(token_ids_to_bytes(token_ids)).tolist() == [2, 1, 2]
+
+    # Encoding a text gives each distinct unknown token its own token ID
+    assert dictionary.encode_text(["a", "x", "y", "x"]).tolist() == [
+        1,
+        UNKNOWN_TOKEN_ID_BASE,
+        UNKNOWN_TOKEN_ID_BASE + 1,
+        UNKNOWN_TOKEN_ID_BASE,
+    ]
+    assert len(dictionary) == 3
+    assert encode_text(lambda token: None, ["x"]).tolist() == [UNKNOWN_TOKEN_ID_BASE]
+
+
+def test_token_set_counts():
+    rng = random.Random(1)
+
+    actuals, entities, expected = [], [], []
+    for _ in range(100):
+        actual = rng.choices(range(8), k=rng.randint(1, 6))
+        entity = rng.choices(range(8), k=rng.randint(1, 6))
+
+        # An unknown token in the text
+        if rng.random() < 0.3:
+            actual.append(UNKNOWN_TOKEN_ID_BASE)
+
+        actuals.append(np.array(actual, dtype=np.int64))
+        entities.append(np.array(entity, dtype=np.uint32))
+
+        present = set(entity).intersection(actual)
+        expected.append(
+            (len(present), len(set(entity)) - len(present), len(set(actual)) - len(present))
+        )
+
+    n_present, n_missing, n_added = token_set_counts(actuals, entities)
+    assert list(zip(n_present.tolist(), n_missing.tolist(), n_added.tolist())) == expected
+
+    n_present, n_missing, n_added = token_set_counts([], [])
+    assert len(n_present) == len(n_missing) == len(n_added) == 0
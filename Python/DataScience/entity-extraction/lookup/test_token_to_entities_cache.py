@@ -1,4 +1,5 @@
 import pytest
+from lookup.bitmap import Bitmap
 from lookup.token_to_entities_cache import (
     OptimisedTokenToEntitiesCache,
     TokenToEntitiesCache,
@@ -149,3 +150,32 @@ def test_optimised_token_to_entities_cache():
     cache.get(["a"]) == ({0}, False)
     cache.get(["a", "e"]) == ({}, True)
     cache.get(["a", "e", "b"]) == ({}, True)
+
+
+def test_optimised_token_to_entities_cache_bitmap():
+
+    # Map of token to entity IDs as compressed bitmaps
+    token_to_entity_ids = {
+        "a": Bitmap.from_list([0, 70000]),
+        "b": Bitmap.from_list([0, 1, 70000]),
+        "c": Bitmap.from_list([0, 2]),
+    }
+
+    cache = OptimisedTokenToEntitiesCache(token_to_entity_ids.get)
+
+    # The first token isn't intersected with the empty cache
+    entities, cache_used = cache.get(["a"])
+    assert (entities.to_set(), cache_used) == ({0, 70000}, False)
+
+    # Check tokens [a] -> [a,b] -> [a,b,c]
+    entities, cache_used = cache.get(["a", "b"])
+    assert (entities.to_set(), cache_used) == ({0, 70000}, True)
+    entities, cache_used = cache.get(["a", "b", "c"])
+    assert (entities.to_set(), cache_used) == ({0}, True)
+
+    # Check tokens [c] -> [c,e] -> [c,e,a]
+    cache.clear()
+    entities, cache_used = cache.get(["c"])
+    assert (entities.to_set(), cache_used) == ({0, 2}, False)
+    assert cache.get(["c", "e"]) == (set(), True)
+    assert cache.get(["c", "e", "a"]) == (set(), True)
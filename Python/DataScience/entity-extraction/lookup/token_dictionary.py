@@ -0,0 +1,159 @@
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from domain import Tokens, assert_token_valid, assert_tokens_valid
+
+# A token dictionary interns tokens as integer token IDs, so that the tokens of
+# an entity can be held as an array of uint32 rather than a list of strings.
+# Token IDs are assigned in the order in which the tokens are added and are
+# never reused.
+
+# Token IDs as an array
+TokenIds = np.ndarray
+
+# Data type of the token IDs of an entity (stored in little-endian order)
+TOKEN_ID_DTYPE = np.dtype("<u4")
+
+# A token in a text that isn't in the dictionary is given a token ID from this
+# value upwards, so that it can't be equal to the token ID of an entity token
+UNKNOWN_TOKEN_ID_BASE = 1 << 32
+
+# Number of bits for the token IDs when pairs of token IDs are compared in a
+# batch (which must cover the token IDs of unknown tokens)
+TOKEN_ID_BITS = 34
+
+
+def token_ids_to_bytes(token_ids: TokenIds) -> bytes:
+    """Convert the token IDs of an entity to bytes (e.g. for storage in LMDB)."""
+    return np.asarray(token_ids, dtype=TOKEN_ID_DTYPE).tobytes()
+
+
+def bytes_to_token_ids(b: bytes) -> TokenIds:
+    """Convert bytes to the token IDs of an entity."""
+    return np.frombuffer(b, dtype=TOKEN_ID_DTYPE)
+
+
+def encode_text(token_id: Callable[[str], Optional[int]], tokens: Tokens) -> TokenIds:
+    """Token IDs of the tokens in a text given a function to look up a token's ID.
+
+    Each distinct token that isn't in the dictionary is given its own token ID
+    from UNKNOWN_TOKEN_ID_BASE upwards.
+    """
+
+    assert_tokens_valid(tokens)
+
+    unknown: Dict[str, int] = {}
+    result = []
+    for token in tokens:
+        idx = token_id(token)
+        if idx is None:
+            idx = unknown.setdefault(token, UNKNOWN_TOKEN_ID_BASE + len(unknown))
+        result.append(idx)
+
+    return np.array(result, dtype=np.int64)
+
+
+def token_set_counts(
+    actuals: List[TokenIds], entities: List[TokenIds]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Number of distinct tokens present, missing and added for pairs of token IDs.
+
+    For each pair of the actual tokens (from a text) and the entity tokens,
+    returns the number of distinct entity tokens present in the actual tokens,
+    the number of distinct entity tokens missing from the actual tokens and
+    the number of distinct actual tokens that aren't in the entity. The pairs
+    are compared in one pass by keying each token ID by its pair.
+    """
+
+    assert type(actuals) == list
+    assert type(entities) == list
+    assert len(actuals) == len(entities)
+
+    n = len(actuals)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    def keyed(token_ids: List[TokenIds]) -> np.ndarray:
+        """Distinct token IDs of each pair keyed by the index of the pair."""
+        lengths = [len(t) for t in token_ids]
+        pair = np.repeat(np.arange(n, dtype=np.int64), lengths)
+        flat = np.concatenate(token_ids).astype(np.int64)
+        return np.unique((pair << TOKEN_ID_BITS) | flat)
+
+    entity_keys = keyed(entities)
+    actual_keys = keyed(actuals)
+
+    present = np.isin(entity_keys, actual_keys, assume_unique=True)
+    entity_pairs = entity_keys >> TOKEN_ID_BITS
+
+    n_present = np.bincount(entity_pairs, weights=present, minlength=n).astype(np.int64)
+    n_entity = np.bincount(entity_pairs, minlength=n)
+    n_actual = np.bincount(actual_keys >> TOKEN_ID_BITS, minlength=n)
+
+    return n_present, n_entity - n_present, n_actual - n_present
+
+
+class TokenDictionary:
+    """Interns tokens as integer token IDs."""
+
+    def __init__(self) -> None:
+        self._token_to_id: Dict[str, int] = {}
+        self._tokens: List[str] = []
+
+        # Lock so that concurrent adds don't assign the same token ID
+        self._lock = threading.Lock()
+
+    def add(self, token: str) -> int:
+        """Add a token to the dictionary (if required) and return its token ID."""
+
+        token_id = self._token_to_id.get(token)
+        if token_id is not None:
+            return token_id
+
+        assert_token_valid(token)
+
+        with self._lock:
+            token_id = self._token_to_id.get(token)
+            if token_id is None:
+                token_id = len(self._tokens)
+                self._tokens.append(token)
+                self._token_to_id[token] = token_id
+
+        return token_id
+
+    def token_id(self, token: str) -> Optional[int]:
+        """Token ID of a token (None if the token isn't in the dictionary)."""
+        return self._token_to_id.get(token)
+
+    def token(self, token_id: int) -> str:
+        """Token for a token ID."""
+
+        assert type(token_id) == int and 0 <= token_id < len(self._tokens)
+        return self._tokens[token_id]
+
+    def encode(self, tokens: Tokens) -> TokenIds:
+        """Token IDs of an entity's tokens (adding any new tokens)."""
+
+        assert_tokens_valid(tokens)
+        return np.array([self.add(t) for t in tokens], dtype=TOKEN_ID_DTYPE)
+
+    def decode(self, token_ids: TokenIds) -> Tokens:
+        """Tokens for an array of token IDs."""
+        return [self._tokens[idx] for idx in token_ids.tolist()]
+
+    def encode_text(self, tokens: Tokens) -> TokenIds:
+        """Token IDs of the tokens in a text (without adding any new tokens)."""
+        return encode_text(self.token_id, tokens)
+
+    def items(self) -> List[Tuple[str, int]]:
+        """Tokens and their token IDs."""
+        return list(self._token_to_id.items())
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def __contains__(self, token: str) -> bool:
+        return token in self._token_to_id
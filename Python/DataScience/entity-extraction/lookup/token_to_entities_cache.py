@@ -1,7 +1,12 @@
 from functools import lru_cache
-from typing import Callable, List, Optional, Set, Tuple
+from typing import Callable, List, Optional, Set, Tuple, Union
 
 from domain import Tokens, assert_token_valid, assert_tokens_valid
+from lookup.bitmap import Bitmap
+
+# Entity IDs as a set or a compressed bitmap (which are intersected without
+# building Python sets)
+EntityIds = Union[Set[int], Bitmap]
 
 
 def one_more(original: Set[str], new: Set[str]) -> Tuple[bool, Optional[str]]:
@@ -24,18 +29,18 @@ def one_more(original: Set[str], new: Set[str]) -> Tuple[bool, Optional[str]]:
 
 class OptimisedTokenToEntitiesCache:
 
-    def __init__(self, entity_getter: Callable[[str], Optional[Set[int]]]) -> None:
+    def __init__(self, entity_getter: Callable[[str], Optional[EntityIds]]) -> None:
         self._entity_getter = entity_getter
-        self._tokens = set()
-        self._entities = set()
+        self._tokens: Set[str] = set()
+        self._entities: EntityIds = set()
 
     def clear(self):
         """Clear the cache."""
 
-        self._tokens: Set[str] = set()
-        self._entities: Set[int] = set()
+        self._tokens = set()
+        self._entities = set()
 
-    def get(self, tokens: Tokens) -> Tuple[Set[int], bool]:
+    def get(self, tokens: Tokens) -> Tuple[EntityIds, bool]:
         """Get the entity IDs in common for the tokens."""
 
         assert_tokens_valid(tokens)
@@ -47,15 +52,16 @@ class OptimisedTokenToEntitiesCache:
         if new_tokens == self._tokens:
             return self._entities, True
 
-        # Is there just one more token than in the cache?
+        # Is there just one more token than in the (non-empty) cache?
         one_more_token, token = one_more(self._tokens, new_tokens)
-        if one_more_token:
+        if one_more_token and len(self._tokens) > 0:
             cache_used = True
-            extra_entities = self._entity_getter(token)
-            if extra_entities is None:
-                self._entities = set()
-            else:
-                self._entities = self._entities.intersection(extra_entities)
+            if len(self._entities) > 0:
+                extra_entities = self._entity_getter(token)
+                if extra_entities is None:
+                    self._entities = set()
+                else:
+                    self._entities = self._entities.intersection(extra_entities)
 
         else:
             cache_used = False
@@ -4,12 +4,21 @@
 #include <string.h>
 #include "positions.h"
 
+// Head of a posting list during the merge of the posting lists
+typedef struct
+{
+    uint32_t entity_id; // Entity ID at the head of the posting list
+    uint32_t token;     // Token (position) of the posting list
+    uint32_t index;     // Index of the head within the posting list
+} PostingsHead;
+
 SparsePositionResults positions(char *str,
                                 uint32_t max_entity_id,
                                 uint8_t min_count)
 {
     SparsePositionResults results;
     results.n = 0;
+    results.results = NULL;
 
     // Check the parameters
     if (str == NULL)
@@ -51,11 +60,398 @@ SparsePositionResults positions(char *str,
 
     // Free the dynamically allocated space for the dense entity positions
     free_dense_entity_positions(dense_results, max_entity_id);
+    free(dense_results);
 
     // Return the position results
     return compact_results;
 }
 
+// Is the head `a` before the head `b` (by entity ID and then token)?
+static bool postings_head_before(PostingsHead a, PostingsHead b)
+{
+    return a.entity_id < b.entity_id ||
+           (a.entity_id == b.entity_id && a.token < b.token);
+}
+
+// Restore the min-heap property of the `heap` of `n` heads from index `i`.
+static void sift_down(PostingsHead *heap, uint32_t n, uint32_t i)
+{
+    while (true)
+    {
+        uint32_t smallest = i;
+        uint32_t left = 2 * i + 1;
+        uint32_t right = 2 * i + 2;
+
+        if (left < n && postings_head_before(heap[left], heap[smallest]))
+        {
+            smallest = left;
+        }
+
+        if (right < n && postings_head_before(heap[right], heap[smallest]))
+        {
+            smallest = right;
+        }
+
+        if (smallest == i)
+        {
+            return;
+        }
+
+        PostingsHead temp = heap[i];
+        heap[i] = heap[smallest];
+        heap[smallest] = temp;
+        i = smallest;
+    }
+}
+
+// Set the error message of the results (freeing any results).
+static void set_error_32(SparsePositionResults32 *results, const char *message)
+{
+    free_sparse_position_results_32(results);
+    results->n = 0;
+    strncpy(results->error_message, message, MAXIMUM_MESSAGE_LENGTH);
+}
+
+static int compare_entity_ids(const void *a, const void *b)
+{
+    uint32_t x = *(const uint32_t *)a;
+    uint32_t y = *(const uint32_t *)b;
+    return (x > y) - (x < y);
+}
+
+// Returns the index of the entity ID in the sorted candidates (which must
+// contain it).
+static uint32_t find_candidate(const uint32_t *candidates,
+                               uint32_t num_candidates,
+                               uint32_t entity_id)
+{
+    uint32_t low = 0;
+    uint32_t high = num_candidates - 1;
+    while (low < high)
+    {
+        uint32_t middle = low + (high - low) / 2;
+        if (candidates[middle] < entity_id)
+        {
+            low = middle + 1;
+        }
+        else
+        {
+            high = middle;
+        }
+    }
+    return low;
+}
+
+SparsePositionResults32 positions_postings_32(const uint32_t **postings,
+                                              const uint32_t *lengths,
+                                              uint32_t num_tokens,
+                                              uint32_t max_entity_id,
+                                              uint32_t min_count)
+{
+    SparsePositionResults32 results;
+    results.n = 0;
+    results.results = NULL;
+    results.error_message[0] = '\0';
+
+    // Check the parameters
+    if (postings == NULL || lengths == NULL)
+    {
+        set_error_32(&results, "Posting lists are null");
+        return results;
+    }
+
+    if (min_count == 0)
+    {
+        set_error_32(&results, "Minimum counts is zero");
+        return results;
+    }
+
+    // Count the number of times each entity occurs in the posting lists (the
+    // counts saturate at UINT8_MAX). An entity becomes a candidate when its
+    // count reaches the threshold, so the counts are never scanned.
+    uint8_t threshold = min_count < UINT8_MAX ? (uint8_t)min_count : UINT8_MAX;
+    uint64_t total_length = 0;
+    for (uint32_t token = 0; token < num_tokens; token++)
+    {
+        total_length += lengths[token];
+    }
+
+    uint8_t *counts = (uint8_t *)calloc((size_t)max_entity_id + 1, sizeof(uint8_t));
+    uint32_t *candidates = (uint32_t *)malloc(
+        (total_length / threshold + 1) * sizeof(uint32_t));
+    if (counts == NULL || candidates == NULL)
+    {
+        free(counts);
+        free(candidates);
+        set_error_32(&results, "Failed to count occurrences");
+        return results;
+    }
+
+    uint32_t num_candidates = 0;
+    for (uint32_t token = 0; token < num_tokens; token++)
+    {
+        for (uint32_t i = 0; i < lengths[token]; i++)
+        {
+            uint32_t entity_id = postings[token][i];
+            if (entity_id > max_entity_id)
+            {
+                free(counts);
+                free(candidates);
+                set_error_32(&results, "Entity ID > maximum entity ID");
+                return results;
+            }
+            if (counts[entity_id] < UINT8_MAX)
+            {
+                counts[entity_id]++;
+                if (counts[entity_id] == threshold)
+                {
+                    candidates[num_candidates] = entity_id;
+                    num_candidates++;
+                }
+            }
+        }
+    }
+
+    if (num_candidates == 0)
+    {
+        free(counts);
+        free(candidates);
+        return results;
+    }
+
+    qsort(candidates, num_candidates, sizeof(uint32_t), compare_entity_ids);
+
+    // Find the exact count of each candidate (the posting lists are walked
+    // again to count the entities with a saturated count)
+    uint32_t *indexes = (uint32_t *)malloc(num_candidates * sizeof(uint32_t));
+    results.results = (EntityPositions32 *)malloc(num_candidates *
+                                                  sizeof(EntityPositions32));
+    if (indexes == NULL || results.results == NULL)
+    {
+        free(counts);
+        free(candidates);
+        free(indexes);
+        set_error_32(&results, "Failed to allocate space");
+        return results;
+    }
+
+    bool saturated = false;
+    for (uint32_t i = 0; i < num_candidates; i++)
+    {
+        indexes[i] = counts[candidates[i]];
+        if (indexes[i] == UINT8_MAX)
+        {
+            indexes[i] = 0;
+            saturated = true;
+        }
+    }
+
+    for (uint32_t token = 0; saturated && token < num_tokens; token++)
+    {
+        for (uint32_t i = 0; i < lengths[token]; i++)
+        {
+            uint32_t entity_id = postings[token][i];
+            if (counts[entity_id] == UINT8_MAX)
+            {
+                indexes[find_candidate(candidates, num_candidates,
+                                       entity_id)]++;
+            }
+        }
+    }
+
+    // Allocate the positions for each entity (in entity ID order) and replace
+    // its count with its index in the results plus one (zero if the entity
+    // doesn't have a sufficient count)
+    for (uint32_t i = 0; i < num_candidates; i++)
+    {
+        uint32_t count = indexes[i];
+        if (count < min_count)
+        {
+            indexes[i] = 0;
+            continue;
+        }
+
+        EntityPositions32 *result = &results.results[results.n];
+        result->entity_id = candidates[i];
+        result->n = 0;
+        result->arr = (uint32_t *)malloc(count * sizeof(uint32_t));
+        if (result->arr == NULL)
+        {
+            free(counts);
+            free(candidates);
+            free(indexes);
+            set_error_32(&results, "Failed to allocate space");
+            return results;
+        }
+
+        results.n++;
+        indexes[i] = results.n;
+    }
+
+    // Walk through the posting list of each token, recording the positions of
+    // the entities (the token index is the position)
+    for (uint32_t token = 0; token < num_tokens; token++)
+    {
+        for (uint32_t i = 0; i < lengths[token]; i++)
+        {
+            uint32_t entity_id = postings[token][i];
+            if (counts[entity_id] < threshold)
+            {
+                continue;
+            }
+
+            uint32_t index = indexes[find_candidate(candidates, num_candidates,
+                                                    entity_id)];
+            if (index > 0)
+            {
+                EntityPositions32 *result = &results.results[index - 1];
+                result->arr[result->n] = token;
+                result->n++;
+            }
+        }
+    }
+
+    free(counts);
+    free(candidates);
+    free(indexes);
+
+    if (results.n == 0)
+    {
+        free(results.results);
+        results.results = NULL;
+    }
+
+    return results;
+}
+
+SparsePositionResults32 positions_postings_sparse_32(const uint32_t **postings,
+                                                     const uint32_t *lengths,
+                                                     uint32_t num_tokens,
+                                                     uint32_t min_count)
+{
+    SparsePositionResults32 results;
+    results.n = 0;
+    results.results = NULL;
+    results.error_message[0] = '\0';
+
+    // Check the parameters
+    if (postings == NULL || lengths == NULL)
+    {
+        set_error_32(&results, "Posting lists are null");
+        return results;
+    }
+
+    if (min_count == 0)
+    {
+        set_error_32(&results, "Minimum counts is zero");
+        return results;
+    }
+
+    if (num_tokens == 0)
+    {
+        return results;
+    }
+
+    // Build a min-heap of the heads of the non-empty posting lists
+    PostingsHead *heap = (PostingsHead *)malloc(num_tokens * sizeof(PostingsHead));
+    uint32_t *entity_positions = (uint32_t *)malloc(num_tokens * sizeof(uint32_t));
+    if (heap == NULL || entity_positions == NULL)
+    {
+        free(heap);
+        free(entity_positions);
+        set_error_32(&results, "Failed to allocate space");
+        return results;
+    }
+
+    uint32_t heap_size = 0;
+    for (uint32_t token = 0; token < num_tokens; token++)
+    {
+        if (lengths[token] > 0)
+        {
+            heap[heap_size].entity_id = postings[token][0];
+            heap[heap_size].token = token;
+            heap[heap_size].index = 0;
+            heap_size++;
+        }
+    }
+
+    for (uint32_t i = heap_size / 2; i-- > 0;)
+    {
+        sift_down(heap, heap_size, i);
+    }
+
+    // Pop the heads in entity ID order. The heads for an entity are popped in
+    // token order, so its positions are sorted.
+    uint32_t capacity = 0;
+
+    while (heap_size > 0)
+    {
+        uint32_t entity_id = heap[0].entity_id;
+        uint32_t n = 0;
+
+        while (heap_size > 0 && heap[0].entity_id == entity_id)
+        {
+            uint32_t token = heap[0].token;
+            entity_positions[n] = token;
+            n++;
+
+            // Advance the posting list (or remove it if it is exhausted)
+            heap[0].index++;
+            if (heap[0].index < lengths[token])
+            {
+                heap[0].entity_id = postings[token][heap[0].index];
+            }
+            else
+            {
+                heap_size--;
+                heap[0] = heap[heap_size];
+            }
+
+            sift_down(heap, heap_size, 0);
+        }
+
+        if (n < min_count)
+        {
+            continue;
+        }
+
+        // Grow the results if required
+        if (results.n == capacity)
+        {
+            capacity = capacity == 0 ? 16 : 2 * capacity;
+            EntityPositions32 *grown = (EntityPositions32 *)realloc(
+                results.results, capacity * sizeof(EntityPositions32));
+            if (grown == NULL)
+            {
+                free(heap);
+                free(entity_positions);
+                set_error_32(&results, "Failed to allocate space");
+                return results;
+            }
+            results.results = grown;
+        }
+
+        EntityPositions32 *result = &results.results[results.n];
+        result->entity_id = entity_id;
+        result->n = n;
+        result->arr = (uint32_t *)malloc(n * sizeof(uint32_t));
+        if (result->arr == NULL)
+        {
+            free(heap);
+            free(entity_positions);
+            set_error_32(&results, "Failed to allocate space");
+            return results;
+        }
+        memcpy(result->arr, entity_positions, n * sizeof(uint32_t));
+        results.n++;
+    }
+
+    free(heap);
+    free(entity_positions);
+
+    return results;
+}
+
 uint8_t *count_occurrences(char *str,
                            uint32_t max_entity_id)
 {
@@ -233,6 +629,20 @@ void free_sparse_position_results(SparsePositionResults *sparse_results)
     {
         free(sparse_results->results[i].arr);
     }
+
+    free(sparse_results->results);
+    sparse_results->results = NULL;
+}
+
+void free_sparse_position_results_32(SparsePositionResults32 *sparse_results)
+{
+    for (uint32_t i = 0; i < sparse_results->n; i++)
+    {
+        free(sparse_results->results[i].arr);
+    }
+
+    free(sparse_results->results);
+    sparse_results->results = NULL;
 }
 
 SparsePositionResults compact(DenseEntityPositions *results,
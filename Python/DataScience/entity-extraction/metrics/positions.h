@@ -23,12 +23,52 @@ typedef struct
     char error_message[MAXIMUM_MESSAGE_LENGTH + 1]; // Error message
 } SparsePositionResults;
 
+// Variants of the structs with 32-bit positions and counts, so that a text
+// with any number of tokens can be processed in a single call
+typedef struct
+{
+    uint32_t entity_id; // Entity ID
+    uint32_t n;         // Number of tokens that match the entity ID
+    uint32_t *arr;      // Array of matching positions
+} EntityPositions32;
+
+typedef struct
+{
+    uint32_t n;                                     // Number of entity matches;
+    EntityPositions32 *results;                     // Results for each entity
+    char error_message[MAXIMUM_MESSAGE_LENGTH + 1]; // Error message
+} SparsePositionResults32;
+
 // Returns the token positions in which the entity matches where the entity
 // occurs at least `min_count` times. The maximum entity ID is `max_entity_id`.
 SparsePositionResults positions(char *str,
                                 uint32_t max_entity_id,
                                 uint8_t min_count);
 
+// Returns the token positions in which the entity matches where the entity
+// occurs at least `min_count` times. The entity IDs for each of the
+// `num_tokens` tokens are provided as sorted arrays of entity IDs (posting
+// lists), where `postings[i]` holds `lengths[i]` entity IDs for token `i`.
+// The positions and counts are 32-bit, so a text with any number of tokens
+// can be processed in a single call. The counts are held in a byte per entity
+// ID up to `max_entity_id` (saturating at UINT8_MAX), and the results are
+// indexed by a sorted array of the entities with a sufficient count, so only
+// the candidates are scanned.
+SparsePositionResults32 positions_postings_32(const uint32_t **postings,
+                                              const uint32_t *lengths,
+                                              uint32_t num_tokens,
+                                              uint32_t max_entity_id,
+                                              uint32_t min_count);
+
+// Returns the same results as positions_postings_32(), but without allocating
+// arrays indexed by entity ID. The sorted posting lists are merged using a
+// heap, so the time and memory required are proportional to the total length
+// of the posting lists rather than the maximum entity ID.
+SparsePositionResults32 positions_postings_sparse_32(const uint32_t **postings,
+                                                     const uint32_t *lengths,
+                                                     uint32_t num_tokens,
+                                                     uint32_t min_count);
+
 // Counts the occurrences of each entity in the string.
 uint8_t *count_occurrences(char *str,
                            uint32_t max_entity_id);
@@ -58,4 +98,7 @@ void free_dense_entity_positions(DenseEntityPositions *positions,
                                  uint32_t max_entity_id);
 
 // Free the dynamically allocated memory for a SparsePositionResults struct.
-void free_sparse_position_results(SparsePositionResults *sparse_results);
\ No newline at end of file
+void free_sparse_position_results(SparsePositionResults *sparse_results);
+
+// Free the dynamically allocated memory for a SparsePositionResults32 struct.
+void free_sparse_position_results_32(SparsePositionResults32 *sparse_results);
\ No newline at end of file
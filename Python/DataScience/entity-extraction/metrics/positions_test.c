@@ -408,6 +408,168 @@ void test_positions_2(void)
     assert(success);
 }
 
+bool check_sparse_position_results_32(SparsePositionResults32 expected,
+                                      SparsePositionResults32 actual)
+{
+    if (expected.n != actual.n)
+    {
+        printf("check_sparse_position_results_32: Expected n=%d, actual=%d\n",
+               expected.n, actual.n);
+        return false;
+    }
+
+    for (uint32_t i = 0; i < expected.n; i++)
+    {
+        if (expected.results[i].entity_id != actual.results[i].entity_id ||
+            expected.results[i].n != actual.results[i].n ||
+            memcmp(expected.results[i].arr, actual.results[i].arr,
+                   expected.results[i].n * sizeof(uint32_t)) != 0)
+        {
+            printf("check_sparse_position_results_32: Failure with index %d\n",
+                   i);
+            return false;
+        }
+    }
+
+    if (strcmp(expected.error_message, actual.error_message) != 0)
+    {
+        printf("check_sparse_position_results_32: Expected error_message=%s, actual=%s\n",
+               expected.error_message, actual.error_message);
+        return false;
+    }
+
+    return true;
+}
+
+void test_positions_postings_32_1(void)
+{
+    printf("Running test_positions_postings_32_1()\n");
+
+    // A text of 300 tokens (more than can be represented with 8 bits), where
+    // entity 7 occurs in every token and entity 3 in the first and last tokens
+    uint32_t num_tokens = 300;
+    uint32_t postings_first_last[] = {3, 7};
+    uint32_t postings_other[] = {7};
+    const uint32_t *postings[300];
+    uint32_t lengths[300];
+    uint32_t positions_7[300];
+
+    for (uint32_t i = 0; i < num_tokens; i++)
+    {
+        bool first_last = i == 0 || i == num_tokens - 1;
+        postings[i] = first_last ? postings_first_last : postings_other;
+        lengths[i] = first_last ? 2 : 1;
+        positions_7[i] = i;
+    }
+
+    SparsePositionResults32 expected;
+    expected.n = 2;
+    expected.error_message[0] = '\0';
+
+    EntityPositions32 entity_positions[2];
+
+    // Entity ID 3
+    entity_positions[0].entity_id = 3;
+    entity_positions[0].n = 2;
+    uint32_t positions_3[] = {0, 299};
+    entity_positions[0].arr = positions_3;
+
+    // Entity ID 7
+    entity_positions[1].entity_id = 7;
+    entity_positions[1].n = 300;
+    entity_positions[1].arr = positions_7;
+
+    expected.results = entity_positions;
+
+    SparsePositionResults32 dense = positions_postings_32(postings, lengths,
+                                                          num_tokens, 10, 2);
+    SparsePositionResults32 sparse = positions_postings_sparse_32(postings,
+                                                                  lengths,
+                                                                  num_tokens,
+                                                                  2);
+
+    bool success = check_sparse_position_results_32(expected, dense) &&
+                   check_sparse_position_results_32(expected, sparse);
+    free_sparse_position_results_32(&dense);
+    free_sparse_position_results_32(&sparse);
+
+    assert(success);
+
+    // Only entity 7 occurs at least 3 times
+    dense = positions_postings_32(postings, lengths, num_tokens, 10, 3);
+    sparse = positions_postings_sparse_32(postings, lengths, num_tokens, 3);
+
+    expected.n = 1;
+    expected.results = &entity_positions[1];
+
+    success = check_sparse_position_results_32(expected, dense) &&
+              check_sparse_position_results_32(expected, sparse);
+    free_sparse_position_results_32(&dense);
+    free_sparse_position_results_32(&sparse);
+
+    assert(success);
+
+    // Minimum counts beyond the range of the saturating counts
+    dense = positions_postings_32(postings, lengths, num_tokens, 10, 300);
+    success = check_sparse_position_results_32(expected, dense);
+    free_sparse_position_results_32(&dense);
+
+    assert(success);
+
+    dense = positions_postings_32(postings, lengths, num_tokens, 10, 301);
+    assert(dense.n == 0 && dense.results == NULL);
+    assert(dense.error_message[0] == '\0');
+}
+
+void test_positions_postings_sparse_32_1(void)
+{
+    printf("Running test_positions_postings_sparse_32_1()\n");
+
+    // The sparse and dense kernels give the same results
+    uint32_t postings_0[] = {1, 5, 9, 20};
+    uint32_t postings_1[] = {5, 20};
+    uint32_t postings_2[] = {0, 1, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15,
+                             16, 17, 18, 19, 20};
+    uint32_t postings_4[] = {9, 20};
+    const uint32_t *postings[] = {postings_0, postings_1, postings_2, NULL,
+                                  postings_4};
+    uint32_t lengths[] = {4, 2, 18, 0, 2};
+
+    for (uint32_t min_count = 1; min_count <= 5; min_count++)
+    {
+        SparsePositionResults32 expected = positions_postings_32(
+            postings, lengths, 5, 20, min_count);
+        SparsePositionResults32 actual = positions_postings_sparse_32(
+            postings, lengths, 5, min_count);
+
+        bool success = check_sparse_position_results_32(expected, actual);
+        free_sparse_position_results_32(&expected);
+        free_sparse_position_results_32(&actual);
+
+        assert(success);
+    }
+}
+
+void test_positions_postings_32_2(void)
+{
+    printf("Running test_positions_postings_32_2()\n");
+
+    uint32_t postings_0[] = {1, 11};
+    const uint32_t *postings[] = {postings_0};
+    uint32_t lengths[] = {2};
+
+    // Entity ID greater than the maximum entity ID
+    SparsePositionResults32 actual = positions_postings_32(postings, lengths,
+                                                           1, 10, 1);
+    assert(actual.n == 0);
+    assert(strcmp(actual.error_message, "Entity ID > maximum entity ID") == 0);
+
+    // Minimum count of zero
+    actual = positions_postings_sparse_32(postings, lengths, 1, 0);
+    assert(actual.n == 0);
+    assert(strcmp(actual.error_message, "Minimum counts is zero") == 0);
+}
+
 int main(void)
 {
     printf("Running tests ...\n");
@@ -420,4 +582,7 @@ int main(void)
     test_compact_2();
     test_positions_1();
     test_positions_2();
+    test_positions_postings_32_1();
+    test_positions_postings_sparse_32_1();
+    test_positions_postings_32_2();
 }
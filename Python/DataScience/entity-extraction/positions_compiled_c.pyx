@@ -2,7 +2,11 @@
 # distutils: language=c
 # distutils: sources = ./metrics/positions.c
 
-from libc.stdint cimport uint8_t, uint32_t
+from libc.stdint cimport int64_t, uint8_t, uint32_t, uintptr_t
+from libc.stdlib cimport malloc, free
+from libc.string cimport memcpy
+
+import numpy as np
 
 cdef extern from "./metrics/positions.h":
     ctypedef struct EntityPositions:
@@ -15,10 +19,33 @@ cdef extern from "./metrics/positions.h":
         EntityPositions *results
         char *error_message
 
+    ctypedef struct EntityPositions32:
+        uint32_t entity_id
+        uint32_t n
+        uint32_t *arr
+
+    ctypedef struct SparsePositionResults32:
+        uint32_t n
+        EntityPositions32 *results
+        char *error_message
+
     SparsePositionResults positions(char *str, uint32_t max_entity_id, uint8_t min_count)
 
+    SparsePositionResults32 positions_postings_32(const uint32_t **postings,
+                                                  const uint32_t *lengths,
+                                                  uint32_t num_tokens,
+                                                  uint32_t max_entity_id,
+                                                  uint32_t min_count)
+
+    SparsePositionResults32 positions_postings_sparse_32(const uint32_t **postings,
+                                                         const uint32_t *lengths,
+                                                         uint32_t num_tokens,
+                                                         uint32_t min_count)
+
     void free_sparse_position_results(SparsePositionResults *sparse_results)
 
+    void free_sparse_position_results_32(SparsePositionResults32 *sparse_results)
+
 class PyEntityPositions:
     def __init__(self, entity_id, n, pos):
         self.entity_id = entity_id
@@ -62,12 +89,28 @@ class PySparsePositionResults:
             self.error_message == other.error_message and \
             self.results == other.results
 
-def calc_positions(s, max_entity_id, min_count):
+class PyFlatPositionResults:
+    """Positions of the entities held in flat NumPy arrays.
 
-    # Call out to the C function
-    cdef SparsePositionResults res = positions(s, max_entity_id, min_count)
+    The positions of the entity `entity_ids[i]` are
+    `positions[offsets[i]:offsets[i+1]]`.
+    """
+
+    def __init__(self, error_message, entity_ids, offsets, positions):
+        self.error_message = error_message
+        self.entity_ids = entity_ids
+        self.offsets = offsets
+        self.positions = positions
+
+    def __str__(self):
+        return f"PyFlatPositionResults(error_message={self.error_message}, entity_ids={self.entity_ids}, offsets={self.offsets}, positions={self.positions})"
+
+    def __repr__(self):
+        return self.__str__()
+
+cdef to_py_sparse_position_results(SparsePositionResults res):
+    """Convert the C struct to Python objects and free the C struct."""
 
-    # Convert the C struct to Python objects
     try:
         output = PySparsePositionResults(res.n, res.error_message.decode())
         for i in range(res.n):
@@ -79,4 +122,108 @@ def calc_positions(s, max_entity_id, min_count):
             free_sparse_position_results(&res)
             pass
 
-    return output
\ No newline at end of file
+    return output
+
+cdef to_py_flat_position_results_32(SparsePositionResults32 res):
+    """Convert the C struct (with 32-bit positions) to flat arrays and free it."""
+
+    cdef uint32_t[::1] entity_ids
+    cdef int64_t[::1] offsets
+    cdef uint32_t[::1] positions
+    cdef int64_t total = 0
+
+    try:
+        error_message = res.error_message.decode()
+
+        entity_ids_arr = np.empty(res.n, dtype=np.uint32)
+        offsets_arr = np.empty(res.n + 1, dtype=np.int64)
+        entity_ids = entity_ids_arr
+        offsets = offsets_arr
+
+        for i in range(res.n):
+            entity_ids[i] = res.results[i].entity_id
+            offsets[i] = total
+            total += res.results[i].n
+        offsets[res.n] = total
+
+        positions_arr = np.empty(total, dtype=np.uint32)
+        positions = positions_arr
+        for i in range(res.n):
+            if res.results[i].n > 0:
+                memcpy(&positions[offsets[i]], res.results[i].arr, res.results[i].n * sizeof(uint32_t))
+    finally:
+        free_sparse_position_results_32(&res)
+
+    return PyFlatPositionResults(error_message, entity_ids_arr, offsets_arr, positions_arr)
+
+def calc_positions(s, max_entity_id, min_count):
+
+    # Call out to the C function
+    cdef SparsePositionResults res = positions(s, max_entity_id, min_count)
+
+    # Convert the C struct to Python objects
+    return to_py_sparse_position_results(res)
+
+def calc_positions_postings_flat_32(postings, max_entity_id, min_count):
+    """Calculate the positions from a posting list (or None) for each token.
+
+    Each posting list is a buffer of sorted uint32 entity IDs (e.g. bytes or a
+    memoryview returned by LMDB), which is read in place. The positions are
+    32-bit, so a whole text can be processed in a single call, and are
+    returned as flat NumPy arrays.
+    """
+
+    return _calc_positions_postings(postings, max_entity_id, min_count, False)
+
+def calc_positions_postings_sparse_flat_32(postings, min_count):
+    """Variant of calc_positions_postings_flat_32() without dense arrays.
+
+    The memory used is proportional to the total length of the posting lists
+    rather than the maximum entity ID.
+    """
+
+    return _calc_positions_postings(postings, 0, min_count, True)
+
+cdef _calc_positions_postings(postings, uint32_t max_entity_id, uint32_t min_count, bint sparse):
+    cdef uint32_t num_tokens = len(postings)
+    cdef const uint32_t **ptrs = <const uint32_t **>malloc(num_tokens * sizeof(uint32_t *))
+    cdef uint32_t *lengths = <uint32_t *>malloc(num_tokens * sizeof(uint32_t))
+    cdef const uint32_t[::1] view
+    cdef SparsePositionResults32 res
+
+    if ptrs == NULL or lengths == NULL:
+        free(ptrs)
+        free(lengths)
+        raise MemoryError()
+
+    # Copies of the misaligned posting lists (kept until the C function returns)
+    copies = []
+
+    try:
+        for i in range(num_tokens):
+            if postings[i] is None or len(postings[i]) == 0:
+                ptrs[i] = NULL
+                lengths[i] = 0
+                continue
+
+            # LMDB only aligns values to 2 bytes, so a posting list that isn't
+            # aligned for 32-bit reads is copied
+            view = memoryview(postings[i]).cast("B").cast("I")
+            if <uintptr_t>&view[0] % sizeof(uint32_t) != 0:
+                copies.append(np.frombuffer(postings[i], dtype=np.uint32).copy())
+                view = copies[-1]
+
+            ptrs[i] = &view[0]
+            lengths[i] = view.shape[0]
+
+        # Call out to the C function
+        if sparse:
+            res = positions_postings_sparse_32(ptrs, lengths, num_tokens, min_count)
+        else:
+            res = positions_postings_32(ptrs, lengths, num_tokens, max_entity_id, min_count)
+    finally:
+        free(ptrs)
+        free(lengths)
+
+    # Convert the C struct to flat arrays
+    return to_py_flat_position_results_32(res)
@@ -1,28 +1,52 @@
 # Runs the API service for entity extraction.
 
-from typing import List
-from fastapi import FastAPI
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+from starlette.types import Receive
+from concurrent.futures import ProcessPoolExecutor
 from domain import Tokens, assert_tokens_valid
 from entity.matcher import (
     ProbabilisticMatch,
     most_likely_matches,
 )
 from entity.matcher_add_remove import EntityMatcherAddRemove
+from entity.matcher_streaming import StreamedMatch, StreamingEntityMatcher
 from likelihood.likelihood_add_remove import (
     make_likelihood_add_remove_symmetric,
 )
 
 from loguru import logger
 
+import anyio
+import asyncio
+import codecs
+import contextlib
+import multiprocessing
 import os
+import tempfile
+import threading
 import uvicorn
 
 from lookup.lmdb_lookup import LmdbLookup
-from text.tokeniser import tokenise_text
+from lookup.postings import Postings
+from lookup.shared_cache import SharedCache
+from text.tokeniser import (
+    Span,
+    StreamingTokeniser,
+    tokenise_text,
+    tokenise_text_with_spans,
+)
 
 app = FastAPI()
 
+# Lock so that one thread at a time refreshes the lookup (the jobs run in a
+# threadpool if there are no worker processes)
+refresh_lock = threading.Lock()
+
 
 class ExtractionRequest(BaseModel):
     text: str = Field(description="Text to process")
@@ -30,6 +54,12 @@ class ExtractionRequest(BaseModel):
     min_tokens_to_check: int
 
 
+class BatchExtractionRequest(BaseModel):
+    texts: List[str] = Field(description="Texts to process")
+    threshold: float
+    min_tokens_to_check: int
+
+
 class ExtractionMatch(BaseModel):
     entity_id: str  # External entity ID
     entity: str  # Entity tokens
@@ -37,6 +67,8 @@ class ExtractionMatch(BaseModel):
     probability: float  # Probability of the match
     start: int  # Start index in the text
     end: int  # End index in the text
+    char_start: Optional[int] = None  # Offset of the first character in the text
+    char_end: Optional[int] = None  # Offset after the last character in the text
 
 
 class ExtractionResponse(BaseModel):
@@ -46,13 +78,22 @@ class ExtractionResponse(BaseModel):
     num_matches: int
 
 
+class BatchExtractionResponse(BaseModel):
+    responses: List[ExtractionResponse]  # One response per text in the request
+
+
 def probability_match_to_extraction_match(
-    prob_match: ProbabilisticMatch, tokens: Tokens
+    prob_match: ProbabilisticMatch, tokens: Tokens, spans: Optional[List[Span]] = None
 ) -> ExtractionMatch:
-    """Convert a ProbabilisticMatch to an ExtractionMatch."""
+    """Convert a ProbabilisticMatch to an ExtractionMatch.
+
+    If the character spans of the tokens are given, the match includes the
+    character offsets of the matched text.
+    """
 
     assert type(prob_match) == ProbabilisticMatch
     assert_tokens_valid(tokens)
+    assert spans is None or len(spans) == len(tokens)
 
     # Get the entity's tokens from the lookup
     entity_tokens = lookup.tokens_for_entity(prob_match.entity_id)
@@ -73,11 +114,40 @@ def probability_match_to_extraction_match(
         probability=prob_match.probability,
         start=prob_match.start,
         end=prob_match.end,
+        char_start=None if spans is None else spans[prob_match.start][0],
+        char_end=None if spans is None else spans[prob_match.end][1],
+    )
+
+
+def streamed_match_to_extraction_match(
+    streamed_match: StreamedMatch, span: Optional[Span] = None
+) -> ExtractionMatch:
+    """Convert a match from a stream of tokens to an ExtractionMatch."""
+
+    prob_match, matched_tokens = streamed_match
+
+    entity_tokens = lookup.tokens_for_entity(prob_match.entity_id)
+    assert entity_tokens is not None
+
+    external_entity_id = lookup.external_entity_id(prob_match.entity_id)
+    assert external_entity_id is not None
+
+    return ExtractionMatch(
+        entity_id=external_entity_id,
+        entity=" ".join(entity_tokens),
+        matched_text=" ".join(matched_tokens),
+        probability=prob_match.probability,
+        start=prob_match.start,
+        end=prob_match.end,
+        char_start=None if span is None else span[0],
+        char_end=None if span is None else span[1],
     )
 
 
 def convert_matches(
-    matches: List[ProbabilisticMatch], tokens: Tokens
+    matches: List[ProbabilisticMatch],
+    tokens: Tokens,
+    spans: Optional[List[Span]] = None,
 ) -> List[ExtractionMatch]:
     """Convert matches for returning via the API"""
 
@@ -85,18 +155,20 @@ def convert_matches(
     assert_tokens_valid(tokens)
 
     return [
-        probability_match_to_extraction_match(prob_match, tokens)
+        probability_match_to_extraction_match(prob_match, tokens, spans)
         for prob_match in matches
     ]
 
 
 def convert_most_likely_matches(
-    matches: List[List[ProbabilisticMatch]], tokens: Tokens
+    matches: List[List[ProbabilisticMatch]],
+    tokens: Tokens,
+    spans: Optional[List[Span]] = None,
 ) -> List[List[ExtractionMatch]]:
     """Convert the list of list of probabilistic matches to extraction matches."""
 
     assert type(matches) == list
-    return [convert_matches(m, tokens) for m in matches]
+    return [convert_matches(m, tokens, spans) for m in matches]
 
 
 def error_response(message: str) -> ExtractionResponse:
@@ -111,42 +183,170 @@ def error_response(message: str) -> ExtractionResponse:
     )
 
 
-@app.post("/")
-async def root(req: ExtractionRequest) -> ExtractionResponse:
+def request_error(
+    threshold: float, min_tokens_to_check: int, text: Optional[str] = None
+) -> Optional[str]:
+    """Returns an error message if the request parameters are invalid."""
 
-    # Check the request
-    if req.threshold < 0.0 or req.threshold > 1.0:
-        return error_response("invalid threshold")
+    if threshold < 0.0 or threshold > 1.0:
+        return "invalid threshold"
+
+    if text is not None and len(text) == 0:
+        return "empty text"
 
-    if len(req.text) == 0:
-        return error_response("empty text")
+    if min_tokens_to_check <= 0:
+        return "invalid minimum number of tokens to check"
 
-    if req.min_tokens_to_check <= 0:
-        return error_response("invalid minimum number of tokens to check")
+    return None
 
-    # Instantiate the entity matcher
-    matcher = EntityMatcherAddRemove(
+
+def make_matcher(
+    threshold: float, min_tokens_to_check: int, max_window: int, max_entity_id: int
+) -> EntityMatcherAddRemove:
+    """Instantiate the entity matcher for a request.
+
+    The maximum entity ID must be read with the posting lists that are matched
+    (as the lookup may be updated in between).
+    """
+
+    return EntityMatcherAddRemove(
         lookup=lookup,
         likelihood=likelihood_symmetric,
-        min_window=req.min_tokens_to_check,
+        min_window=min_tokens_to_check,
         max_window=max_window,
-        min_probability=req.threshold,
+        min_probability=threshold,
         max_entity_id=max_entity_id,
+        stop_token_frequency=stop_token_frequency,
     )
 
-    # Tokenise the text
-    tokens = tokenise_text(req.text)
-    assert tokens is not None
-    logger.debug(
-        f"Request: tokens={tokens}, threshold={req.threshold}, min tokens={req.min_tokens_to_check}"
+
+def make_streaming_matcher(
+    threshold: float, min_tokens_to_check: int, max_window: int, max_entity_id: int
+) -> StreamingEntityMatcher:
+    """Instantiate the streaming entity matcher for a request."""
+
+    return StreamingEntityMatcher(
+        lookup=lookup,
+        likelihood=likelihood_symmetric,
+        min_window=min_tokens_to_check,
+        max_window=max_window,
+        min_probability=threshold,
+        max_entity_id=max_entity_id,
+        stop_token_frequency=stop_token_frequency,
     )
 
-    # Send the tokens to the entity matcher
+
+class StreamExtraction:
+    """State of the extraction of the entities from a stream of text."""
+
+    def __init__(self, matcher: StreamingEntityMatcher):
+        self.matcher = matcher
+        self.tokeniser = StreamingTokeniser()
+
+        # Character spans of the tokens that may be part of a match and the
+        # index in the stream of the first of these tokens
+        self.spans: Deque[Span] = deque()
+        self.spans_offset = 0
+
+    def span(self, start: int, end: int) -> Span:
+        """Character span of the tokens from start to end (inclusive)."""
+
+        return (
+            self.spans[start - self.spans_offset][0],
+            self.spans[end - self.spans_offset][1],
+        )
+
+    def discard_spans(self) -> None:
+        """Discard the spans of the tokens that can't be part of a match."""
+
+        while self.spans_offset < self.matcher.buffer_offset():
+            self.spans.popleft()
+            self.spans_offset += 1
+
+
+def extract_stream_text(
+    extraction: StreamExtraction, text: str, finish: bool
+) -> List[ExtractionMatch]:
+    """Send the text from a stream to the matcher and return any matches."""
+
+    # The tokeniser holds back a token that may continue in the next text
+    tokens = extraction.tokeniser.feed(text)
+    if finish:
+        tokens.extend(extraction.tokeniser.finish())
+
+    matches: List[StreamedMatch] = []
+    for token, span in tokens:
+        extraction.spans.append(span)
+        matches.extend(extraction.matcher.next_token(token))
+
+    if finish:
+        matches.extend(extraction.matcher.finish())
+
+    result = [
+        streamed_match_to_extraction_match(m, extraction.span(m[0].start, m[0].end))
+        for m in matches
+    ]
+
+    extraction.discard_spans()
+
+    return result
+
+
+async def extract_stream(
+    request: Request, threshold: float, min_tokens_to_check: int
+) -> AsyncIterator[str]:
+    """Extract the entities from the streamed request body as NDJSON."""
+
+    # The stream is a job of the worker pool (although it is matched in this
+    # process), so it counts towards the limit on the number of jobs
+    async with pool.job():
+        max_window, max_entity_id = refresh_lookup()
+        extraction = StreamExtraction(
+            make_streaming_matcher(
+                threshold, min_tokens_to_check, max_window, max_entity_id
+            )
+        )
+
+        # A chunk of the body may end part way through a character
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        async for chunk in request.stream():
+            text = decoder.decode(chunk)
+
+            # The matching is CPU-bound, so it is run outside of the event loop
+            matches = await run_in_threadpool(
+                extract_stream_text, extraction, text, False
+            )
+            for m in matches:
+                yield m.model_dump_json() + "\n"
+
+        text = decoder.decode(b"", final=True)
+        matches = await run_in_threadpool(extract_stream_text, extraction, text, True)
+        for m in matches:
+            yield m.model_dump_json() + "\n"
+
+
+def extract(
+    matcher: EntityMatcherAddRemove,
+    tokens: Tokens,
+    postings: Dict[str, Optional[Postings]],
+    threshold: float,
+    spans: Optional[List[Span]] = None,
+) -> ExtractionResponse:
+    """Extract the entities from the tokens of a single text."""
+
+    assert_tokens_valid(tokens)
+
+    if len(tokens) == 0:
+        return error_response("no tokens")
+
+    # Send the tokens (and their posting lists) to the entity matcher
+    matcher.reset()
     for token in tokens:
-        matcher.next_token(token)
+        matcher.next_token_with_postings(token, postings[token])
 
     # Retain results above threshold
-    matches = matcher.get_sorted_matches_above_threshold(req.threshold)
+    matches = matcher.get_sorted_matches_above_threshold(threshold)
 
     if len(matches) == 0:
         return ExtractionResponse(
@@ -158,13 +358,311 @@ async def root(req: ExtractionRequest) -> ExtractionResponse:
 
     # Return the response
     return ExtractionResponse(
-        matches=convert_matches(matches, tokens),
-        most_likely_matches=convert_most_likely_matches(most_likely, tokens),
+        matches=convert_matches(matches, tokens, spans),
+        most_likely_matches=convert_most_likely_matches(most_likely, tokens, spans),
         message="success",
         num_matches=len(matches),
     )
 
 
+def extract_texts(
+    texts: List[str], threshold: float, min_tokens_to_check: int
+) -> List[ExtractionResponse]:
+    """Extract the entities from each of the texts.
+
+    This is CPU-bound and so it is run in a worker process (if configured).
+    """
+
+    # Pick up any updates made to the lookup since it was last read
+    max_window, _ = refresh_lookup()
+
+    # Tokenise each of the texts (keeping the character spans of the tokens)
+    batch = [tokenise_text_with_spans(text) for text in texts]
+    logger.debug(
+        f"Request: texts={len(texts)}, threshold={threshold}, min tokens={min_tokens_to_check}"
+    )
+
+    # Look up the posting lists for the distinct tokens across all of the
+    # texts. The posting lists are read in place from the lookup, so the
+    # extraction must be performed within the reader's context.
+    distinct_tokens = {t for result in batch if result is not None for t in result[0]}
+    logger.debug(f"Distinct tokens in the request: {len(distinct_tokens)}")
+
+    with lookup.postings_reader() as read_postings:
+        postings = {t: read_postings(t) for t in distinct_tokens}
+
+        # A single entity matcher is reused for all of the texts
+        matcher = make_matcher(
+            threshold, min_tokens_to_check, max_window, read_postings.max_entity_id
+        )
+
+        return [
+            (
+                error_response("empty text")
+                if result is None
+                else extract(matcher, result[0], postings, threshold, result[1])
+            )
+            for result in batch
+        ]
+
+
+class WorkerPoolMetrics(BaseModel):
+    num_workers: int  # Number of worker processes (0 if run in-process)
+    max_concurrency: int  # Maximum number of jobs dispatched at once
+    max_queue_depth: int  # Maximum number of jobs waiting to be dispatched
+    queue_depth: int  # Number of jobs waiting to be dispatched
+    in_flight: int  # Number of jobs being processed
+    completed: int  # Number of jobs completed
+    rejected: int  # Number of jobs rejected because the queue was full
+
+
+class CacheMetrics(BaseModel):
+    hits: int  # Number of values read from the cache
+    misses: int  # Number of values read from the LMDB (not in the cache)
+    evictions: int  # Number of values evicted to make room for others
+    entries: int  # Number of values in the cache
+    bytes: int  # Number of bytes used by the values in the cache
+    capacity: int  # Maximum number of bytes used by the values in the cache
+
+
+class WorkerPool:
+    """Dispatches extraction jobs from the event loop to worker processes."""
+
+    def __init__(
+        self,
+        num_workers: int,
+        max_concurrency: int,
+        max_queue_depth: int,
+        lmdb_folder: str,
+        cache_size: int = 0,
+        cache_filepath: Optional[str] = None,
+    ):
+        assert type(num_workers) == int and num_workers >= 0
+        assert type(max_concurrency) == int and max_concurrency > 0
+        assert type(max_queue_depth) == int and max_queue_depth >= 0
+        assert type(lmdb_folder) == str
+        assert type(cache_size) == int and cache_size >= 0
+        assert cache_filepath is None or type(cache_filepath) == str
+
+        self._num_workers = num_workers
+        self._max_concurrency = max_concurrency
+        self._max_queue_depth = max_queue_depth
+
+        # Each worker process opens its own read-only LMDB environment (an
+        # LMDB environment mustn't be used across a fork, so the workers are
+        # spawned) and attaches to the shared cache
+        self._executor: Optional[ProcessPoolExecutor] = None
+        if num_workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=initialise_lookup,
+                initargs=(lmdb_folder, cache_size, cache_filepath),
+            )
+
+        # Limit on the number of jobs dispatched to the workers, so that jobs
+        # wait here (where the queue depth can be measured) rather than in the
+        # executor's unbounded queue
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self._queue_depth = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def is_full(self) -> bool:
+        """Is the queue of jobs waiting to be dispatched full?"""
+        return self._queue_depth >= self._max_queue_depth
+
+    def reject_if_full(self) -> bool:
+        """Count a job as rejected if the queue is full."""
+
+        if self.is_full():
+            self._rejected += 1
+            return True
+
+        return False
+
+    @contextlib.asynccontextmanager
+    async def job(self) -> AsyncIterator[None]:
+        """Wait for a job to be dispatched and hold its place until it's done."""
+
+        self._queue_depth += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._queue_depth -= 1
+
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._completed += 1
+            self._semaphore.release()
+
+    async def run(
+        self, texts: List[str], threshold: float, min_tokens_to_check: int
+    ) -> List[ExtractionResponse]:
+        """Run an extraction job without blocking the event loop."""
+
+        if self.reject_if_full():
+            return [error_response("service busy") for _ in texts]
+
+        async with self.job():
+            if self._executor is None:
+                return await run_in_threadpool(
+                    extract_texts, texts, threshold, min_tokens_to_check
+                )
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, extract_texts, texts, threshold, min_tokens_to_check
+            )
+
+    def metrics(self) -> WorkerPoolMetrics:
+        """Metrics for the worker pool."""
+
+        return WorkerPoolMetrics(
+            num_workers=self._num_workers,
+            max_concurrency=self._max_concurrency,
+            max_queue_depth=self._max_queue_depth,
+            queue_depth=self._queue_depth,
+            in_flight=self._in_flight,
+            completed=self._completed,
+            rejected=self._rejected,
+        )
+
+    def shutdown(self) -> None:
+        """Shutdown the worker processes."""
+
+        if self._executor is not None:
+            self._executor.shutdown()
+
+
+@app.post("/")
+async def root(req: ExtractionRequest) -> ExtractionResponse:
+
+    # Check the request
+    message = request_error(req.threshold, req.min_tokens_to_check, req.text)
+    if message is not None:
+        return error_response(message)
+
+    responses = await pool.run([req.text], req.threshold, req.min_tokens_to_check)
+    return responses[0]
+
+
+@app.post("/batch")
+async def batch(req: BatchExtractionRequest) -> BatchExtractionResponse:
+
+    # Check the request
+    message = request_error(req.threshold, req.min_tokens_to_check)
+    if message is not None:
+        return BatchExtractionResponse(
+            responses=[error_response(message) for _ in req.texts]
+        )
+
+    responses = await pool.run(req.texts, req.threshold, req.min_tokens_to_check)
+    return BatchExtractionResponse(responses=responses)
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """Response streamed while the request body is still being read.
+
+    The content generator reads the request body, so the response mustn't also
+    receive messages to listen for the client disconnecting (a disconnect is
+    raised when reading the body instead).
+    """
+
+    async def listen_for_disconnect(self, receive: Receive) -> None:
+        await anyio.sleep_forever()
+
+
+@app.post("/stream")
+async def stream(
+    request: Request, threshold: float, min_tokens_to_check: int
+) -> BodyStreamingResponse:
+
+    # Check the request
+    message = request_error(threshold, min_tokens_to_check)
+    if message is not None:
+        raise HTTPException(status_code=400, detail=message)
+
+    if pool.reject_if_full():
+        raise HTTPException(status_code=503, detail="service busy")
+
+    return BodyStreamingResponse(
+        extract_stream(request, threshold, min_tokens_to_check),
+        media_type="application/x-ndjson",
+    )
+
+
+@app.get("/metrics")
+async def metrics() -> WorkerPoolMetrics:
+    return pool.metrics()
+
+
+@app.get("/metrics/cache")
+async def cache_metrics() -> CacheMetrics:
+    stats = lookup.cache_stats()
+    if len(stats) == 0:
+        raise HTTPException(status_code=404, detail="lookup cache disabled")
+
+    return CacheMetrics(**stats)
+
+
+def refresh_lookup() -> Tuple[int, int]:
+    """Refresh the lookup if it has been updated (e.g. by 12_update_lookup.py).
+
+    Returns the maximum window size and the maximum entity ID of the lookup.
+    """
+
+    global max_window, max_entity_id
+
+    with refresh_lock:
+        if lookup.refresh():
+            max_window = lookup.max_number_tokens_for_entity()
+            max_entity_id = lookup.max_entity_id()
+            logger.info(
+                f"Lookup refreshed: maximum window size={max_window}, maximum entity ID={max_entity_id}"
+            )
+
+        return max_window, max_entity_id
+
+
+def initialise_lookup(
+    lmdb_folder: str, cache_size: int = 0, cache_filepath: Optional[str] = None
+) -> None:
+    """Initialise the lookup and the likelihood function for reading."""
+
+    global lookup, max_window, max_entity_id, likelihood_symmetric, stop_token_frequency
+
+    # Open (or create) the cache shared by the service and worker processes
+    cache = None
+    if cache_filepath is not None and cache_size > 0:
+        cache = SharedCache(cache_size, cache_filepath)
+
+    # Initialise a lookup for reading
+    lookup = LmdbLookup(lmdb_folder, False, cache=cache)
+
+    max_window = lookup.max_number_tokens_for_entity()
+    logger.info(f"Maximum window size: {max_window}")
+
+    max_entity_id = lookup.max_entity_id()
+    logger.info(f"Maximum entity ID: {max_entity_id}")
+
+    # Make the likelihood function
+    logger.info("Instantiating the likelihood function")
+    likelihood_symmetric = make_likelihood_add_remove_symmetric(0.3, 0.7, 0.9, 0.6)
+
+    # Tokens that belong to more entities than this are only checked against
+    # the candidate entities from the other tokens (read here as it's needed
+    # by each worker process)
+    value = os.environ.get("STOP_TOKEN_FREQUENCY")
+    stop_token_frequency = int(value) if value is not None else None
+    logger.info(f"Stop token frequency: {stop_token_frequency}")
+
+
 def make_test_database(
     lmdb_folder: str,
     sqlite_filepath: str,
@@ -215,17 +713,48 @@ if __name__ == "__main__":
         ]
         make_test_database(lmdb_folder, sqlite_database, token_to_count_file, entities)
 
-    # Initialise a lookup for reading
-    lookup = LmdbLookup(lmdb_folder, False)
+    # Number of worker processes that run the extraction jobs (0 runs them
+    # in the service process), the maximum number of jobs dispatched at once
+    # and the maximum number of jobs waiting to be dispatched
+    num_workers = int(os.environ.get("NUM_WORKERS", os.cpu_count() or 1))
+    max_concurrency = int(os.environ.get("MAX_CONCURRENCY", max(1, num_workers)))
+    max_queue_depth = int(os.environ.get("MAX_QUEUE_DEPTH", 100))
+
+    # Size in bytes of the cache of values read from the lookup, which is
+    # shared by the service and worker processes (0 disables the cache)
+    cache_size = int(os.environ.get("LOOKUP_CACHE_SIZE", 256 * 1024 * 1024))
+    cache_filepath = os.environ.get(
+        "LOOKUP_CACHE_FILEPATH",
+        os.path.join(
+            "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+            "entity-extraction-lookup-cache",
+        ),
+    )
 
-    max_window = lookup.max_number_tokens_for_entity()
-    logger.info(f"Maximum window size: {max_window}")
+    # Remove a cache left by a previous run (the lookup may have been rebuilt)
+    if os.path.exists(cache_filepath):
+        os.remove(cache_filepath)
 
-    max_entity_id = lookup.max_entity_id()
-    logger.info(f"Maximum entity ID: {max_entity_id}")
+    # Initialise the lookup (used by the service process when there are no
+    # worker processes)
+    initialise_lookup(lmdb_folder, cache_size, cache_filepath)
 
-    # Make the likelihood function
-    logger.info("Instantiating the likelihood function")
-    likelihood_symmetric = make_likelihood_add_remove_symmetric(0.3, 0.7, 0.9, 0.6)
+    logger.info(
+        f"Starting {num_workers} worker(s), max concurrency={max_concurrency}, max queue depth={max_queue_depth}"
+    )
+    pool = WorkerPool(
+        num_workers,
+        max_concurrency,
+        max_queue_depth,
+        lmdb_folder,
+        cache_size,
+        cache_filepath,
+    )
+
+    try:
+        uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+    finally:
+        pool.shutdown()
 
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+        if os.path.exists(cache_filepath):
+            os.remove(cache_filepath)
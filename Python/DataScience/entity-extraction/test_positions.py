@@ -1,4 +1,10 @@
-from positions_compiled_c import calc_positions, PySparsePositionResults
+from positions_compiled_c import (
+    calc_positions,
+    calc_positions_postings_flat_32,
+    calc_positions_postings_sparse_flat_32,
+    PySparsePositionResults,
+)
+from lookup.postings import postings_to_bytes
 
 
 def test_calc_positions():
@@ -16,3 +22,75 @@ def test_calc_positions():
     expected.add_result(32000000, 1, [4])
 
     assert result == expected
+
+
+def flat_to_lists(result):
+    """Entity IDs and positions of flat results, as lists."""
+    assert result.error_message == ""
+    return list(
+        zip(
+            result.entity_ids.tolist(),
+            [
+                result.positions[start:end].tolist()
+                for start, end in zip(result.offsets[:-1], result.offsets[1:])
+            ],
+        )
+    )
+
+
+def test_calc_positions_postings_32():
+    """The 32-bit kernels process texts of more than 255 tokens in one call."""
+    postings = [postings_to_bytes([7]) for _ in range(1000)]
+    postings[0] = postings_to_bytes([3, 7])
+    postings[999] = memoryview(postings_to_bytes([3, 7]))
+    postings[500] = None
+
+    expected = [(3, [0, 999]), (7, [i for i in range(1000) if i != 500])]
+
+    for result in [
+        calc_positions_postings_flat_32(postings, 10, 2),
+        calc_positions_postings_sparse_flat_32(postings, 2),
+    ]:
+        assert flat_to_lists(result) == expected
+
+
+def test_calc_positions_postings_flat_32():
+    """The dense and sparse kernels give the same flat results."""
+    postings = [
+        postings_to_bytes([1, 4]),
+        None,
+        postings_to_bytes([1, 2, 4]),
+        memoryview(postings_to_bytes([4])),
+        postings_to_bytes([32000000]),
+    ]
+
+    expected = {
+        1: [(1, [0, 2]), (2, [2]), (4, [0, 2, 3]), (32000000, [4])],
+        2: [(1, [0, 2]), (4, [0, 2, 3])],
+        3: [(4, [0, 2, 3])],
+    }
+
+    for min_count in [1, 2, 3]:
+        for result in [
+            calc_positions_postings_flat_32(postings, 32000000, min_count),
+            calc_positions_postings_sparse_flat_32(postings, min_count),
+        ]:
+            assert flat_to_lists(result) == expected[min_count]
+
+    # Entity ID greater than the maximum entity ID
+    result = calc_positions_postings_flat_32([postings_to_bytes([11])], 10, 1)
+    assert result.error_message == "Entity ID > maximum entity ID"
+    assert len(result.entity_ids) == 0
+
+
+def test_calc_positions_postings_misaligned():
+    """A posting list that isn't aligned for 32-bit reads (LMDB only aligns
+    values to 2 bytes) gives the same results."""
+    aligned = [postings_to_bytes([1, 4]), postings_to_bytes([1, 2, 4])]
+    misaligned = [memoryview(b"\0\0" + p)[2:] for p in aligned]
+
+    expected = flat_to_lists(calc_positions_postings_flat_32(aligned, 10, 1))
+    assert flat_to_lists(calc_positions_postings_flat_32(misaligned, 10, 1)) == expected
+    assert (
+        flat_to_lists(calc_positions_postings_sparse_flat_32(misaligned, 1)) == expected
+    )
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+import pytest
+
+from fastapi.testclient import TestClient
+
+import service
+from service import WorkerPool, app, initialise_lookup, make_test_database
+
+TEST_SERVICE_FOLDER = "./data/test-service"
+TEST_LMDB_FOLDER = os.path.join(TEST_SERVICE_FOLDER, "lmdb")
+
+ENTITIES = [
+    "78 Straight Street London",
+    "6 The Walk London",
+    "10 The Mews Birmingham",
+    "12 The Mews Birmingham",
+]
+
+
+@pytest.fixture(scope="module")
+def client():
+    """Client of the service with the test database (run in-process)."""
+
+    if os.path.exists(TEST_SERVICE_FOLDER):
+        shutil.rmtree(TEST_SERVICE_FOLDER)
+    os.makedirs(TEST_SERVICE_FOLDER)
+
+    make_test_database(
+        TEST_LMDB_FOLDER,
+        os.path.join(TEST_SERVICE_FOLDER, "sqlite.db"),
+        os.path.join(TEST_SERVICE_FOLDER, "token-to-count.pickle"),
+        ENTITIES,
+    )
+    initialise_lookup(TEST_LMDB_FOLDER)
+    service.pool = WorkerPool(0, 2, 10, TEST_LMDB_FOLDER)
+
+    yield TestClient(app)
+
+    service.lookup.close()
+    shutil.rmtree(TEST_SERVICE_FOLDER)
+
+
+def test_extract(client):
+    request = {
+        "text": "The address is 78 Straight Street.",
+        "threshold": 0.7,
+        "min_tokens_to_check": 2,
+    }
+    response = client.post("/", json=request).json()
+
+    assert response["message"] == "success"
+    assert response["num_matches"] == len(response["matches"]) > 0
+    best = response["most_likely_matches"][0][0]
+    assert best["entity_id"] == "100"
+    assert best["matched_text"] == "78 straight street"
+
+    # The character offsets are of the matched text before it was tokenised
+    start, end = best["char_start"], best["char_end"]
+    assert request["text"][start:end] == "78 Straight Street"
+
+    # Invalid requests
+    request["threshold"] = 1.5
+    assert client.post("/", json=request).json()["message"] == "invalid threshold"
+    request["threshold"] = 0.7
+    request["text"] = ""
+    assert client.post("/", json=request).json()["message"] == "empty text"
+
+
+def test_batch(client):
+    request = {
+        "texts": ["The address is 78 Straight Street.", "Nothing here", ""],
+        "threshold": 0.5,
+        "min_tokens_to_check": 2,
+    }
+    responses = client.post("/batch", json=request).json()["responses"]
+
+    assert [r["message"] for r in responses] == ["success", "no matches", "empty text"]
+
+    # The response for a text in a batch is the same as for the text alone
+    single = client.post(
+        "/",
+        json={"text": request["texts"][0], "threshold": 0.5, "min_tokens_to_check": 2},
+    ).json()
+    assert responses[0] == single
+
+
+def test_stream(client):
+    text = "Go to 10 The Mews Birmingham and then 6 The Walk London"
+    chunks = [text[i : i + 7].encode("utf-8") for i in range(0, len(text), 7)]
+
+    response = client.post(
+        "/stream",
+        params={"threshold": 0.5, "min_tokens_to_check": 2},
+        content=iter(chunks),
+    )
+    assert response.status_code == 200
+
+    matches = [json.loads(line) for line in response.text.splitlines()]
+    assert {m["entity_id"] for m in matches} >= {"101", "102"}
+    for m in matches:
+        assert text[m["char_start"] : m["char_end"]].lower() == m["matched_text"]
+
+    # Invalid parameters
+    response = client.post(
+        "/stream", params={"threshold": 0.5, "min_tokens_to_check": 0}, content=b"a"
+    )
+    assert response.status_code == 400
+
+
+def test_stream_busy(client):
+    pool = service.pool
+    service.pool = WorkerPool(0, 1, 0, TEST_LMDB_FOLDER)
+    try:
+        response = client.post(
+            "/stream", params={"threshold": 0.5, "min_tokens_to_check": 2}, content=b"a"
+        )
+        assert response.status_code == 503
+        assert service.pool.metrics().rejected == 1
+    finally:
+        service.pool = pool
+
+
+def test_worker_pool(monkeypatch):
+    """Jobs wait for a place, are rejected if the queue is full and run off
+    the event loop if there are no worker processes."""
+
+    threads = []
+
+    def extract_texts(texts, threshold, min_tokens_to_check):
+        threads.append(threading.get_ident())
+        return ["done" for _ in texts]
+
+    monkeypatch.setattr(service, "extract_texts", extract_texts)
+
+    async def run():
+        pool = WorkerPool(0, 1, 1, TEST_LMDB_FOLDER)
+
+        # Hold the only place, so the next job waits in the queue
+        async with pool.job():
+            waiting = asyncio.ensure_future(pool.run(["a"], 0.5, 2))
+            await asyncio.sleep(0)
+            metrics = pool.metrics()
+            assert (metrics.queue_depth, metrics.in_flight) == (1, 1)
+
+            # The queue is full
+            rejected = await pool.run(["b", "c"], 0.5, 2)
+            assert [r.message for r in rejected] == ["service busy"] * 2
+
+        assert await waiting == ["done"]
+
+        metrics = pool.metrics()
+        assert (metrics.queue_depth, metrics.in_flight) == (0, 0)
+        assert (metrics.completed, metrics.rejected) == (2, 1)
+
+        pool.shutdown()
+
+    asyncio.run(run())
+
+    # The job ran in the threadpool rather than on the event loop's thread
+    assert len(threads) == 1 and threads[0] != threading.get_ident()
@@ -1,4 +1,9 @@
-from text.tokeniser import tokenise_text
+from text.tokeniser import (
+    StreamingTokeniser,
+    tokenise_stream,
+    tokenise_text,
+    tokenise_text_with_spans,
+)
 
 
 def test_tokenise_text():
@@ -18,3 +23,63 @@ def test_tokenise_text():
         assert (
             actual == test_case["expected"]
         ), f"Error tokenising {test_case['text']}, expected: {test_case['expected']}, actual: {actual}"
+
+
+def test_tokenise_text_unicode():
+    """Tokenising non-ASCII text (the same tokens as NLTK's wordpunct_tokenize)."""
+
+    test_cases = [
+        {"text": "Café René, Zürich", "expected": ["café", "rené", "zürich"]},
+        # A combining mark is part of a word, but a superscript digit isn't
+        {"text": "café 10²", "expected": ["café", "10", "²"]},
+        # The lowercase form of İ includes a combining mark
+        {"text": "İstanbul—Ankara", "expected": ["i̇stanbul", "—", "ankara"]},
+        # The information separators aren't whitespace
+        {"text": "a\x1cb", "expected": ["a", "\x1c", "b"]},
+        {"text": "東京 «test»", "expected": ["東京", "«", "test", "»"]},
+    ]
+
+    for test_case in test_cases:
+        assert tokenise_text(test_case["text"]) == test_case["expected"]
+
+
+def test_tokenise_text_with_spans():
+    """Unit tests for tokenise_text_with_spans()."""
+
+    assert tokenise_text_with_spans(1234) is None
+    assert tokenise_text_with_spans("") is None
+    assert tokenise_text_with_spans("...") == ([], [])
+
+    text = "Go to 37 Straight-Street, London."
+    tokens, spans = tokenise_text_with_spans(text)
+    assert tokens == ["go", "to", "37", "straight", "street", "london"]
+    assert spans == [(0, 2), (3, 5), (6, 8), (9, 17), (18, 24), (26, 32)]
+    assert [text[start:end].lower() for start, end in spans] == tokens
+
+    # The lowercase form of İ is two characters, but the spans are offsets in
+    # the original text
+    text = "İİ ab"
+    tokens, spans = tokenise_text_with_spans(text)
+    assert tokens == ["i̇i̇", "ab"]
+    assert spans == [(0, 2), (3, 5)]
+
+
+def test_streaming_tokeniser():
+    """The tokens from a stream are the same however the text is chunked."""
+
+    text = "Go to 37 Straight-Street, London. İstanbul—Ankara 東京"
+    tokens, spans = tokenise_text_with_spans(text)
+    expected = list(zip(tokens, spans))
+
+    for size in range(1, len(text) + 1):
+        chunks = [text[idx : idx + size] for idx in range(0, len(text), size)]
+        assert list(tokenise_stream(chunks)) == expected
+
+    # A token is held back until the next chunk shows that it is complete
+    tokeniser = StreamingTokeniser()
+    assert tokeniser.feed("Straight Str") == [("straight", (0, 8))]
+    assert tokeniser.feed("eet") == []
+    assert tokeniser.feed(" ") == [("street", (9, 15))]
+    assert tokeniser.feed("London") == []
+    assert tokeniser.finish() == [("london", (16, 22))]
+    assert tokeniser.finish() == []
@@ -1,7 +1,156 @@
+import re
 import string
-from typing import Optional
+import sys
+import unicodedata
+from typing import Iterable, Iterator, List, Optional, Tuple
 from domain import Tokens
-from nltk.tokenize import wordpunct_tokenize
+
+# Unicode categories of the word characters (letters, marks, decimal digits,
+# letter numbers and connector punctuation)
+WORD_CATEGORIES = {"Lu", "Ll", "Lt", "Lm", "Lo", "Mn", "Mc", "Me", "Nd", "Nl", "Pc"}
+
+# Code points beyond those whose categories are checked that are word
+# characters: the zero-width (non-)joiners, the letters in circles and squares,
+# the supplementary ideographic planes and the variation selectors
+EXTRA_WORD_RANGES = [
+    (0x200C, 0x200D),
+    (0x24B6, 0x24E9),
+    (0x1F130, 0x1F149),
+    (0x1F150, 0x1F169),
+    (0x1F170, 0x1F189),
+    (0x20000, 0x3FFFF),
+    (0xE0100, 0xE01EF),
+]
+
+# Code points whose categories are checked (the planes with marks)
+CHECKED_CODE_POINTS = 0x20000
+
+# Last code point of the Basic Multilingual Plane
+MAX_BMP = 0xFFFF
+
+
+def word_character_ranges() -> List[Tuple[int, int]]:
+    """Ranges (inclusive) of the code points of the word characters.
+
+    These are the characters of Unicode's definition of a word character, as
+    used by the regex engine of NLTK's tokenisers, which differs from the \\w
+    of Python's re module (e.g. a combining mark is a word character but a
+    superscript digit isn't).
+    """
+
+    # Unassigned code points don't occur in text, so they extend a range of
+    # word characters (to give fewer ranges and hence faster matching)
+    ranges = []
+    in_range = False
+    for cp in range(CHECKED_CODE_POINTS):
+        category = unicodedata.category(chr(cp))
+        if category == "Cn":
+            continue
+
+        is_word = category in WORD_CATEGORIES
+        if is_word and in_range:
+            ranges[-1] = (ranges[-1][0], cp)
+        elif is_word:
+            ranges.append((cp, cp))
+
+        in_range = is_word
+
+    return ranges + EXTRA_WORD_RANGES
+
+
+def character_class(ranges: List[Tuple[int, int]]) -> str:
+    """Regex character class (without brackets) of the ranges of code points."""
+    return "".join([f"\\U{a:08x}-\\U{b:08x}" for a, b in ranges])
+
+
+# Unicode's whitespace characters (which, unlike the \\s of Python's re module,
+# exclude the information separators \\x1c to \\x1f)
+WHITESPACE = r"\t\n\x0b\x0c\r \x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000"
+
+# The word characters are split into those in the Basic Multilingual Plane
+# (which the re module checks with a bitmap) and those beyond it (which it
+# checks range by range), so that the ranges beyond it are only checked for
+# characters beyond it
+WORD_RANGES = word_character_ranges()
+BMP_WORD = character_class(
+    [(a, min(b, MAX_BMP)) for a, b in WORD_RANGES if a <= MAX_BMP]
+)
+ASTRAL_WORD = character_class(
+    [(max(a, MAX_BMP + 1), b) for a, b in WORD_RANGES if b > MAX_BMP]
+)
+ASTRAL = character_class([(MAX_BMP + 1, sys.maxunicode)])
+
+WORD_CHARACTER = f"(?:[{BMP_WORD}]|(?=[{ASTRAL}])[{ASTRAL_WORD}])"
+OTHER_CHARACTER = (
+    f"(?:[^{BMP_WORD}{WHITESPACE}{ASTRAL}]|(?=[{ASTRAL}])[^{ASTRAL_WORD}])"
+)
+
+# A token is a run of word characters or a run of other non-whitespace
+# characters (the same tokens as NLTK's wordpunct_tokenize)
+TOKEN_PATTERN = re.compile(f"{WORD_CHARACTER}+|{OTHER_CHARACTER}+")
+
+# Fast path for ASCII text (the common case), as matching the large Unicode
+# character classes is slow
+ASCII_TOKEN_PATTERN = re.compile(r"[a-zA-Z0-9_]+|[^a-zA-Z0-9_\t\n\x0b\x0c\r ]+")
+
+# Characters of a token that is removed if it is composed of just these
+PUNCTUATION = string.punctuation
+
+# Start and end (exclusive) character offsets of a token in the text
+Span = Tuple[int, int]
+
+
+def token_pattern(text: str) -> re.Pattern:
+    """Compiled pattern to tokenise the text."""
+
+    if text.isascii():
+        return ASCII_TOKEN_PATTERN
+
+    return TOKEN_PATTERN
+
+
+def is_punctuation(token: str) -> bool:
+    """Is the token composed of just punctuation?"""
+    return len(token.strip(PUNCTUATION)) == 0
+
+
+def lowercase_offsets(text: str, lowered: str) -> Optional[List[int]]:
+    """Offset in the text of each character of the lowercase text.
+
+    Returns None if the lowercase text has the same length as the text (so the
+    offsets are the same), which is the case unless the text has a character
+    whose lowercase form is more than one character.
+    """
+
+    if len(lowered) == len(text):
+        return None
+
+    offsets = []
+    for idx, c in enumerate(text):
+        offsets.extend([idx] * len(c.lower()))
+
+    return offsets
+
+
+def tokens_and_spans(text: str) -> Iterator[Tuple[str, Span, bool]]:
+    """Lowercase tokens in the text, their spans and whether they are kept.
+
+    Tokens composed of just punctuation aren't kept. The text is lowercased
+    before it is tokenised (so that the tokens are the same as tokenising the
+    lowercase text) and the spans are the offsets in the original text.
+    """
+
+    lowered = text.lower()
+    offsets = lowercase_offsets(text, lowered)
+
+    for m in token_pattern(lowered).finditer(lowered):
+        token = m.group()
+        if offsets is None:
+            span = m.span()
+        else:
+            span = (offsets[m.start()], offsets[m.end() - 1] + 1)
+
+        yield token, span, not is_punctuation(token)
 
 
 def tokenise_text(text: str) -> Optional[Tokens]:
@@ -13,14 +162,90 @@ def tokenise_text(text: str) -> Optional[Tokens]:
     if len(text) == 0:
         return None
 
-    punct = set(string.punctuation)
+    # Tokenise the lowercase version of the text and remove tokens that are
+    # only punctuation
+    lowered = text.lower()
+    return [t for t in token_pattern(lowered).findall(lowered) if not is_punctuation(t)]
+
+
+def tokenise_text_with_spans(text: str) -> Optional[Tuple[Tokens, List[Span]]]:
+    """Tokenise the text and return the character span of each token."""
+
+    if type(text) != str:
+        return None
+
+    if len(text) == 0:
+        return None
+
+    tokens = []
+    spans = []
+    for token, span, keep in tokens_and_spans(text):
+        if keep:
+            tokens.append(token)
+            spans.append(span)
+
+    return tokens, spans
+
+
+class StreamingTokeniser:
+    """Tokenises text that arrives in chunks.
+
+    A chunk may end part way through a token, so the last token of a chunk is
+    held back until the next chunk (or the end of the stream) shows that it is
+    complete. The spans are the character offsets in the whole stream.
+    """
+
+    def __init__(self):
+        # Text that hasn't been tokenised and its offset in the stream
+        self._remainder = ""
+        self._offset = 0
+
+    def feed(self, text: str) -> List[Tuple[str, Span]]:
+        """Tokenise the next chunk of the text and return the complete tokens."""
+
+        assert type(text) == str
+
+        text = self._remainder + text
+        tokens = list(tokens_and_spans(text))
+
+        # Hold back the last token if it runs to the end of the text
+        end = len(text)
+        if len(tokens) > 0 and tokens[-1][1][1] == len(text):
+            end = tokens[-1][1][0]
+            tokens.pop()
+
+        result = [
+            (token, (start + self._offset, stop + self._offset))
+            for token, (start, stop), keep in tokens
+            if keep
+        ]
+
+        self._remainder = text[end:]
+        self._offset += end
+
+        return result
+
+    def finish(self) -> List[Tuple[str, Span]]:
+        """Return the tokens at the end of the stream."""
+
+        result = [
+            (token, (start + self._offset, stop + self._offset))
+            for token, (start, stop), keep in tokens_and_spans(self._remainder)
+            if keep
+        ]
+
+        self._offset += len(self._remainder)
+        self._remainder = ""
+
+        return result
+
+
+def tokenise_stream(chunks: Iterable[str]) -> Iterator[Tuple[str, Span]]:
+    """Generate the tokens and their spans from a stream of chunks of text."""
 
-    def only_punctuation(text: str) -> bool:
-        """Is the text composed of just punctuation?"""
-        return all([t in punct for t in text])
+    tokeniser = StreamingTokeniser()
 
-    # Tokenise the lowercase version of the text
-    tokens = wordpunct_tokenize(text.lower())
+    for chunk in chunks:
+        yield from tokeniser.feed(chunk)
 
-    # Remove tokens that are only punctuation
-    return [t for t in tokens if not only_punctuation(t)]
+    yield from tokeniser.finish()
@@ -35,9 +35,18 @@
 # - Feature extractor functions f() will be defined in code and referenced by
 #   name in config.
 # - Probability distribution will be modelled as a dict to provide a sparse
-#   representation.
+#   representation, or as a dense array (ArrayDist) if the values are integers,
+#   which is much faster for large computation graphs.
+#
+# compile_graph() compiles the config into an execution plan (CompiledGraph)
+# that is run on many inputs G, reusing the results of the nodes whose inputs
+# haven't changed.
+
+import multiprocessing
+import numpy as np
 
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 
 def build_f_fns(K):
@@ -75,7 +84,10 @@ def d(V, c):
 
 
 def prob_distribution_valid(dist):
-    """Is the (sparse) probability distribution valid?"""
+    """Is the (sparse or array) probability distribution valid?"""
+
+    if isinstance(dist, ArrayDist):
+        return dist.is_valid()
 
     assert type(dist) == dict
     return (sum(dist.values()) - 1.0) < 1e-5 and \
@@ -152,6 +164,216 @@ def dist_prod_of_rvs(dists):
     return result
 
 
+# Minimum length of the result of a convolution for which it's calculated using
+# the FFT (as it's faster to convolve short arrays directly)
+FFT_THRESHOLD = 500
+
+# Maximum length of the array of a distribution (the product of two random
+# variables can have a very wide support)
+MAX_ARRAY_LENGTH = 10**7
+
+
+class ArrayDist:
+    """Probability distribution over a range of integers as a dense array.
+
+    Element i of probs is the probability of the value offset + i. The array
+    is trimmed so that its first and last elements are non-zero.
+    """
+
+    def __init__(self, offset, probs):
+        probs = np.asarray(probs, dtype=float)
+        assert probs.ndim == 1
+        assert len(probs) <= MAX_ARRAY_LENGTH, f"Support too large: {len(probs)}"
+
+        nonzero = np.flatnonzero(probs)
+        assert len(nonzero) > 0, "Distribution has no non-zero probabilities"
+
+        self.offset = int(offset) + int(nonzero[0])
+        self.probs = probs[nonzero[0] : nonzero[-1] + 1]
+
+    @staticmethod
+    def from_dict(dist):
+        """Make an ArrayDist from a (sparse) dict distribution."""
+
+        assert type(dist) == dict and len(dist) > 0
+        assert all([k == int(k) for k in dist.keys()]), "Values must be integers"
+
+        values = np.array([int(k) for k in dist.keys()])
+        offset = values.min()
+
+        probs = np.zeros(values.max() - offset + 1)
+        np.add.at(probs, values - offset, list(dist.values()))
+
+        return ArrayDist(offset, probs)
+
+    def to_dict(self):
+        """Sparse representation of the distribution."""
+
+        idx = np.flatnonzero(self.probs)
+        return {int(self.offset + i): float(self.probs[i]) for i in idx}
+
+    def values(self):
+        """Values of the random variable for each element of the array."""
+        return np.arange(self.offset, self.offset + len(self.probs))
+
+    def support(self):
+        """Minimum and maximum values with a non-zero probability."""
+        return self.offset, self.offset + len(self.probs) - 1
+
+    def is_valid(self):
+        """Is the probability distribution valid?"""
+        return abs(np.sum(self.probs) - 1.0) < 1e-5 and np.all(self.probs >= 0)
+
+    def truncate(self, tol):
+        """Remove the values with a probability less than tol (and normalise)."""
+
+        assert 0 <= tol < 1
+
+        if tol == 0:
+            return self
+
+        probs = np.where(self.probs < tol, 0.0, self.probs)
+        return ArrayDist(self.offset, probs / np.sum(probs))
+
+
+def as_array_dist(dist):
+    """Convert a distribution to an ArrayDist (if it isn't one already)."""
+
+    if isinstance(dist, ArrayDist):
+        return dist
+
+    return ArrayDist.from_dict(dist)
+
+
+def fft_length(n):
+    """Length of the FFT for a convolution of length n (a power of 2)."""
+    return 1 << (n - 1).bit_length()
+
+
+def clean_fft_result(probs):
+    """Set the round-off error of an FFT convolution to 0."""
+
+    return np.where(probs < np.finfo(float).eps * np.max(probs), 0.0, probs)
+
+
+def convolve(a, b):
+    """Convolution of two arrays of probabilities."""
+
+    # Direct convolution is faster if the result or one of the arrays is short
+    n = len(a) + len(b) - 1
+    if n < FFT_THRESHOLD or min(len(a), len(b)) < 32:
+        return np.convolve(a, b)
+
+    size = fft_length(n)
+    result = np.fft.irfft(np.fft.rfft(a, size) * np.fft.rfft(b, size), size)[:n]
+
+    return clean_fft_result(result)
+
+
+def array_dist_sum_two_rvs(x, y):
+    """Distribution of the sum of two random variables as an ArrayDist."""
+
+    x = as_array_dist(x)
+    y = as_array_dist(y)
+
+    return ArrayDist(x.offset + y.offset, convolve(x.probs, y.probs))
+
+
+def array_dist_sum_of_rvs(dists):
+    """Distribution of the sum of random variables as an ArrayDist.
+
+    If the result is long, the convolutions are performed together in the
+    frequency domain, i.e. one FFT per random variable.
+    """
+
+    assert len(dists) >= 2
+    dists = [as_array_dist(d) for d in dists]
+
+    offset = sum([d.offset for d in dists])
+    n = sum([len(d.probs) - 1 for d in dists]) + 1
+
+    if n < FFT_THRESHOLD:
+        probs = dists[0].probs
+        for d in dists[1:]:
+            probs = np.convolve(probs, d.probs)
+
+        return ArrayDist(offset, probs)
+
+    size = fft_length(n)
+    spectrum = np.fft.rfft(dists[0].probs, size)
+    for d in dists[1:]:
+        spectrum *= np.fft.rfft(d.probs, size)
+
+    probs = clean_fft_result(np.fft.irfft(spectrum, size)[:n])
+
+    return ArrayDist(offset, probs)
+
+
+def array_dist_prod_two_rvs(x, y, tol=0.0):
+    """Distribution of the product of two random variables as an ArrayDist.
+
+    The probability of each pair of values is added to the bucket of their
+    product. Values with a probability less than tol are removed first (which
+    reduces the number of pairs and the width of the support).
+    """
+
+    x = as_array_dist(x).truncate(tol)
+    y = as_array_dist(y).truncate(tol)
+
+    values = np.multiply.outer(x.values(), y.values()).ravel()
+    probs = np.multiply.outer(x.probs, y.probs).ravel()
+
+    nonzero = probs > 0
+    values = values[nonzero]
+    probs = probs[nonzero]
+
+    offset = values.min()
+    assert values.max() - offset < MAX_ARRAY_LENGTH, "Support too large"
+
+    return ArrayDist(offset, np.bincount(values - offset, weights=probs))
+
+
+def array_dist_prod_of_rvs(dists, tol=0.0):
+    """Distribution of the product of random variables as an ArrayDist."""
+
+    assert len(dists) >= 2
+
+    # Distribution of the product of the first two random variables
+    result = array_dist_prod_two_rvs(dists[0], dists[1], tol)
+
+    for idx in range(2, len(dists)):
+        result = array_dist_prod_two_rvs(result, dists[idx], tol)
+
+    return result
+
+
+def d_array(V, c):
+    """Function to generate a probability distribution as an ArrayDist.
+
+    This is the same distribution as d(), but c must be integers.
+    """
+
+    assert type(c) == list
+    assert len(c) == 2
+    assert all([type(ci) == int for ci in c])
+    assert type(V) == list
+    assert all([type(vi) == int for vi in V])
+
+    V = np.array(V)
+    idx = np.flatnonzero(V > 0)
+    assert len(idx) > 0, "No positive counts"
+
+    centres = idx * c[0] + c[1]
+    offset = centres.min() - 1
+
+    probs = np.zeros(centres.max() - offset + 2)
+    np.add.at(probs, centres - offset, V[idx] * 0.8)
+    np.add.at(probs, centres - offset - 1, V[idx] * 0.1)
+    np.add.at(probs, centres - offset + 1, V[idx] * 0.1)
+
+    return ArrayDist(offset, probs / np.sum(probs))
+
+
 class Node:
     def __init__(self, name):
         assert type(name) == str and len(name) > 0
@@ -255,12 +477,255 @@ def build_graph(config):
     nodes = [build_fd_node(node_config) for node_config in config['fd-nodes']]
     nodes.extend([build_m_node(node_config) for node_config in config['m-nodes']])
 
+    nodes_by_name = {n.name: n for n in nodes}
+    assert len(nodes_by_name) == len(nodes), "Duplicate node names"
+
     # Connect up the nodes (only MNodes have parents)
     for node_config in config['m-nodes']:
-        set_parents_of_node(nodes, node_config['name'], node_config['parents'])        
+        child_node = nodes_by_name[node_config['name']]
+        for parent_name in node_config['parents']:
+            assert parent_name in nodes_by_name, f"Unknown parent: {parent_name}"
+            child_node.add_parent(nodes_by_name[parent_name])
 
     return nodes
-    
+
+
+def topological_levels(parents):
+    """Sort the nodes into levels where the parents are in earlier levels.
+
+    parents is a list of the indices of the parents of each node.
+    """
+
+    level = [None for _ in parents]
+    levels = []
+
+    # Add the nodes whose parents are all in earlier levels
+    remaining = list(range(len(parents)))
+    while len(remaining) > 0:
+        current = [
+            i for i in remaining
+            if all([level[p] is not None for p in parents[i]])
+        ]
+        assert len(current) > 0, "Graph has a cycle"
+
+        for i in current:
+            level[i] = len(levels)
+
+        levels.append(current)
+        remaining = [i for i in remaining if level[i] is None]
+
+    return levels
+
+
+def freeze(x):
+    """Hashable version of a feature vector (to use as a key of a cache)."""
+
+    if isinstance(x, (list, tuple)):
+        return tuple([freeze(xi) for xi in x])
+
+    if isinstance(x, dict):
+        return tuple(sorted([(k, freeze(v)) for k, v in x.items()]))
+
+    if isinstance(x, np.ndarray):
+        return (x.dtype.str, x.shape, x.tobytes())
+
+    return x
+
+
+class CompiledGraph:
+    """Computation graph compiled into an execution plan.
+
+    The nodes are indexed by name and sorted topologically into levels, where
+    the nodes in a level only depend on nodes in earlier levels. The graph is
+    compiled once and run on many inputs G. The result of each node is cached
+    by the key of its inputs (the feature vector of an FD node or the results
+    of the parents of an M node), so a subgraph whose inputs haven't changed
+    from one G to another isn't calculated again.
+
+    The results are shared between the inputs of a batch. cache_size is the
+    number of results of each node that are kept between batches (the least
+    recently used results are removed), so the memory used is bounded when
+    the graph is run on a stream of inputs.
+    """
+
+    def __init__(self, config, cache_size=0):
+        assert type(cache_size) == int and cache_size >= 0
+        self.cache_size = cache_size
+
+        fd_configs = config['fd-nodes']
+        m_configs = config['m-nodes']
+
+        self.names = [c['name'] for c in fd_configs] + [c['name'] for c in m_configs]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        assert len(self.index) == len(self.names), "Duplicate node names"
+
+        self.num_fd_nodes = len(fd_configs)
+        self.fns = [(c['extractor-fn'], c['dist-fn']) for c in fd_configs]
+        self.fns.extend([c['fn'] for c in m_configs])
+
+        self.parents = [[] for _ in fd_configs]
+        for c in m_configs:
+            assert all([p in self.index for p in c['parents']]), \
+                f"Unknown parent of {c['name']}: {c['parents']}"
+            self.parents.append([self.index[p] for p in c['parents']])
+
+        self.levels = topological_levels(self.parents)
+        self.order = [i for level in self.levels for i in level]
+
+        self.reset()
+
+    def reset(self):
+        """Clear the cached results of the nodes."""
+
+        # For each node, the ID and the result for each key of its inputs (in
+        # order of use) and the ID of the next result
+        self.cache = [OrderedDict() for _ in self.names]
+        self.next_id = [0 for _ in self.names]
+
+    def is_fd_node(self, i):
+        return i < self.num_fd_nodes
+
+    def calculate(self, i, node_input):
+        """Calculate the result of node i given its input.
+
+        The input to an FD node is its feature vector and the input to an M node
+        is the list of the results of its parents.
+        """
+
+        if self.is_fd_node(i):
+            d = self.fns[i][1](node_input)
+        else:
+            d = self.fns[i](node_input)
+
+        assert prob_distribution_valid(d), f"Invalid distribution for {self.names[i]}"
+        return d
+
+    def run(self, G):
+        """Calculate the result of each node given the input G."""
+        return self.run_batch([G])[0]
+
+    def run_batch(self, Gs, num_workers=0):
+        """Calculate the result of each node for each input G.
+
+        Returns a dict of the result of each node (by name) for each G. If
+        num_workers > 0, the nodes that need to be calculated in each level
+        are calculated in a pool of worker processes (forked from this process,
+        so the functions of the nodes don't need to be picklable).
+
+        Each distinct result in the batch is calculated once. Afterwards, up to
+        cache_size results of each node are kept for the next batch (none by
+        default), so the memory used doesn't grow with the number of batches.
+        """
+
+        assert type(num_workers) == int and num_workers >= 0
+
+        # ID and result for each key of the inputs of each node in the batch
+        batch = [{} for _ in self.names]
+
+        # ID of the result of each node for each G
+        ids = [[None for _ in self.names] for _ in Gs]
+        results = [{} for _ in self.names]
+
+        executor = None
+        if num_workers > 0:
+            executor = ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=initialise_worker,
+                initargs=(self,),
+            )
+
+        try:
+            for level in self.levels:
+                keys = [[None for _ in level] for _ in Gs]
+
+                # Inputs of the nodes whose result for their key isn't cached
+                tasks = {}
+                for g, G in enumerate(Gs):
+                    for j, i in enumerate(level):
+                        if self.is_fd_node(i):
+                            v = self.fns[i][0](G)
+                            key = freeze(v)
+                            node_input = v
+                        else:
+                            key = tuple([ids[g][p] for p in self.parents[i]])
+                            node_input = None
+
+                        keys[g][j] = key
+
+                        # Use the result from a previous batch
+                        if key not in batch[i] and key in self.cache[i]:
+                            self.cache[i].move_to_end(key)
+                            batch[i][key] = self.cache[i][key]
+
+                        if key not in batch[i] and (i, key) not in tasks:
+                            if node_input is None:
+                                node_input = [
+                                    results[p][ids[g][p]] for p in self.parents[i]
+                                ]
+
+                            tasks[(i, key)] = node_input
+
+                # Calculate the results of the level
+                args = [(i, node_input) for (i, _), node_input in tasks.items()]
+                if executor is None or len(args) < 2:
+                    level_results = [
+                        self.calculate(i, node_input) for i, node_input in args
+                    ]
+                else:
+                    chunk_size = max(1, len(args) // (4 * num_workers))
+                    level_results = list(
+                        executor.map(calculate_node, args, chunksize=chunk_size)
+                    )
+
+                for (i, key), d in zip(tasks.keys(), level_results):
+                    batch[i][key] = (self.next_id[i], d)
+                    self.next_id[i] += 1
+
+                for g in range(len(Gs)):
+                    for j, i in enumerate(level):
+                        result_id, d = batch[i][keys[g][j]]
+                        ids[g][i] = result_id
+                        results[i][result_id] = d
+
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        # Keep the most recently used results for the next batch
+        for i in range(len(self.names)):
+            for key, value in batch[i].items():
+                self.cache[i][key] = value
+                self.cache[i].move_to_end(key)
+
+            while len(self.cache[i]) > self.cache_size:
+                self.cache[i].popitem(last=False)
+
+        return [
+            {name: results[i][ids[g][i]] for i, name in enumerate(self.names)}
+            for g in range(len(Gs))
+        ]
+
+
+# Compiled graph in a worker process
+worker_graph = None
+
+
+def initialise_worker(graph):
+    global worker_graph
+    worker_graph = graph
+
+
+def calculate_node(args):
+    """Calculate the result of a node in a worker process."""
+    i, node_input = args
+    return worker_graph.calculate(i, node_input)
+
+
+def compile_graph(config, cache_size=0):
+    """Compile the graph from config into an execution plan."""
+    return CompiledGraph(config, cache_size)
+
 
 if __name__ == '__main__':
 
@@ -318,3 +783,44 @@ if __name__ == '__main__':
         assert isinstance(node, Node)
         print(f"Node: {node.name}, Dist: {node.calculate()}")
 
+    # The same computation with the distributions as arrays
+    array_structure = {
+        "fd-nodes": [
+            {
+                "name": "fd_0",
+                "extractor-fn": f_fns[0],
+                "dist-fn": partial(d_array, c=[1, 1])
+            },
+            {
+                "name": "fd_1",
+                "extractor-fn": f_fns[1],
+                "dist-fn": partial(d_array, c=[1, 2])
+            }
+        ],
+        "m-nodes": [
+            {
+                "name": "m_0",
+                "fn": array_dist_sum_of_rvs,
+                "parents": ["fd_0", "fd_1"]
+            }
+        ],
+        "execution-order": ["fd_0", "fd_1", "m_0"]
+    }
+
+    nodes = build_graph(array_structure)
+    for n in nodes:
+        if type(n) == FDNode:
+            n.set_input(G)
+
+    for node_name in array_structure['execution-order']:
+        node = find_node_by_name(nodes, node_name)
+        print(f"Node: {node.name}, Dist: {node.calculate().to_dict()}")
+
+    # Compile the graph once and run it on several inputs (the result of a
+    # node whose inputs are the same as for a previous input is reused)
+    graph = compile_graph(array_structure)
+    Gs = [G, {0: [0, 1, 0], 1: [0, 1, 1]}, {0: [1, 1, 0], 1: [1, 0, 1]}]
+
+    for idx, result in enumerate(graph.run_batch(Gs)):
+        print(f"Input {idx}: Dist of m_0: {result['m_0'].to_dict()}")
+
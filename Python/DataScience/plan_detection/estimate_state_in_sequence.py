@@ -26,6 +26,7 @@ import numpy as np
 import random
 import scipy.optimize as optimize
 import matplotlib.pyplot as plt
+from scipy.special import gammaln, logsumexp
 
 
 def stage_changepoints(num_stages, tau_max):
@@ -313,21 +314,254 @@ def p_num_stages(joint_probs, L):
     return total_for_num_stages / total
 
 
+def cumulative_log_probs(event_times, event_types, cpt, tau_max):
+    """Cumulative log-probability of the events for each stage.
+
+    Element [s, t] is the sum of log p(event type | stage s) over the events
+    before time t (for 0 <= t <= tau_max + 1), so the log-likelihood of the
+    events in stage s between times a and b (exclusive) is [s, b] - [s, a].
+    """
+
+    assert len(event_times) == len(event_types)
+    assert tau_max >= 0
+
+    times = np.asarray(event_times, dtype=float)
+    assert np.all(times == np.floor(times)), f"non-integer event times: {times}"
+    assert np.all((0 <= times) & (times <= tau_max)), f"event time out of range"
+    times = times.astype(int)
+
+    types = np.asarray(event_types, dtype=int)
+    assert np.all(types < cpt.shape[1]), f"Event type out of range for CPT"
+
+    # Add on a small number in case the probability from the CPT is 0
+    log_p = np.log(cpt[:, types] + 1e-16)
+
+    sums = np.zeros((cpt.shape[0], tau_max + 2))
+    for s in range(cpt.shape[0]):
+        counts = np.bincount(times, weights=log_p[s], minlength=tau_max + 1)
+        sums[s, 1:] = np.cumsum(counts)
+
+    return sums
+
+
+def log_num_combinations(n, k):
+    """Log of the number of ways of choosing k of n items (n may be an array)."""
+
+    n = np.asarray(n, dtype=float)
+    valid = (k >= 0) & (n >= k)
+
+    with np.errstate(invalid="ignore"):
+        result = gammaln(n + 1) - gammaln(k + 1) - gammaln(n - k + 1)
+
+    return np.where(valid, result, -np.inf)
+
+
+def log_joint_num_stages(log_probs, p_s, tau_max):
+    """Log of the joint probability of the events and each number of stages.
+
+    A model with s + 1 stages has s changepoints at times
+    0 <= c_0 < ... < c_{s-1} < tau_max. As in run_inference(), the changepoints
+    of a model are the first s of the len(p_s) - 1 changepoints, so each is
+    weighted by the number of ways of choosing the remaining changepoints
+    after c_{s-1}.
+
+    The sum over the changepoints is calculated by a forward recursion over
+    the time of the last changepoint. The sum for stage s over the previous
+    changepoint is a prefix sum (as the log-likelihood of stage s is the
+    difference of the cumulative sums at its ends), so this takes
+    O(len(p_s) * tau_max) time.
+    """
+
+    L = len(p_s)
+    c = np.arange(tau_max)
+    end = tau_max + 1
+
+    log_joint = np.full(L, -np.inf)
+
+    # No changepoints (weighted by the number of ways of choosing all of them)
+    log_joint[0] = log_probs[0, end] + log_num_combinations(tau_max, L - 1)
+
+    # Log of the sum over the first changepoints with the last at time c of the
+    # likelihood of the events before c
+    log_f = log_probs[0, c]
+
+    for s in range(1, L):
+
+        # The last stage runs from the last changepoint to the end
+        log_ext = log_num_combinations(tau_max - 1 - c, L - 1 - s)
+        log_joint[s] = logsumexp(log_f + log_probs[s, end] - log_probs[s, c] + log_ext)
+
+        if s < L - 1:
+            # Sum over the previous changepoint (before c) for stage s
+            prefix = np.logaddexp.accumulate(log_f - log_probs[s, c])
+            log_f = np.concatenate([[-np.inf], prefix[:-1]]) + log_probs[s, c]
+
+    with np.errstate(divide="ignore"):
+        return log_joint + np.log(p_s)
+
+
+def prob_num_stages(event_times, event_types, p_s, cpt, tau_max):
+    """Probability of the number of stages given the events.
+
+    This is the same as p_num_stages(run_inference(...), len(p_s)), but it is
+    calculated by dynamic programming over the changepoints rather than by
+    enumerating them (and in log space, so it doesn't underflow for long
+    sequences of events).
+    """
+
+    assert len(event_times) == len(event_types)
+    assert len(p_s) > 0
+    assert len(p_s) == cpt.shape[0], f"incompatible number of stages"
+    assert tau_max >= 0
+
+    p_s = np.asarray(p_s, dtype=float)
+
+    # The prior if there are no events or no possible changepoints
+    if len(event_times) == 0 or tau_max == 0 or len(p_s) == 1:
+        return p_s / np.sum(p_s)
+
+    if tau_max < len(p_s) - 1:
+        return p_s / np.sum(p_s)
+
+    log_probs = cumulative_log_probs(event_times, event_types, cpt, tau_max)
+    log_joint = log_joint_num_stages(log_probs, p_s, tau_max)
+
+    total = logsumexp(log_joint)
+    assert np.isfinite(total), f"total = 0 for log joint: {log_joint}"
+
+    return np.exp(log_joint - total)
+
+
 def trim_events(event_times, event_types, t):
     """Retain events up to and including a given time."""
 
     assert len(event_times) == len(event_types)
     assert t >= 0
 
-    event_times_in_range = np.array([])
-    event_types_in_range = np.array([], dtype=int)
+    event_times = np.asarray(event_times, dtype=float)
+    event_types = np.asarray(event_types, dtype=int)
+
+    in_range = event_times <= t
+    return event_times[in_range], event_types[in_range]
+
+
+def log_transition(log_alpha, num_steps):
+    """Log forward messages after num_steps time steps without events.
+
+    A changepoint can occur at each time step, so the message for j
+    changepoints is the sum over i of the message for j - i changepoints
+    weighted by the number of ways of placing i changepoints in the steps.
+    """
+
+    L = log_alpha.shape[1]
+
+    # A single step (the common case) either has a changepoint or it doesn't
+    if num_steps == 1:
+        shifted = np.full(log_alpha.shape, -np.inf)
+        shifted[:, 1:] = log_alpha[:, :-1]
+        return np.logaddexp(log_alpha, shifted)
+
+    j = np.arange(L)
+
+    # Weights of moving from k to j changepoints
+    log_weights = log_num_combinations(num_steps, j[:, None] - j[None, :])
+
+    return logsumexp(log_alpha[:, None, :] + log_weights[None, :, :], axis=2)
+
+
+class StageTracker:
+    """Online estimate of the probability of the number of stages.
+
+    Events are added one at a time in time order and the probability of the
+    number of stages is the same as prob_num_stages() for the events so far.
+    Rather than recalculating from all of the events, the tracker keeps the
+    forward messages over time: element [s, j] is the log-likelihood of the
+    events so far summed over the placements of the first j changepoints, for
+    the model with s + 1 stages. Adding an event (or moving forward in time)
+    takes O(L^3) time, however many events there have been, so a tracker can
+    be kept for each of many objects with live streams of events.
+    """
+
+    def __init__(self, p_s, cpt):
+        assert len(p_s) > 0
+        assert len(p_s) == cpt.shape[0], f"incompatible number of stages"
+
+        self.p_s = np.asarray(p_s, dtype=float)
+        L = len(self.p_s)
+
+        with np.errstate(divide="ignore"):
+            self.log_p_s = np.log(self.p_s)
+
+        # Log-probability of each event type for the model with s + 1 stages
+        # after j changepoints (i.e. in stage min(s, j))
+        stage = np.minimum.outer(np.arange(L), np.arange(L))
+        self.log_p_event = np.log(cpt[stage] + 1e-16)
+
+        # Forward messages for the changepoints before the current time and the
+        # events before the current time
+        self.log_alpha = np.full((L, L), -np.inf)
+        self.log_alpha[:, 0] = 0.0
+
+        # Log-likelihood of the events at the current time
+        self.log_pending = np.zeros((L, L))
+
+        self.time = 0
+        self.num_events = 0
+
+    def advance(self, t):
+        """Move forward to time t."""
 
-    for i in range(len(event_times)):
-        if event_times[i] <= t:
-            event_times_in_range = np.append(event_times_in_range, event_times[i])
-            event_types_in_range = np.append(event_types_in_range, event_types[i])
+        assert t >= self.time, f"can't move back from time {self.time} to {t}"
 
-    return event_times_in_range, event_types_in_range
+        if t == self.time:
+            return
+
+        # A changepoint can occur at the current time, then the events at the
+        # current time are in the (possibly new) stage
+        self.log_alpha = log_transition(self.log_alpha, 1) + self.log_pending
+        self.log_pending = np.zeros(self.log_pending.shape)
+
+        # Time steps without events up to time t
+        if t - self.time > 1:
+            self.log_alpha = log_transition(self.log_alpha, t - self.time - 1)
+
+        self.time = t
+
+    def add_event(self, event_time, event_type):
+        """Add an event (at or after the time of the previous event)."""
+
+        assert event_time == int(event_time), f"invalid event time: {event_time}"
+        assert 0 <= event_type < self.log_p_event.shape[2]
+
+        self.advance(int(event_time))
+        self.log_pending += self.log_p_event[:, :, event_type]
+        self.num_events += 1
+
+    def prob_num_stages(self, t=None):
+        """Probability of the number of stages at time t.
+
+        If t isn't given, then it is the time of the latest event. Any events
+        added afterwards must be at or after time t.
+        """
+
+        if t is not None:
+            self.advance(t)
+
+        L = len(self.p_s)
+
+        # The prior if there are no events or not enough time for changepoints
+        if self.num_events == 0 or self.time < L - 1 or L == 1:
+            return self.p_s / np.sum(self.p_s)
+
+        # All of the changepoints must be placed (before the current time)
+        log_joint = (
+            self.log_alpha[:, L - 1] + self.log_pending[:, L - 1] + self.log_p_s
+        )
+
+        total = logsumexp(log_joint)
+        assert np.isfinite(total), f"total = 0 for log joint: {log_joint}"
+
+        return np.exp(log_joint - total)
 
 
 def prob_num_stages_over_time(event_times, event_types, p_s, cpt, tau_max):
@@ -336,20 +570,21 @@ def prob_num_stages_over_time(event_times, event_types, p_s, cpt, tau_max):
     # Matrix to hold the probability of the number of stages
     m = np.zeros((len(p_s), tau_max))
 
-    for t in range(tau_max):
-        # Only retain the events up to and including time t
-        event_times_in_range, event_types_in_range = trim_events(
-            event_times, event_types, t
-        )
+    # Add the events in time order
+    order = np.argsort(event_times, kind="stable")
+    event_times = np.asarray(event_times)[order]
+    event_types = np.asarray(event_types, dtype=int)[order]
 
-        # Run inference
-        joint_probs = run_inference(
-            event_times_in_range, event_types_in_range, p_s, cpt, t
-        )
-        assert len(joint_probs) > 0
+    tracker = StageTracker(p_s, cpt)
+    i = 0
+
+    for t in range(tau_max):
+        # Add the events at time t
+        while i < len(event_times) and event_times[i] <= t:
+            tracker.add_event(event_times[i], event_types[i])
+            i += 1
 
-        # Summarise
-        m[:, t] = p_num_stages(joint_probs, len(p_s))
+        m[:, t] = tracker.prob_num_stages(t)
 
     return m
 
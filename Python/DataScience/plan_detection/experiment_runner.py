@@ -0,0 +1,167 @@
+# Run Monte Carlo experiments in parallel
+#
+# Each trial of an experiment is run with the global random number generators
+# (of random and numpy) seeded from the seed of the experiment, the parameters
+# and the trial number, so the results don't depend on the number of worker
+# processes or the order in which the trials run. The results are appended to
+# a table on disk (with a JSON record per line) as the trials complete, so an
+# interrupted experiment resumes from the trials that have completed.
+
+import json
+import os
+import random
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def params_key(params):
+    """Key of a set of parameters (which must be JSON serialisable)."""
+
+    assert type(params) == dict
+
+    return json.dumps(params, sort_keys=True)
+
+
+def seed_trial(seed, params, trial):
+    """Seed the global random number generators for a trial."""
+
+    random.seed(f"{seed}-{params_key(params)}-{trial}")
+    np.random.seed(random.getrandbits(32))
+
+
+def to_json(x):
+    """Convert numpy types to types that can be serialised to JSON."""
+
+    if isinstance(x, (np.ndarray, np.generic)):
+        return x.tolist()
+
+    raise TypeError(f"Can't serialise {type(x)}")
+
+
+def run_chunk(trial_fn, seed, tasks):
+    """Run a chunk of trials, returning a record for each."""
+
+    records = []
+    for params, trial in tasks:
+        seed_trial(seed, params, trial)
+        records.append(
+            {"seed": seed, "params": params, "trial": trial, "result": trial_fn(params)}
+        )
+
+    return records
+
+
+def record_key(record):
+    """Key of a record of a trial (the trials of different seeds differ)."""
+    return (record.get("seed"), params_key(record["params"]), record["trial"])
+
+
+def read_results(results_path):
+    """Read the records from a results table.
+
+    A record that is only partly written (as the experiment was interrupted)
+    is removed from the file.
+    """
+
+    if results_path is None or not os.path.exists(results_path):
+        return []
+
+    with open(results_path, "rb") as f:
+        content = f.read()
+
+    # Remove the last line if it doesn't end in a newline
+    end = content.rfind(b"\n") + 1
+    if end < len(content):
+        with open(results_path, "r+b") as f:
+            f.truncate(end)
+
+    return [json.loads(line) for line in content[:end].decode("utf-8").splitlines()]
+
+
+def chunks(tasks, chunk_size):
+    """Split the list of tasks into chunks."""
+
+    assert chunk_size > 0
+
+    return [tasks[i : i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+
+
+def run_trials(
+    trial_fn,
+    params_list,
+    num_trials,
+    results_path=None,
+    seed=0,
+    num_workers=0,
+    chunk_size=10,
+):
+    """Run trials of an experiment for each set of parameters.
+
+    trial_fn is called with a dict of parameters and returns the result of a
+    trial (which must be JSON serialisable). It must be defined at the top
+    level of a module if num_workers > 0 (so it can be sent to the worker
+    processes). If num_workers is 0, the trials run in this process.
+
+    Returns a list of records (dicts with the seed, params, trial number and
+    result) in the order of the parameters and trials. If results_path is
+    given, the records are appended to the file as the trials complete and
+    trials that are already in the file (with the same seed) aren't run again.
+    """
+
+    assert len(params_list) > 0
+    assert type(num_trials) == int and num_trials > 0
+    assert type(num_workers) == int and num_workers >= 0
+
+    # Trials that have already completed
+    completed = {}
+    for record in read_results(results_path):
+        completed[record_key(record)] = record
+
+    tasks = [
+        (params, trial)
+        for params in params_list
+        for trial in range(num_trials)
+        if (seed, params_key(params), trial) not in completed
+    ]
+
+    results_file = None
+    if results_path is not None:
+        results_file = open(results_path, "a")
+
+    def store(records):
+        for record in records:
+            # The results are the same as those read back from the file
+            line = json.dumps(record, default=to_json)
+            completed[record_key(record)] = json.loads(line)
+
+            if results_file is not None:
+                results_file.write(line + "\n")
+
+        if results_file is not None:
+            results_file.flush()
+
+    try:
+        if num_workers == 0:
+            for chunk in chunks(tasks, chunk_size):
+                store(run_chunk(trial_fn, seed, chunk))
+
+        elif len(tasks) > 0:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                futures = [
+                    executor.submit(run_chunk, trial_fn, seed, chunk)
+                    for chunk in chunks(tasks, chunk_size)
+                ]
+
+                for future in as_completed(futures):
+                    store(future.result())
+
+    finally:
+        if results_file is not None:
+            results_file.close()
+
+    return [
+        completed[(seed, params_key(params), trial)]
+        for params in params_list
+        for trial in range(num_trials)
+    ]
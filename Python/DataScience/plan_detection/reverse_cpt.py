@@ -4,8 +4,11 @@
 
 import matplotlib.pyplot as plt
 import numpy as np
+import os
 import scipy.optimize as optimize
 
+from experiment_runner import run_trials
+
 def probabilities_valid(x):
     """Is the vector of probabilities valid?"""
 
@@ -283,28 +286,53 @@ def find_best_lambda(s, lambdas):
     return lambdas[idx]
 
 
+def best_lambda_trial(params):
+    """Generate a dataset and find the value of lambda that minimises the error."""
+
+    s = generate_set(params['num_stages'], params['num_events'],
+                     params['p_prop_lower'], params['p_prop_upper'],
+                     params['min_prob_p_e'], params['max_prob_p_e'])
+
+    return find_best_lambda(s, params['lambdas'])
+
+
 def run_experiments(num_stages, num_events,
                     p_prop_lower, p_prop_upper,
                     min_prob_p_e, max_prob_p_e,
                     num_experiments, 
-                    lambdas):
-    """Run a set of experiments to determine the best value of lambda."""
+                    lambdas,
+                    seed=0,
+                    num_workers=0,
+                    results_path=None):
+    """Run a set of experiments to determine the best value of lambda.
+
+    The experiments run in parallel if num_workers > 0. If results_path is
+    given, the results are stored in the file and an interrupted run resumes
+    from the experiments that have completed.
+    """
 
     assert num_experiments > 0
     assert len(lambdas) > 0
 
+    params = {
+        'num_stages': num_stages,
+        'num_events': num_events,
+        'p_prop_lower': p_prop_lower,
+        'p_prop_upper': p_prop_upper,
+        'min_prob_p_e': min_prob_p_e,
+        'max_prob_p_e': max_prob_p_e,
+        'lambdas': [float(l) for l in lambdas]
+    }
+
+    records = run_trials(best_lambda_trial, [params], num_experiments,
+                         results_path=results_path, seed=seed,
+                         num_workers=num_workers, chunk_size=1)
+
     best_lambdas = {}
 
-    for i in range(num_experiments):
-        
-        print(f"Running experiment {i+1}/{num_experiments}")
-        
-        # Generate a dataset
-        s = generate_set(num_stages, num_events, p_prop_lower, p_prop_upper,
-                         min_prob_p_e, max_prob_p_e)
-        
-        best_lambda = find_best_lambda(s, lambdas)
-        
+    for record in records:
+        best_lambda = record['result']
+
         if best_lambda not in best_lambdas:
             best_lambdas[best_lambda] = 1
         else:
@@ -361,7 +389,8 @@ if __name__ == '__main__':
                                        p_prop_lower, p_prop_upper,
                                        min_prob_p_e, max_prob_p_e,
                                        num_experiments, 
-                                       lambdas)
+                                       lambdas,
+                                       num_workers=os.cpu_count() or 1)
         assert type(best_lambdas) == dict
 
         # Convert the sparse representation to non-sparse
@@ -1,9 +1,12 @@
 # Run plan detection experiments
 
 import numpy as np
+import os
+import sys
 
 from reverse_cpt import *
 from estimate_state_in_sequence import *
+from experiment_runner import run_trials
 
 
 def perfect_stage_probability(changepoints, num_stages, tau_max):
@@ -54,8 +57,104 @@ def stages_error_using_most_likely(gt, m):
     return np.sum(err)
 
 
+def estimate_stages(s, event_times, event_types, tau_max):
+    """Probability of the stages over time with known and estimated p(e|s)."""
+
+    num_stages = len(s['p_s'])
+
+    # Calculate the probability of the number of stages over time using known p(s) and p(e|s)
+    m = prob_num_stages_over_time(event_times, event_types, s['p_s'], s['p_e_given_s'], tau_max)
+    assert m.shape == (num_stages, tau_max)
+
+    # Estimate p(e|s) from p(s|e) and p(s)
+    p_e_hat = estimate_p_e(s['p_s_given_e'], s['p_s'], 0)
+    p_s_hat = calc_p_s(s['p_s_given_e'], p_e_hat)
+    p_e_given_s_hat = calc_p_e_given_s(s['p_s_given_e'], p_e_hat, p_s_hat)
+
+    # Calculate the probability of the stage index over time using the estimate p(e|s)
+    m2 = prob_num_stages_over_time(event_times, event_types, p_s_hat, p_e_given_s_hat, tau_max)
+    assert m2.shape == (num_stages, tau_max)
+
+    return m, m2, p_s_hat, p_e_given_s_hat
+
+
+def stage_error_trial(params):
+    """Errors in the stages over time for a randomly generated dataset."""
+
+    num_stages = params['num_stages']
+    tau_max = params['tau_max']
+
+    s = generate_set(num_stages, params['num_events'],
+                     params['p_prop_lower'], params['p_prop_upper'],
+                     params['min_prob_p_e'], params['max_prob_p_e'])
+
+    # Generate the observed events (again if a stage doesn't have any events,
+    # which can happen if a changepoint is at time 0)
+    obs = None
+    while obs is None:
+        try:
+            obs = generate_obs(s['p_s'], s['p_e_given_s'], tau_max)
+        except AssertionError:
+            pass
+
+    _, event_times, event_types, gt_changepoints = obs
+    gt_stage_matrix = perfect_stage_probability(gt_changepoints, num_stages, tau_max)
+
+    m, m2, _, _ = estimate_stages(s, event_times, event_types, tau_max)
+
+    return {
+        'known_squared_error': stages_squared_error(gt_stage_matrix, m),
+        'known_most_likely_error': stages_error_using_most_likely(gt_stage_matrix, m),
+        'estimated_squared_error': stages_squared_error(gt_stage_matrix, m2),
+        'estimated_most_likely_error': stages_error_using_most_likely(gt_stage_matrix, m2)
+    }
+
+
+def run_sweep(results_path, num_trials, num_workers):
+    """Run trials over the number of stages, tau_max and the shape of the CPT."""
+
+    params_list = [
+        {
+            'num_stages': num_stages,
+            'num_events': num_events,
+            'tau_max': tau_max,
+            'p_prop_lower': 0.1,
+            'p_prop_upper': 0.9,
+            'min_prob_p_e': min_prob_p_e,
+            'max_prob_p_e': max_prob_p_e
+        }
+        for num_stages in [2, 3, 4]
+        for num_events in [3, 5]
+        for tau_max in [20, 50, 100]
+        for min_prob_p_e, max_prob_p_e in [(0.01, 0.3), (0.1, 0.5)]
+        if min_prob_p_e * num_events <= 1 <= max_prob_p_e * num_events
+    ]
+
+    records = run_trials(stage_error_trial, params_list, num_trials,
+                         results_path=results_path, num_workers=num_workers)
+
+    # Mean errors for each set of parameters
+    for idx, params in enumerate(params_list):
+        results = [r['result'] for r in records[idx * num_trials:(idx + 1) * num_trials]]
+        means = {k: float(np.mean([r[k] for r in results])) for k in results[0]}
+        print(params, means)
+
+
 if __name__ == '__main__':
 
+    if len(sys.argv) > 1:
+        if sys.argv[1] != 'sweep' or len(sys.argv) > 5:
+            print(f"Usage: python3 {sys.argv[0]} [sweep <results file> [num trials] [num workers]]")
+            exit(-1)
+
+        results_path = sys.argv[2] if len(sys.argv) > 2 else './sweep-results.jsonl'
+        num_trials = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+        num_workers = int(sys.argv[4]) if len(sys.argv) > 4 else (os.cpu_count() or 1)
+
+        # The sweep resumes if the results file exists
+        run_sweep(results_path, num_trials, num_workers)
+        exit(0)
+
     # Generate a test data set
     num_stages = 3
     num_events = 5
@@ -77,24 +176,15 @@ if __name__ == '__main__':
     # Ground stage as a function of time index
     gt_stage_matrix = perfect_stage_probability(gt_changepoints, num_stages, tau_max)
 
-    # Calculate the probability of the number of stages over time using known p(s) and p(e|s)
-    m = prob_num_stages_over_time(event_times, event_types, s['p_s'], s['p_e_given_s'], tau_max)
-    assert m.shape == (num_stages, tau_max)
+    # Calculate the probability of the number of stages over time using known
+    # and estimated p(e|s)
+    m, m2, p_s_hat, p_e_given_s_hat = estimate_stages(s, event_times, event_types, tau_max)
 
     # Calculate the error between the ground truth and the stages
     err1a = stages_squared_error(gt_stage_matrix, m)
     err1b = stages_error_using_most_likely(gt_stage_matrix, m)
     print(f"Squared error: {err1a}, Most likely error: {err1b}")
 
-    # Estimate p(e|s) from p(s|e) and p(s)
-    p_e_hat = estimate_p_e(s['p_s_given_e'], s['p_s'], 0)
-    p_s_hat = calc_p_s(s['p_s_given_e'], p_e_hat)
-    p_e_given_s_hat = calc_p_e_given_s(s['p_s_given_e'], p_e_hat, p_s_hat)
-
-    # Calculate the probability of the stage index over time using the estimate p(e|s)
-    m2 = prob_num_stages_over_time(event_times, event_types, p_s_hat, p_e_given_s_hat, tau_max)
-    assert m2.shape == (num_stages, tau_max)
-
     # Calculate the error between the ground truth and the stages using estimated p(e|s)
     err2a = stages_squared_error(gt_stage_matrix, m2)
     err2b = stages_error_using_most_likely(gt_stage_matrix, m2)
@@ -200,6 +200,142 @@ def test_trim_events():
         assert np.allclose(actual_types, t["exp_types"])
 
 
+def test_cumulative_log_probs():
+    """Unit tests for cumulative_log_probs()."""
+
+    cpt = np.array([
+        [0.2, 0.8],
+        [0.6, 0.4]
+    ])
+
+    sums = cumulative_log_probs([0, 2, 2], [1, 0, 1], cpt, 3)
+    assert sums.shape == (2, 5)
+
+    expected = np.array([
+        [0, np.log(0.8), np.log(0.8), np.log(0.8 * 0.2 * 0.8), np.log(0.8 * 0.2 * 0.8)],
+        [0, np.log(0.4), np.log(0.4), np.log(0.4 * 0.6 * 0.4), np.log(0.4 * 0.6 * 0.4)]
+    ])
+    assert np.allclose(sums, expected)
+
+
+def test_log_num_combinations():
+    """Unit tests for log_num_combinations()."""
+
+    actual = log_num_combinations(np.array([-1, 0, 1, 4, 5]), 2)
+    assert np.all(np.isneginf(actual[:3]))
+    assert np.allclose(np.exp(actual[3:]), [6, 10])
+
+    assert np.isclose(log_num_combinations(3, 0), 0.0)
+
+
+def test_prob_num_stages():
+    """Check prob_num_stages() against the enumeration in run_inference()."""
+
+    np.random.seed(0)
+
+    for _ in range(200):
+        num_stages = np.random.randint(1, 5)
+        num_event_types = np.random.randint(1, 4)
+        tau_max = np.random.randint(0, 10)
+
+        p_s = np.random.dirichlet(np.ones(num_stages))
+        cpt = np.random.dirichlet(np.ones(num_event_types), size=num_stages)
+
+        # Events at distinct times (possibly none)
+        num_events = np.random.randint(0, tau_max + 2)
+        event_times = np.sort(np.random.choice(tau_max + 1, num_events, replace=False))
+        event_types = np.random.randint(0, num_event_types, num_events)
+
+        expected = p_num_stages(
+            run_inference(event_times, event_types, p_s, cpt, tau_max), num_stages
+        )
+        actual = prob_num_stages(event_times, event_types, p_s, cpt, tau_max)
+        assert np.allclose(actual, expected), f"{actual} vs {expected}"
+
+
+def test_prob_num_stages_long_sequence():
+    """Check prob_num_stages() doesn't underflow for a long sequence of events."""
+
+    cpt = np.array([
+        [0.9, 0.1],
+        [0.1, 0.9]
+    ])
+    p_s = np.array([0.5, 0.5])
+
+    # All of the events are of the type most likely in stage 2
+    event_times = np.arange(0, 5000, 2)
+    event_types = np.ones(len(event_times), dtype=int)
+
+    actual = prob_num_stages(event_times, event_types, p_s, cpt, 5000)
+    assert np.allclose(np.sum(actual), 1.0)
+    assert actual[1] > 0.99
+
+
+def test_stage_tracker():
+    """Check StageTracker against prob_num_stages() as events are added."""
+
+    np.random.seed(1)
+
+    for _ in range(100):
+        num_stages = np.random.randint(1, 5)
+        num_event_types = np.random.randint(1, 4)
+        tau_max = np.random.randint(1, 15)
+
+        p_s = np.random.dirichlet(np.ones(num_stages))
+        cpt = np.random.dirichlet(np.ones(num_event_types), size=num_stages)
+
+        # Events in time order (possibly more than one at a time)
+        num_events = np.random.randint(0, 2 * tau_max)
+        event_times = np.sort(np.random.randint(0, tau_max, num_events))
+        event_types = np.random.randint(0, num_event_types, num_events)
+
+        tracker = StageTracker(p_s, cpt)
+        for i in range(num_events):
+            tracker.add_event(event_times[i], event_types[i])
+
+            expected = prob_num_stages(
+                event_times[: i + 1], event_types[: i + 1], p_s, cpt, event_times[i]
+            )
+            assert np.allclose(tracker.prob_num_stages(), expected)
+
+        # Move forward in time without events
+        expected = prob_num_stages(event_times, event_types, p_s, cpt, tau_max)
+        assert np.allclose(tracker.prob_num_stages(tau_max), expected)
+
+
+def test_stage_tracker_events_out_of_order():
+    """An event before the current time of the tracker is invalid."""
+
+    tracker = StageTracker(np.array([0.5, 0.5]), np.array([[0.2, 0.8], [0.6, 0.4]]))
+    tracker.add_event(3, 0)
+    tracker.add_event(3, 1)
+
+    with pytest.raises(AssertionError):
+        tracker.add_event(2, 0)
+
+
+def test_prob_num_stages_over_time():
+    """Check prob_num_stages_over_time() against inference at each time."""
+
+    p_s = np.array([0.2, 0.3, 0.5])
+    cpt = np.array([
+        [0.7, 0.2, 0.1],
+        [0.2, 0.6, 0.2],
+        [0.1, 0.1, 0.8]
+    ])
+    tau_max = 12
+
+    event_times = np.array([0, 1, 3, 4, 6, 9, 10])
+    event_types = np.array([0, 0, 1, 1, 1, 2, 2])
+    m = prob_num_stages_over_time(event_times, event_types, p_s, cpt, tau_max)
+    assert m.shape == (3, tau_max)
+
+    for t in range(tau_max):
+        times, types = trim_events(event_times, event_types, t)
+        expected = p_num_stages(run_inference(times, types, p_s, cpt, t), 3)
+        assert np.allclose(m[:, t], expected)
+
+
 def test_calc_cpt_event_given_stage():
     """Unit tests for calc_cpt_event_given_stage()."""
 
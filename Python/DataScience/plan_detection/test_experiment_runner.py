@@ -0,0 +1,82 @@
+import json
+import random
+import numpy as np
+
+from experiment_runner import *
+
+
+def random_trial(params):
+    """Trial that uses the global random number generators."""
+
+    return {
+        "x": random.random() * params["scale"],
+        "y": np.random.randint(0, 1000, 3),
+    }
+
+
+def test_run_trials():
+    """Unit tests for run_trials()."""
+
+    params_list = [{"scale": 1}, {"scale": 10}]
+    records = run_trials(random_trial, params_list, 5, seed=3)
+    assert len(records) == 10
+    assert [r["trial"] for r in records] == [0, 1, 2, 3, 4] * 2
+    assert [r["params"]["scale"] for r in records] == [1] * 5 + [10] * 5
+    assert len(set([r["result"]["x"] for r in records])) == 10
+
+    # The results only depend on the seed
+    assert run_trials(random_trial, params_list, 5, seed=3, chunk_size=2) == records
+    assert run_trials(random_trial, params_list, 5, seed=4) != records
+
+    parallel_records = run_trials(random_trial, params_list, 5, seed=3, num_workers=2)
+    assert parallel_records == records
+
+
+def test_run_trials_resume(tmp_path):
+    """Check that trials in the results file aren't run again."""
+
+    results_path = str(tmp_path / "results.jsonl")
+    params_list = [{"scale": 1}, {"scale": 2}]
+    expected = run_trials(random_trial, params_list, 6, seed=1)
+
+    assert run_trials(random_trial, params_list, 4, results_path, seed=1) == [
+        r for r in expected if r["trial"] < 4
+    ]
+    assert len(read_results(results_path)) == 8
+
+    # Interrupted part way through writing a record
+    with open(results_path, "a") as f:
+        f.write('{"params": {"scale": 1}, "tri')
+
+    calls = []
+
+    def counting_trial(params):
+        calls.append(params)
+        return random_trial(params)
+
+    records = run_trials(counting_trial, params_list, 6, results_path, seed=1)
+    assert records == expected
+    assert len(calls) == 4
+
+    with open(results_path) as f:
+        lines = f.readlines()
+
+    assert len(lines) == 12
+    assert all([json.loads(line)["params"] in params_list for line in lines])
+
+
+def test_run_trials_seed(tmp_path):
+    """Trials in the results file with a different seed aren't reused."""
+
+    results_path = str(tmp_path / "results.jsonl")
+    params_list = [{"scale": 1}]
+
+    seed_0 = run_trials(random_trial, params_list, 3, results_path, seed=0)
+    seed_1 = run_trials(random_trial, params_list, 3, results_path, seed=1)
+    assert seed_1 == run_trials(random_trial, params_list, 3, seed=1)
+    assert seed_1 != seed_0
+    assert all([r["seed"] == 1 for r in seed_1])
+
+    # Both sets of trials are in the file
+    assert len(read_results(results_path)) == 6
+    assert run_trials(random_trial, params_list, 3, results_path, seed=0) == seed_0
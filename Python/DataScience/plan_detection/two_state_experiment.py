@@ -1,8 +1,11 @@
 # Two-state experiment
 import math
 import numpy as np
+import os
 import random
 
+from experiment_runner import run_trials
+
 
 def sample_from_multinomial(p):
     """Generate a sample from a multinomial distribution."""
@@ -216,7 +219,50 @@ def max_likelihood(observations, cpt, p_n1):
         return 1 + max_likelihood_two_stages
 
 
-def monte_carlo_simulations(num_experiments):
+def monte_carlo_trial(params):
+    """Run a trial with a random p_n1 and CPT, returning the chosen models."""
+
+    num_obs = params["num_obs"]
+
+    # Generate a random value of p_n1
+    p_n1 = np.random.random()
+
+    # Generate a random CPT
+    p00 = np.random.random()
+    p11 = np.random.random()
+    cpt = [[p00, 1.0 - p00], [1.0 - p11, p11]]
+
+    # Generate the observations
+    actual_model, observations = generate_observations(p_n1, cpt, num_obs)
+
+    # Single model approach
+    most_likely_model_idx = single_model_approach(observations, cpt, p_n1)
+
+    # Find the most likely model using the maximum likelihood approach
+    most_likely_model_idx_ml = max_likelihood(observations, cpt, p_n1)
+
+    # Generate a sample using the priors
+    random_choice = sample_from_multinomial(
+        [p_n1, (1 / 3) * (1 - p_n1), (1 / 3) * (1 - p_n1), (1 / 3) * (1 - p_n1)]
+    )
+
+    return {
+        "actual_model": int(actual_model),
+        "single_model": int(most_likely_model_idx),
+        "max_likelihood": int(most_likely_model_idx_ml),
+        "random": int(random_choice),
+    }
+
+
+def monte_carlo_simulations(
+    num_experiments, num_obs=4, seed=0, num_workers=0, results_path=None
+):
+    """Run Monte Carlo trials (in parallel if num_workers > 0).
+
+    If results_path is given, the results of the trials are stored in the
+    file and an interrupted run resumes from the trials that have completed.
+    """
+
     assert type(num_experiments) == int and num_experiments > 0
 
     # Initialise the confusion matrices
@@ -224,31 +270,23 @@ def monte_carlo_simulations(num_experiments):
     confusion_matrix_ml = [[0, 0, 0, 0] for _ in range(4)]
     confusion_matrix_random = [[0, 0, 0, 0] for _ in range(4)]
 
-    for _ in range(num_experiments):
-        # Generate a random value of p_n1
-        p_n1 = np.random.random()
-
-        # Generate a random CPT
-        p00 = np.random.random()
-        p11 = np.random.random()
-        cpt = [[p00, 1.0 - p00], [1.0 - p11, p11]]
-
-        # Generate the observations
-        actual_model, observations = generate_observations(p_n1, cpt, num_obs)
-
-        # Single model approach
-        most_likely_model_idx = single_model_approach(observations, cpt, p_n1)
-        confusion_matrix[actual_model][most_likely_model_idx] += 1
+    records = run_trials(
+        monte_carlo_trial,
+        [{"num_obs": num_obs}],
+        num_experiments,
+        results_path=results_path,
+        seed=seed,
+        num_workers=num_workers,
+        chunk_size=1000,
+    )
 
-        # Find the most likely model using the maximum likelihood approach
-        most_likely_model_idx_ml = max_likelihood(observations, cpt, p_n1)
-        confusion_matrix_ml[actual_model][most_likely_model_idx_ml] += 1
+    for record in records:
+        result = record["result"]
+        actual_model = result["actual_model"]
 
-        # Generate a sample using the priors
-        random_choice = sample_from_multinomial(
-            [p_n1, (1 / 3) * (1 - p_n1), (1 / 3) * (1 - p_n1), (1 / 3) * (1 - p_n1)]
-        )
-        confusion_matrix_random[actual_model][random_choice] += 1
+        confusion_matrix[actual_model][result["single_model"]] += 1
+        confusion_matrix_ml[actual_model][result["max_likelihood"]] += 1
+        confusion_matrix_random[actual_model][result["random"]] += 1
 
     return {
         "confusion_matrix_single_model": confusion_matrix,
@@ -328,7 +366,9 @@ if __name__ == "__main__":
 
     # Perform Monte Carlo experiments
     print("#### Monte Carlo experiments:")
-    results = monte_carlo_simulations(10000)
+    results = monte_carlo_simulations(
+        10000, num_obs=num_obs, num_workers=os.cpu_count() or 1
+    )
     show_confusion_matrix(
         np.array(results["confusion_matrix_single_model"]), "changepoint"
     )
@@ -0,0 +1,151 @@
+import numpy as np
+
+from graph_defined_computation import *
+
+
+def test_array_dist():
+    """Unit tests for ArrayDist."""
+
+    x = {-1: 0.25, 2: 0.5, 3: 0.25}
+    a = ArrayDist.from_dict(x)
+    assert a.offset == -1
+    assert a.support() == (-1, 3)
+    assert a.to_dict() == x
+    assert a.is_valid()
+
+    assert ArrayDist(2, [0.0, 0.5, 0.0, 0.5, 0.0]).to_dict() == {3: 0.5, 5: 0.5}
+    assert a.truncate(0.3).to_dict() == {2: 1.0}
+
+
+def dists_close(x, y):
+    """Are the (sparse) distributions the same (to within rounding)?"""
+    return x.keys() == y.keys() and all([abs(x[k] - y[k]) < 1e-12 for k in x])
+
+
+def test_array_dist_sum_and_prod():
+    """Check the array sums and products against the dict versions."""
+
+    V = [[0, 1, 0], [1, 0, 1], [2, 0, 3, 1]]
+    c = [[1, 1], [1, 2], [3, -4]]
+    dists = [d(v, ci) for v, ci in zip(V, c)]
+    array_dists = [d_array(v, ci) for v, ci in zip(V, c)]
+
+    for x, y in zip(dists, array_dists):
+        assert dists_close(x, y.to_dict())
+
+    assert dists_close(
+        dist_sum_two_rvs(dists[0], dists[2]),
+        array_dist_sum_two_rvs(array_dists[0], dists[2]).to_dict(),
+    )
+    assert dists_close(
+        dist_sum_of_rvs(dists), array_dist_sum_of_rvs(array_dists).to_dict()
+    )
+    assert dists_close(
+        dist_prod_of_rvs(dists), array_dist_prod_of_rvs(array_dists).to_dict()
+    )
+
+    # The FFT gives the same result for large distributions
+    rng = np.random.default_rng(0)
+    large = [ArrayDist(i - 50, rng.random(300)) for i in range(4)]
+    large = [ArrayDist(a.offset, a.probs / np.sum(a.probs)) for a in large]
+    expected = large[0].probs
+    for a in large[1:]:
+        expected = np.convolve(expected, a.probs)
+
+    actual = array_dist_sum_of_rvs(large)
+    assert actual.offset == sum([a.offset for a in large])
+    assert np.allclose(actual.probs, expected, atol=1e-15)
+
+
+def test_compiled_graph():
+    """Check the compiled graph against calculating with the nodes."""
+
+    f_fns = build_f_fns(3)
+    d_calls = []
+
+    def counting_d(V, c):
+        d_calls.append(V)
+        return d(V, c)
+
+    config = {
+        "fd-nodes": [
+            {"name": f"fd_{k}", "extractor-fn": f_fns[k], "dist-fn": partial(counting_d, c=[1, k])}
+            for k in range(3)
+        ],
+        "m-nodes": [
+            {"name": "m_1", "fn": dist_prod_of_rvs, "parents": ["m_0", "fd_2"]},
+            {"name": "m_0", "fn": dist_sum_of_rvs, "parents": ["fd_0", "fd_1"]},
+        ],
+    }
+
+    graph = compile_graph(config, cache_size=2)
+    assert graph.levels == [[0, 1, 2], [4], [3]]
+    assert [graph.names[i] for i in graph.order] == ["fd_0", "fd_1", "fd_2", "m_0", "m_1"]
+
+    Gs = [
+        {0: [0, 1, 0], 1: [1, 0, 1], 2: [2, 1]},
+        {0: [0, 1, 0], 1: [1, 0, 1], 2: [1, 1]},
+        {0: [1, 1, 0], 1: [1, 0, 1], 2: [2, 1]},
+        {0: [0, 1, 0], 1: [1, 0, 1], 2: [2, 1]},
+    ]
+
+    # The distribution of each distinct feature vector is calculated once
+    results = graph.run_batch(Gs)
+    assert len(d_calls) == 5
+
+    # Cached results are reused on the next run
+    assert graph.run(Gs[1]) == results[1]
+    assert len(d_calls) == 5
+
+    # The cache is bounded, so a new input removes the least recently used
+    # result of fd_2 (for Gs[0]), which is then calculated again
+    assert [len(c) for c in graph.cache] == [2, 1, 2, 2, 2]
+    graph.run({0: [0, 1, 0], 1: [1, 0, 1], 2: [3, 1]})
+    assert len(d_calls) == 6
+    assert [len(c) for c in graph.cache] == [2, 1, 2, 2, 2]
+
+    assert graph.run(Gs[0]) == results[0]
+    assert len(d_calls) == 7
+
+    # Results are the same as calculating with the nodes
+    for G, result in zip(Gs, results):
+        nodes = build_graph(config)
+        for n in nodes:
+            if type(n) == FDNode:
+                n.set_input(G)
+
+        assert {n.name: n.calculate() for n in nodes} == result
+
+    graph.reset()
+    assert graph.run_batch(Gs, num_workers=2) == results
+
+    # The graph mustn't have a cycle
+    config["m-nodes"][1]["parents"] = ["fd_0", "m_1"]
+    try:
+        compile_graph(config)
+        assert False, "Expected an assertion error"
+    except AssertionError as e:
+        assert str(e).startswith("Graph has a cycle")
+
+
+def test_compiled_graph_cache_size():
+    """By default, results are only shared within a batch."""
+
+    f_fns = build_f_fns(1)
+    d_calls = []
+
+    def counting_d(V):
+        d_calls.append(V)
+        return d(V, [1, 0])
+
+    config = {
+        "fd-nodes": [{"name": "fd_0", "extractor-fn": f_fns[0], "dist-fn": counting_d}],
+        "m-nodes": [],
+    }
+
+    graph = compile_graph(config)
+    G = {0: [1, 2]}
+    assert graph.run_batch([G, G]) == graph.run_batch([G]) * 2
+    assert len(d_calls) == 2
+    assert [len(c) for c in graph.cache] == [0]
+